@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TrashDetection, TrashCategory, CleanupTask, RobotRequest, CooperationRequest
+from .models import TrashDetection, TrashCategory, CleanupTask, CleanupRoute, Hotspot, RobotRequest, CooperationRequest, DetectionCounter, Robot, RollupBucket
 
 @admin.register(TrashDetection)
 class TrashDetectionAdmin(admin.ModelAdmin):
@@ -23,8 +23,33 @@ class RobotRequestAdmin(admin.ModelAdmin):
     list_filter = ['status', 'request_time']
     readonly_fields = ['request_time']
 
+@admin.register(Robot)
+class RobotAdmin(admin.ModelAdmin):
+    list_display = ['robot_id', 'state', 'battery', 'speed_mps', 'updated_at']
+    list_filter = ['state']
+
+@admin.register(Hotspot)
+class HotspotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'detection_count', 'object_count', 'first_seen', 'last_seen']
+    list_filter = ['status', 'last_seen']
+
+@admin.register(CleanupRoute)
+class CleanupRouteAdmin(admin.ModelAdmin):
+    list_display = ['id', 'robot', 'status', 'stops', 'distance_m', 'eta_minutes', 'created_at']
+    list_filter = ['status', 'created_at']
+
 @admin.register(CooperationRequest)
 class CooperationRequestAdmin(admin.ModelAdmin):
     list_display = ['id', 'status', 'created_at']
     list_filter = ['status', 'created_at']
     readonly_fields = ['created_at']
+
+@admin.register(DetectionCounter)
+class DetectionCounterAdmin(admin.ModelAdmin):
+    list_display = ['period', 'trash_class', 'count']
+    list_filter = ['period']
+
+@admin.register(RollupBucket)
+class RollupBucketAdmin(admin.ModelAdmin):
+    list_display = ['metric', 'dimension', 'level', 'bucket_start', 'count', 'total']
+    list_filter = ['level', 'metric']
@@ -0,0 +1,205 @@
+"""
+Async versions of the detection endpoints for ASGI deployments.
+
+The request only holds a coroutine while it waits: multipart parsing,
+hashing, decoding and inference run on a bounded executor
+(ASYNC_INFERENCE_THREADS), and ORM writes go through sync_to_async on
+Django's shared database thread. Thousands of slow uploads can therefore
+be in flight in one process while only a handful of threads do work.
+Responses match the synchronous views in api.views.
+
+Served under /api/async/ and, with ASYNC_DETECTION_VIEWS, in place of the
+synchronous views at their usual URLs.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from rest_framework import serializers
+
+from .metrics import timed
+from .models import TrashDetection
+from .serializers import ImageUploadSerializer, TilingOptionsSerializer
+from .uploads import InvalidImage, persist_upload, upload_name
+from .views import detect_upload, remember_detection
+from .write_queue import WriteTimeout, get_writer, insert_detection, submit_detection
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_INFERENCE_THREADS, thread_name_prefix='async-inference'
+            )
+    return _executor
+
+
+def offload(func, *args, **kwargs):
+    """Await `func` on the inference executor; context variables (stage timings) carry over"""
+    return sync_to_async(func, thread_sensitive=False, executor=_get_executor())(*args, **kwargs)
+
+
+def _response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _timestamp(value):
+    # Same rendering as DRF gives the synchronous views ('Z' for UTC)
+    return serializers.DateTimeField().to_representation(value)
+
+
+def _parse(request):
+    """Form fields and files of a multipart request, merged like DRF's request.data"""
+    data = request.POST.copy()
+    data.update(request.FILES)
+    return data
+
+
+def _existing_detection(cached):
+    return TrashDetection.objects.filter(id=cached['detection_id']).first()
+
+
+async def _record(image_path, detections, location, with_task=False):
+    image_url = default_storage.url(image_path)
+    with timed('db'):
+        if settings.WRITE_QUEUE_ENABLED:
+            # Wait for the group commit without holding the database thread
+            future = submit_detection(image_url, detections, location, with_task)
+            timeout = get_writer().timeout
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                raise WriteTimeout(f'Write not committed within {timeout} s') from None
+        return await sync_to_async(insert_detection)(image_url, detections, location, with_task)
+
+
+async def _persist(image_path, image):
+    # persist_upload only queues the write with UPLOAD_PERSIST_ASYNC; otherwise it blocks
+    if settings.UPLOAD_PERSIST_ASYNC:
+        persist_upload(image_path, image)
+    else:
+        await offload(persist_upload, image_path, image)
+
+
+async def upload_and_detect(request):
+    """Async counterpart of TrashDetectionViewSet.upload_and_detect"""
+    if request.method != 'POST':
+        return _response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    with timed('parse'):
+        serializer = ImageUploadSerializer(data=await offload(_parse, request))
+        valid = await offload(serializer.is_valid)
+    if not valid:
+        return _response(serializer.errors, status=400)
+
+    image = serializer.validated_data['image']
+    location = serializer.validated_data.get('location', {})
+    image_path = upload_name(image)
+
+    try:
+        detections, cache_key, cached = await offload(
+            detect_upload, image, ImageUploadSerializer.tiling(serializer.validated_data)
+        )
+
+        # A re-upload of an already recorded image links to the existing detection
+        detection = None
+        if cached and cached['detection_id'] and settings.RESULT_CACHE_LINK_DUPLICATES:
+            detection = await sync_to_async(_existing_detection)(cached)
+        if detection is not None:
+            return _response({
+                'detection_id': detection.id,
+                'image_url': detection.image_url,
+                'detections': detections,
+                'detected_objects': detection.detected_objects,
+                'confidence_scores': detection.confidence_scores,
+                'location': detection.location,
+                'detected_at': _timestamp(detection.detected_at),
+                'duplicate': True
+            })
+
+        detection = await _record(image_path, detections, location, with_task=True)
+        remember_detection(cache_key, detections, detection)
+        await _persist(image_path, image)
+
+        return _response({
+            'detection_id': detection.id,
+            'image_url': detection.image_url,
+            'detections': detections,
+            'detected_objects': detection.detected_objects,
+            'confidence_scores': detection.confidence_scores,
+            'location': location,
+            'detected_at': _timestamp(detection.detected_at)
+        }, status=201)
+
+    except InvalidImage as e:
+        return _response({'error': str(e)}, status=400)
+    except Exception as e:
+        return _response({'error': f'Error processing image: {str(e)}'}, status=500)
+
+
+async def detect_trash(request):
+    """Async counterpart of api.views.detect_trash"""
+    if request.method != 'POST':
+        return _response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    with timed('parse'):
+        data = await offload(_parse, request)
+    if 'image' not in data:
+        return _response({'error': 'No image provided'}, status=400)
+
+    image = data['image']
+    options = TilingOptionsSerializer(data=data)
+    if not options.is_valid():
+        return _response(options.errors, status=400)
+
+    image_path = upload_name(image, prefix='detect_')
+
+    try:
+        detections, cache_key, cached = await offload(
+            detect_upload, image, TilingOptionsSerializer.tiling(options.validated_data)
+        )
+
+        if not detections:
+            await _persist(image_path, image)
+            return _response({'trash_detected': False, 'message': '未检测到垃圾'})
+
+        best = max(detections, key=lambda det: det['confidence'])
+        trash_type = best['class']
+        confidence = round(best['confidence'] * 100)
+
+        # A re-upload of an already recorded image links to the existing detection
+        detection = None
+        if cached and cached['detection_id'] and settings.RESULT_CACHE_LINK_DUPLICATES:
+            detection = await sync_to_async(_existing_detection)(cached)
+        if detection is None:
+            detection = await _record(image_path, detections, data.get('location', {}))
+            remember_detection(cache_key, detections, detection)
+            await _persist(image_path, image)
+
+        return _response({
+            'trash_detected': True,
+            'trash_type': trash_type,
+            'confidence': confidence,
+            'detection_id': detection.id,
+            'detections': detections,
+            'message': f'检测到{trash_type}，置信度{confidence}%'
+        })
+
+    except InvalidImage:
+        return _response({'error': '无法解析上传的图像'}, status=400)
+    except Exception as e:
+        return _response({'error': f'检测失败: {str(e)}'}, status=500)
+
+
+# DRF views are csrf-exempt; these plain Django views must opt out explicitly.
+# csrf_exempt() would wrap them in a sync function, so set the flag directly.
+upload_and_detect.csrf_exempt = True
+detect_trash.csrf_exempt = True
@@ -0,0 +1,192 @@
+"""
+Dynamic micro-batching in front of the trash detector.
+
+Requests that arrive within a short window are gathered into one call
+to the model's detect_batch, which letterboxes them into its reused input
+blob and runs a single forward pass; each caller gets its own result
+through a Future.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import cv2
+
+from . import metrics
+from .cv_model import ModelLoadError
+from .metrics import Histogram, LATENCY_BUCKETS_MS
+
+
+class InferenceTimeout(RuntimeError):
+    """A queued image was not processed within the scheduler's timeout"""
+
+
+class _Pending:
+    __slots__ = ('image', 'future', 'enqueued_at', 'stages')
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        # The caller's per-request stage timings, filled in by the scheduler thread
+        self.stages = metrics.current_stages()
+
+
+class InferenceScheduler:
+    """
+    Collects images from many request threads and runs them through the
+    model in batches of up to `max_batch_size`, waiting at most
+    `max_wait_ms` after the first image of a batch arrives.
+
+    Exposes the same detect_trash/detect_image interface as
+    TrashDetectionModel so views can use either.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5.0, timeout=30.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.batch_sizes = Histogram(range(1, max_batch_size + 1))
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def model_version(self):
+        return self.model.model_version
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='inference-scheduler', daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Finish the batches already queued and stop the worker thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, image):
+        """Queue a decoded BGR image; returns a Future resolving to its detections"""
+        self.start()
+        pending = _Pending(image)
+        self._queue.put(pending)
+        return pending.future
+
+    def _result(self, future, deadline):
+        """
+        Wait for a submitted image until `deadline`. On timeout the image is
+        dropped if it has not reached the model yet and InferenceTimeout is
+        raised, which callers handle like any other detection failure.
+        """
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            raise InferenceTimeout(f'Detection timed out after {self.timeout} s') from None
+
+    def detect_image(self, image):
+        return self._result(self.submit(image), time.monotonic() + self.timeout)
+
+    def detect_batch(self, images):
+        """Queue several images at once so they share forward passes with concurrent callers"""
+        deadline = time.monotonic() + self.timeout
+        futures = [self.submit(image) for image in images]
+        try:
+            return [self._result(future, deadline) for future in futures]
+        except InferenceTimeout:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def detect_tiled(self, image, **options):
+        # A tiled request is already a batch of its own
+        return self.model.detect_tiled(image, **options)
+
+    def warm_up(self):
+        self.model.warm_up()
+        self.start()
+
+    def detect_trash(self, image_path):
+        """Same contract as TrashDetectionModel.detect_trash"""
+        try:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Could not read image {image_path}")
+            return self.detect_image(image)
+
+        except ModelLoadError:
+            # A configured model that cannot load fails the request instead of finding nothing
+            raise
+        except Exception as e:
+            print(f"Error in trash detection: {e}")
+            return []
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queue_depth': self._queue.qsize(),
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back so the run loop sees it after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._run_batch(self._collect(first))
+
+    def _run_batch(self, batch):
+        # Skip images whose caller already timed out and cancelled them
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.monotonic()
+        self.batch_sizes.observe(len(batch))
+        for pending in batch:
+            queue_wait = (started - pending.enqueued_at) * 1000.0
+            self.queue_wait_ms.observe(queue_wait)
+            if pending.stages is not None:
+                pending.stages['queue_wait'] = queue_wait
+
+        try:
+            with metrics.collect() as stages:
+                results = self.model.detect_batch([pending.image for pending in batch])
+        except Exception as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        # Every request in the batch shared the same preprocess/forward/postprocess
+        for pending in batch:
+            if pending.stages is not None:
+                pending.stages.update(stages)
+
+        for pending, detections in zip(batch, results):
+            pending.future.set_result(detections)
+
@@ -1,12 +1,32 @@
-import cv2
-import numpy as np
+# cv2 and numpy are imported inside the methods that need them so that
+# manage.py commands, the admin and autoreloader restarts never pay for them.
 # import tensorflow as tf  # Commented out for now
 from django.conf import settings
+import functools
+import hashlib
 import os
+import threading
+
+from .metrics import timed
+
+# Grey used by YOLOv8 for letterbox padding
+LETTERBOX_FILL = 114
+
+class ModelLoadError(RuntimeError):
+    """TRASH_MODEL_PATH is set but the model could not be loaded from it"""
 
 class TrashDetectionModel:
-    def __init__(self):
+    def __init__(self, model_path=None):
         self.model = None
+        self.loaded = False
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()  # cv2.dnn.Net is not safe to share between threads
+        self._buffers = threading.local()  # per-thread preprocessing buffers
+        self.model_path = model_path if model_path is not None else settings.TRASH_MODEL_PATH
+        self.input_size = settings.TRASH_MODEL_INPUT_SIZE
+        self.conf_threshold = settings.TRASH_MODEL_CONF_THRESHOLD
+        self.nms_threshold = settings.TRASH_MODEL_NMS_THRESHOLD
+        self.max_detections = settings.TRASH_MODEL_MAX_DETECTIONS
         self.class_names = [
             'bottle', 'can', 'paper', 'plastic_bag', 'cigarette', 
             'food_waste', 'glass', 'metal', 'cardboard', 'other_trash'
@@ -23,77 +43,436 @@ class TrashDetectionModel:
             'cardboard': '#00D2D3',
             'other_trash': '#FF3838'
         }
-        self.load_model()
+    
+    @property
+    def model_version(self):
+        return model_version(self.model_path)
+    
+    def ensure_loaded(self):
+        """
+        Load the model on first use. A failed load raises ModelLoadError and
+        is retried on the next call.
+        """
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load_model()
+                    self.loaded = True
     
     def load_model(self):
         """
         Load the trash detection model
-        For now, we'll use a mock model. In production, you would load your trained model here.
+        Reads the YOLOv8 ONNX export at TRASH_MODEL_PATH with cv2.dnn. Only
+        when no model is configured do the detect methods fall back to mock
+        detections; a configured model that is missing or unreadable raises
+        ModelLoadError rather than recording made-up detections.
         """
+        if not self.model_path:
+            print("No TRASH_MODEL_PATH configured, using mock trash detections")
+            return
+        
+        import cv2
+        if not os.path.isfile(self.model_path):
+            raise ModelLoadError(f"Trash detection model not found at {self.model_path}")
         try:
-            # Mock model for demonstration
-            # Replace this with your actual model loading code
-            # self.model = tf.keras.models.load_model('path/to/your/model.h5')
-            print("Mock trash detection model loaded")
-        except Exception as e:
-            print(f"Error loading model: {e}")
+            self.model = cv2.dnn.readNetFromONNX(os.fspath(self.model_path))
+        except cv2.error as e:
+            self.model = None
+            raise ModelLoadError(f"Error loading trash detection model from {self.model_path}: {e}") from e
+        print(f"Trash detection model loaded from {self.model_path}")
     
-    def preprocess_image(self, image_path):
-        """Preprocess image for model input"""
-        try:
-            image = cv2.imread(image_path)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            image = cv2.resize(image, (416, 416))  # Adjust size based on your model
-            image = image.astype(np.float32) / 255.0
-            image = np.expand_dims(image, axis=0)
-            return image
-        except Exception as e:
-            print(f"Error preprocessing image: {e}")
-            return None
+    def warm_up(self):
+        """Load the model and run one dummy forward pass so the first request is not slow"""
+        import numpy as np
+        
+        self.ensure_loaded()
+        if self.model is not None:
+            self.detect_image(np.zeros((self.input_size, self.input_size, 3), dtype=np.uint8))
+    
+    def letterbox_params(self, image_shape):
+        """Scale and padding that fit an image of `image_shape` into the square model input"""
+        image_height, image_width = image_shape[:2]
+        scale = min(self.input_size / image_height, self.input_size / image_width)
+        # A very thin image would otherwise round to zero pixels on its short side
+        resized_width = min(self.input_size, max(1, int(round(image_width * scale))))
+        resized_height = min(self.input_size, max(1, int(round(image_height * scale))))
+        pad_x = (self.input_size - resized_width) // 2
+        pad_y = (self.input_size - resized_height) // 2
+        return scale, pad_x, pad_y, resized_width, resized_height
+    
+    def input_buffers(self, batch_size):
+        """
+        Per-thread letterbox canvas and NCHW input blob, reused across requests.
+        The blob only grows, so steady-state preprocessing allocates nothing.
+        """
+        import numpy as np
+        
+        buffers = self._buffers
+        blob = getattr(buffers, 'blob', None)
+        if blob is None or len(blob) < batch_size or blob.shape[-1] != self.input_size:
+            size = self.input_size
+            buffers.canvas = np.empty((size, size, 3), dtype=np.uint8)
+            buffers.blob = blob = np.empty((batch_size, 3, size, size), dtype=np.float32)
+        return buffers.canvas, blob[:batch_size]
+    
+    def letterbox_into(self, image, canvas, planes):
+        """
+        Letterbox a BGR image into `canvas` and write it to the (3, S, S)
+        float32 `planes` as normalised RGB. The colour swap, 1/255 scaling
+        and HWC -> CHW transpose happen in one pass per channel.
+        Returns (scale, pad_x, pad_y) for mapping boxes back.
+        """
+        import cv2
+        import numpy as np
+        
+        scale, pad_x, pad_y, resized_width, resized_height = self.letterbox_params(image.shape)
+        canvas[:pad_y] = LETTERBOX_FILL
+        canvas[pad_y + resized_height:] = LETTERBOX_FILL
+        canvas[:, :pad_x] = LETTERBOX_FILL
+        canvas[:, pad_x + resized_width:] = LETTERBOX_FILL
+        cv2.resize(
+            image, (resized_width, resized_height),
+            dst=canvas[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width],
+            interpolation=cv2.INTER_LINEAR
+        )
+        
+        for channel in range(3):
+            np.multiply(
+                canvas[:, :, 2 - channel], np.float32(1 / 255.0),
+                out=planes[channel], dtype=np.float32, casting='unsafe'
+            )
+        return scale, pad_x, pad_y
+    
+    def preprocess_batch(self, images):
+        """
+        Letterbox BGR images into this thread's reusable input blob.
+        Returns the (N, 3, S, S) blob view and one (scale, pad_x, pad_y) per image.
+        """
+        canvas, blob = self.input_buffers(len(images))
+        letterboxes = [
+            self.letterbox_into(image, canvas, planes)
+            for image, planes in zip(images, blob)
+        ]
+        return blob, letterboxes
+    
+    def preprocess_image(self, image):
+        """Letterbox one BGR image for model input; returns (blob, (scale, pad_x, pad_y))"""
+        blob, letterboxes = self.preprocess_batch([image])
+        return blob, letterboxes[0]
     
     def detect_trash(self, image_path):
         """
         Detect trash in the given image
         Returns: list of detected objects with bounding boxes and confidence scores
         """
+        import cv2
+        
         try:
-            # Mock detection results for demonstration
-            # Replace this with actual model inference
-            mock_detections = [
-                {
-                    'class': 'bottle',
-                    'confidence': 0.85,
-                    'bbox': [100, 150, 200, 250],  # [x1, y1, x2, y2]
-                    'color': self.colors['bottle']
-                },
-                {
-                    'class': 'plastic_bag',
-                    'confidence': 0.72,
-                    'bbox': [300, 100, 400, 180],
-                    'color': self.colors['plastic_bag']
-                }
-            ]
-            
-            # Actual model inference would look like:
-            # preprocessed_image = self.preprocess_image(image_path)
-            # if preprocessed_image is not None:
-            #     predictions = self.model.predict(preprocessed_image)
-            #     detections = self.postprocess_predictions(predictions)
-            #     return detections
+            self.ensure_loaded()
+            if self.model is None:
+                return self.mock_detections()
             
-            return mock_detections
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Could not read image {image_path}")
+            return self.detect_image(image)
             
+        except ModelLoadError:
+            # A configured model that cannot load fails the request instead of finding nothing
+            raise
         except Exception as e:
             print(f"Error in trash detection: {e}")
             return []
     
-    def postprocess_predictions(self, predictions):
-        """Process model predictions into readable format"""
-        # This would contain your actual postprocessing logic
-        # based on your model's output format
+    def detect_image(self, image):
+        """Run the model on a decoded BGR image"""
+        return self.detect_batch([image])[0]
+    
+    def detect_batch(self, images):
+        """Run one forward pass over several decoded BGR images, one result list per image"""
+        self.ensure_loaded()
+        if self.model is None:
+            return [self.mock_detections() for _ in images]
+        
+        with timed('preprocess'):
+            blob, letterboxes = self.preprocess_batch(images)
+        with self._lock, timed('forward'):
+            self.model.setInput(blob)
+            predictions = self.model.forward()
+        with timed('postprocess'):
+            return [
+                self.postprocess_predictions(prediction, image.shape[:2], letterbox)
+                for prediction, image, letterbox in zip(predictions, images, letterboxes)
+            ]
+    
+    def mock_detections(self):
+        """Fixed detections used when no model file is configured"""
+        return [
+            {
+                'class': 'bottle',
+                'confidence': 0.85,
+                'bbox': [100, 150, 200, 250],  # [x1, y1, x2, y2]
+                'color': self.colors['bottle']
+            },
+            {
+                'class': 'plastic_bag',
+                'confidence': 0.72,
+                'bbox': [300, 100, 400, 180],
+                'color': self.colors['plastic_bag']
+            }
+        ]
+    
+    def decode_predictions(self, predictions, letterbox):
+        """
+        Threshold one YOLOv8 output of shape [4 + num_classes, num_anchors]
+        (boxes as (cx, cy, w, h) in input pixels) with whole-array operations.
+        `letterbox` is the (scale, pad_x, pad_y) used to preprocess the image.
+        Returns (boxes, confidences, class_ids) with boxes as (left, top, w, h)
+        in original image pixels, before NMS.
+        """
+        import numpy as np
+        
+        predictions = predictions.T
+        scores = predictions[:, 4:]
+        
+        # Threshold on the best class score before paying for argmax
+        confidences = scores.max(axis=1)
+        keep = confidences > self.conf_threshold
+        confidences = confidences[keep]
+        class_ids = scores[keep].argmax(axis=1)
+        
+        # (cx, cy, w, h) in letterboxed input pixels -> (left, top, w, h) in original pixels
+        scale, pad_x, pad_y = letterbox
+        boxes = predictions[keep, :4] - np.array([pad_x, pad_y, 0, 0], dtype=np.float32)
+        boxes /= scale
+        boxes[:, :2] -= boxes[:, 2:] / 2
+        return boxes, confidences, class_ids
+    
+    def format_detections(self, boxes, confidences, class_ids, image_shape):
+        """Turn the boxes kept by NMS, as (left, top, w, h), into detection dicts"""
+        import numpy as np
+        
+        image_height, image_width = image_shape[:2]
+        boxes = boxes.copy()
+        boxes[:, 2:] += boxes[:, :2]
+        np.clip(boxes, 0, [image_width, image_height, image_width, image_height], out=boxes)
+        
         detections = []
-        # Process predictions...
+        for bbox, confidence, class_id in zip(
+            boxes.round().astype(int).tolist(),
+            confidences.tolist(),
+            class_ids.tolist()
+        ):
+            class_name = self.class_names[class_id] if class_id < len(self.class_names) else 'other_trash'
+            detections.append({
+                'class': class_name,
+                'confidence': round(confidence, 4),
+                'bbox': bbox,  # [x1, y1, x2, y2]
+                'color': self.colors[class_name]
+            })
         return detections
+    
+    def postprocess_predictions(self, predictions, image_shape, letterbox):
+        """
+        Process model predictions into readable format
+        Decodes one YOLOv8 output, applies class-aware NMS and formats the
+        survivors; only the few boxes left after NMS are turned into dicts.
+        """
+        import cv2
+        import numpy as np
+        
+        boxes, confidences, class_ids = self.decode_predictions(predictions, letterbox)
+        if not len(boxes):
+            return []
+        
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes, confidences, class_ids, self.conf_threshold, self.nms_threshold
+        )
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:self.max_detections]
+        return self.format_detections(
+            boxes[indices], confidences[indices], class_ids[indices], image_shape
+        )
+    
+    def tile_grid(self, image_shape, tile_size, overlap, max_tiles):
+        """
+        Top-left corners of overlapping square tiles covering the image.
+        The tile size grows until the grid fits in `max_tiles`.
+        Returns (tile_size, [(x, y), ...]).
+        """
+        image_height, image_width = image_shape[:2]
+        while True:
+            stride = max(1, int(tile_size * (1 - overlap)))
+            xs = _tile_starts(image_width, tile_size, stride)
+            ys = _tile_starts(image_height, tile_size, stride)
+            if len(xs) * len(ys) <= max_tiles:
+                return tile_size, [(x, y) for y in ys for x in xs]
+            tile_size = int(tile_size * 1.25) + 1
+    
+    def detect_tiled(self, image, tile_size=None, overlap=None, max_tiles=None):
+        """
+        Detect small objects in a high-resolution BGR image by cutting it into
+        overlapping tiles plus one downscaled full view, running all of them
+        through one forward pass and merging duplicates across tile seams.
+        Options default to TRASH_TILE_SIZE, TRASH_TILE_OVERLAP and TRASH_TILE_MAX.
+        """
+        import numpy as np
+        
+        self.ensure_loaded()
+        if self.model is None:
+            return self.mock_detections()
+        
+        tile_size = tile_size or settings.TRASH_TILE_SIZE or self.input_size
+        overlap = settings.TRASH_TILE_OVERLAP if overlap is None else overlap
+        max_tiles = max_tiles or settings.TRASH_TILE_MAX
+        tile_size, origins = self.tile_grid(image.shape, tile_size, overlap, max_tiles)
+        
+        # The full view catches objects larger than a tile
+        views = [image] + [image[y:y + tile_size, x:x + tile_size] for x, y in origins]
+        offsets = np.array([(0, 0)] + origins, dtype=np.float32)
+        
+        with timed('preprocess'):
+            blob, letterboxes = self.preprocess_batch(views)
+        with self._lock, timed('forward'):
+            self.model.setInput(blob)
+            predictions = self.model.forward()
+        
+        with timed('postprocess'):
+            return self._merge_tiles(predictions, letterboxes, offsets, image.shape)
+    
+    def _merge_tiles(self, predictions, letterboxes, offsets, image_shape):
+        import numpy as np
+        
+        decoded = [
+            self.decode_predictions(prediction, letterbox)
+            for prediction, letterbox in zip(predictions, letterboxes)
+        ]
+        boxes = np.concatenate([part[0] for part in decoded])
+        if not len(boxes):
+            return []
+        confidences = np.concatenate([part[1] for part in decoded])
+        class_ids = np.concatenate([part[2] for part in decoded])
+        
+        # Shift tile-local boxes to global image coordinates
+        counts = [len(part[0]) for part in decoded]
+        boxes[:, :2] += np.repeat(offsets, counts, axis=0)
+        
+        keep = merge_boxes(
+            boxes, confidences, class_ids,
+            self.nms_threshold, settings.TRASH_TILE_CONTAINMENT_THRESHOLD
+        )[:self.max_detections]
+        return self.format_detections(boxes[keep], confidences[keep], class_ids[keep], image_shape)
+
+def _tile_starts(length, tile_size, stride):
+    import numpy as np
+    
+    if length <= tile_size:
+        return [0]
+    count = -(-(length - tile_size) // stride) + 1
+    return np.linspace(0, length - tile_size, count).round().astype(int).tolist()
+
+def merge_boxes(boxes, scores, class_ids, iou_threshold, containment_threshold):
+    """
+    Greedy class-aware NMS for boxes given as (left, top, w, h). Besides the
+    usual IoU test, a box is suppressed when more than `containment_threshold`
+    of the smaller box lies inside a stronger one, which removes the partial
+    fragments an object leaves in neighbouring tiles. Each step compares the
+    current best box against all remaining boxes in one array operation.
+    Returns the kept indices, best first.
+    """
+    import numpy as np
+    
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = np.maximum(boxes[:, 2], 0) * np.maximum(boxes[:, 3], 0)
+    order = np.argsort(-scores, kind='stable')
+    
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest])
+        height = np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest])
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        containment = intersection / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+        suppressed = (class_ids[rest] == class_ids[best]) & (
+            (iou > iou_threshold) | (containment > containment_threshold)
+        )
+        order = rest[~suppressed]
+    return np.array(keep, dtype=np.int64)
+
+@functools.lru_cache(maxsize=8)
+def _file_digest(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def model_version(model_path):
+    """Short identifier of the model file contents; 'mock' when no model is configured"""
+    if not model_path:
+        return 'mock'
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return 'missing'
+    return _file_digest(os.fspath(model_path), stat.st_mtime_ns, stat.st_size)
+
+def build_detector(model):
+    """
+    Pick the detection front end configured in settings: a process pool
+    (TRASH_INFERENCE_WORKERS > 0), a micro-batching scheduler
+    (TRASH_BATCHING_ENABLED) or the in-process model itself.
+    """
+    if settings.TRASH_INFERENCE_WORKERS > 0:
+        from .workers import ProcessPoolDetector
+        return ProcessPoolDetector(
+            model.model_path,
+            settings.TRASH_INFERENCE_WORKERS,
+            slot_bytes=settings.TRASH_WORKER_SLOT_MB * 1024 * 1024,
+            timeout=settings.TRASH_WORKER_TIMEOUT,
+            max_requests_per_worker=settings.TRASH_WORKER_MAX_REQUESTS,
+            cv_threads=settings.TRASH_WORKER_CV_THREADS,
+        )
+    if settings.TRASH_BATCHING_ENABLED:
+        from .batching import InferenceScheduler
+        return InferenceScheduler(
+            model,
+            max_batch_size=settings.TRASH_BATCH_MAX_SIZE,
+            max_wait_ms=settings.TRASH_BATCH_MAX_WAIT_MS,
+            timeout=settings.TRASH_BATCH_TIMEOUT,
+        )
+    return model
+
+def decode_image(data):
+    """Decode encoded image bytes (or any buffer) into a BGR array; None if undecodable"""
+    import cv2
+    import numpy as np
+    
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    """Return the process-wide detection front end, building it on first use"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = build_detector(TrashDetectionModel())
+    return _detector
+
+def reset_detector():
+    """Drop the process-wide detector so the next get_detector() rebuilds it from settings"""
+    global _detector
+    with _detector_lock:
+        detector, _detector = _detector, None
+    for method in ('stop', 'shutdown'):
+        if hasattr(detector, method):
+            getattr(detector, method)()
 
-# Global model instance
-trash_detector = TrashDetectionModel()
+def warm_up():
+    """Build the detector and run a dummy forward pass (TRASH_MODEL_WARMUP hook)"""
+    get_detector().warm_up()
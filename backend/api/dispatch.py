@@ -0,0 +1,289 @@
+"""
+Nearest-available dispatch of robot requests to the fleet.
+
+Idle robots with enough battery are kept in an in-memory grid
+(DISPATCH_CELL_DEGREES on a side). A request searches outward from its
+cell ring by ring, and stops as soon as the next ring is provably farther
+(in travel time, at the fleet's top speed) than the best robot found, so
+a lookup touches a few cells regardless of fleet size; adding and
+removing a robot is O(1). The candidate is then claimed with a
+conditional UPDATE on its database row, so two processes (or a stale
+index) can never hand the same robot two requests: a failed claim simply
+moves on to the next candidate.
+
+The database is the source of truth. The index is rebuilt from it every
+DISPATCH_INDEX_TTL seconds and kept up to date by the Robot signal
+handlers in between. When a robot finishes a request it becomes idle at
+the request's location (or the last stop of its cleanup route, see
+api.routing) and immediately takes the oldest queued request within reach.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .events import publish_robot_request
+from .geo import METERS_PER_DEGREE, coordinates, filter_radius, haversine_meters
+from .models import Robot, RobotRequest
+
+
+class AlreadyDispatched(Exception):
+    """The robot request was no longer pending when a robot was claimed for it"""
+
+
+class FleetIndex:
+    """Available robots bucketed by grid cell, for nearest-by-travel-time lookups"""
+
+    def __init__(self, cell_degrees):
+        self.size = cell_degrees
+        self._cells = defaultdict(dict)  # (row, column) -> {robot_id: (lat, lng, speed)}
+        self._where = {}  # robot_id -> (row, column)
+        self._speeds = defaultdict(int)  # speed -> robots, for the top speed bound
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, robot_id):
+        return robot_id in self._where
+
+    def _cell(self, lat, lng):
+        return math.floor((lat + 90.0) / self.size), math.floor((lng + 180.0) / self.size)
+
+    def add(self, robot_id, lat, lng, speed):
+        self.remove(robot_id)
+        cell = self._cell(lat, lng)
+        self._cells[cell][robot_id] = (lat, lng, speed)
+        self._where[robot_id] = cell
+        self._speeds[speed] += 1
+
+    def remove(self, robot_id):
+        cell = self._where.pop(robot_id, None)
+        if cell is None:
+            return False
+        lat, lng, speed = self._cells[cell].pop(robot_id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        self._speeds[speed] -= 1
+        if not self._speeds[speed]:
+            del self._speeds[speed]
+        return True
+
+    def _ring(self, row, column, radius):
+        if radius == 0:
+            yield row, column
+            return
+        for c in range(column - radius, column + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, column - radius
+            yield r, column + radius
+
+    def _ring_distance(self, lat, radius):
+        """Lower bound on the distance from a point to any cell of ring `radius` around it"""
+        if radius <= 1:
+            return 0.0
+        # Cells are narrowest (east-west) at the ring's most poleward latitude
+        edge = min(abs(lat) + radius * self.size, 89.9)
+        return (radius - 1) * self.size * METERS_PER_DEGREE * math.cos(math.radians(edge))
+
+    def nearest(self, lat, lng, max_distance):
+        """
+        Yield (eta_seconds, distance_m, robot_id) of the robots within
+        `max_distance` meters, fastest to arrive first.
+        """
+        if not self._where:
+            return
+        top_speed = max(self._speeds)
+        route_factor = settings.DISPATCH_ROUTE_FACTOR
+        row, column = self._cell(lat, lng)
+        # Cells are narrowest east-west at high latitudes; past this ring everything is out of reach
+        cell_width = self.size * METERS_PER_DEGREE * math.cos(math.radians(min(abs(lat) + 1.0, 89.9)))
+        max_rings = math.ceil(max_distance / cell_width) + 1
+
+        found = []
+        for radius in range(max_rings + 1):
+            for cell in self._ring(row, column, radius):
+                for robot_id, (robot_lat, robot_lng, speed) in self._cells.get(cell, {}).items():
+                    distance = haversine_meters(lat, lng, robot_lat, robot_lng)
+                    if distance <= max_distance:
+                        distance *= route_factor
+                        heapq.heappush(found, (distance / speed, distance, robot_id))
+            bound = self._ring_distance(lat, radius + 1) * route_factor / top_speed
+            while found and found[0][0] <= bound:
+                yield heapq.heappop(found)
+        while found:
+            yield heapq.heappop(found)
+
+    def claim_nearest(self, lat, lng, max_distance):
+        """Remove and return (eta_seconds, distance_m, robot_id) of the best robot, or None"""
+        for candidate in self.nearest(lat, lng, max_distance):
+            self.remove(candidate[2])
+            return candidate
+        return None
+
+
+def eta_minutes(eta_seconds):
+    return max(1, math.ceil(eta_seconds / 60))
+
+
+def is_available(robot):
+    return (
+        robot.state == 'idle'
+        and robot.battery >= settings.DISPATCH_MIN_BATTERY
+        and robot.latitude is not None
+    )
+
+
+class Dispatcher:
+    def __init__(self):
+        self._index = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _get_index(self):
+        """The fleet index, rebuilt from the database when older than DISPATCH_INDEX_TTL"""
+        if self._index is None or time.monotonic() - self._loaded_at > settings.DISPATCH_INDEX_TTL:
+            index = FleetIndex(settings.DISPATCH_CELL_DEGREES)
+            robots = Robot.objects.filter(
+                state='idle', battery__gte=settings.DISPATCH_MIN_BATTERY, latitude__isnull=False
+            ).values_list('robot_id', 'latitude', 'longitude', 'speed_mps')
+            for robot_id, lat, lng, speed in robots.iterator(chunk_size=5000):
+                index.add(robot_id, lat, lng, speed)
+            self._index, self._loaded_at = index, time.monotonic()
+        return self._index
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+
+    def sync(self, robot):
+        """Reflect a saved robot in the index"""
+        with self._lock:
+            if self._index is None:
+                return
+            if is_available(robot):
+                self._index.add(robot.robot_id, robot.latitude, robot.longitude, robot.speed_mps)
+            else:
+                self._index.remove(robot.robot_id)
+
+    def forget(self, robot_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(robot_id)
+
+    @property
+    def available(self):
+        with self._lock:
+            return len(self._get_index())
+
+    def _assign(self, robot_request, robot_id, eta_seconds):
+        """
+        Claim `robot_id` for the request. Returns False if another
+        dispatcher got the robot first; raises AlreadyDispatched if the
+        request was served in the meantime.
+        """
+        with transaction.atomic():
+            claimed = Robot.objects.filter(robot_id=robot_id, state='idle').update(
+                state='dispatched', current_request=robot_request
+            )
+            if not claimed:
+                return False
+            minutes = eta_minutes(eta_seconds)
+            # update() rather than save(): only a still-pending request may be taken
+            if not RobotRequest.objects.filter(pk=robot_request.pk, status='pending').update(
+                robot_id=robot_id, eta_minutes=minutes, status='dispatched'
+            ):
+                raise AlreadyDispatched(robot_request.pk)
+            robot_request.robot_id = robot_id
+            robot_request.eta_minutes = minutes
+            robot_request.status = 'dispatched'
+            publish_robot_request(robot_request, 'pending')
+        return True
+
+    def dispatch(self, robot_request):
+        """
+        Assign the robot that reaches `robot_request` soonest. Returns False
+        (leaving the request pending) when no robot is within
+        DISPATCH_MAX_DISTANCE_METERS or the request has no coordinates.
+        """
+        if robot_request.latitude is None:
+            return False
+        while True:
+            with self._lock:
+                candidate = self._get_index().claim_nearest(
+                    robot_request.latitude, robot_request.longitude, settings.DISPATCH_MAX_DISTANCE_METERS
+                )
+            if candidate is None:
+                return False
+            eta_seconds, distance, robot_id = candidate
+            try:
+                if self._assign(robot_request, robot_id, eta_seconds):
+                    return True
+            except AlreadyDispatched:
+                # The robot was never claimed; put it back
+                self.sync(Robot.objects.get(robot_id=robot_id))
+                robot_request.refresh_from_db()
+                return True
+
+    def release(self, robot_request):
+        """
+        Free the robot of a finished request at the request's location, and
+        send it straight on to the oldest queued request within reach.
+        """
+        robot = Robot.objects.filter(robot_id=robot_request.robot_id, current_request=robot_request).first()
+        if robot is None:
+            return None
+        return self.free(robot, robot_request.location)
+
+    def free(self, robot, location, travelled=None):
+        """
+        Make `robot` idle at `location`, charging its battery for
+        `travelled` meters (default: the straight line from where it was),
+        then serve the oldest queued request within reach.
+        """
+        lat, lng = coordinates(location)
+        if travelled is None and robot.latitude is not None and lat is not None:
+            travelled = haversine_meters(robot.latitude, robot.longitude, lat, lng)
+        if travelled:
+            robot.battery = max(0.0, robot.battery - travelled / 1000 * settings.DISPATCH_BATTERY_PER_KM)
+        if lat is not None:
+            robot.location = location
+        robot.state = 'idle'
+        robot.current_request = None
+        robot.save()
+
+        if not is_available(robot):
+            return robot
+        queued = filter_radius(
+            RobotRequest.objects.filter(status='pending'),
+            robot.latitude, robot.longitude, settings.DISPATCH_MAX_DISTANCE_METERS,
+        ).order_by('request_time', 'id')
+        for pending in queued[:10]:
+            distance = haversine_meters(robot.latitude, robot.longitude, pending.latitude, pending.longitude)
+            distance *= settings.DISPATCH_ROUTE_FACTOR
+            self.forget(robot.robot_id)
+            try:
+                self._assign(pending, robot.robot_id, distance / robot.speed_mps)
+                break
+            except AlreadyDispatched:
+                continue
+        else:
+            self.sync(robot)
+        return robot
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher()
+    return _dispatcher
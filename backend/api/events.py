@@ -0,0 +1,287 @@
+"""
+In-process fan-out of change events to Server-Sent Events subscribers.
+
+The signal handlers in api.signals (and batch ingest, which bypasses
+them) publish a compact event once the write commits: new detections,
+cleanup task creation and status transitions, robot request creation and
+status changes. Each event goes to the subscribers whose topics and
+optional map area match it, and into a bounded replay buffer
+(EVENT_STREAM_REPLAY_SIZE) so a reconnecting client that sends
+Last-Event-ID receives what it missed. A client whose id has fallen out
+of the buffer (or predates a server restart) gets a `reset` event telling
+it to refetch its lists instead.
+
+Subscribers are per process: with several server processes, each stream
+only carries the writes made by its own process, so serve /api/events/
+from a single ASGI worker. A subscriber that falls EVENT_STREAM_QUEUE_SIZE
+events behind is disconnected and catches up through the replay buffer on
+reconnect.
+"""
+import abc
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+DETECTIONS = 'detections'
+TASKS = 'tasks'
+ROBOTS = 'robots'
+TOPICS = (DETECTIONS, TASKS, ROBOTS)
+
+
+class Event:
+    __slots__ = ('seq', 'topic', 'type', 'lat', 'lng', 'data')
+
+    def __init__(self, seq, topic, type, lat, lng, data):
+        self.seq = seq
+        self.topic = topic
+        self.type = type
+        self.lat = lat
+        self.lng = lng
+        self.data = data
+
+    def frame(self, epoch):
+        payload = json.dumps(self.data, cls=DjangoJSONEncoder, ensure_ascii=False)
+        return f'id: {epoch}-{self.seq}\nevent: {self.type}\ndata: {payload}\n\n'
+
+
+class Subscriber(abc.ABC):
+    """Topics and area of one stream, plus the queue its events are delivered to"""
+
+    def __init__(self, topics, matcher=None):
+        self.topics = frozenset(topics)
+        self.matcher = matcher
+        self.backlog = []
+        self.reset = False
+
+    def wants(self, event):
+        if event.topic not in self.topics:
+            return False
+        return self.matcher is None or self.matcher(event.lat, event.lng)
+
+    @abc.abstractmethod
+    def deliver(self, event):
+        """Queue `event` for the stream; may be called from any thread"""
+
+    @abc.abstractmethod
+    def close(self):
+        """End the stream, dropping whatever is still queued"""
+
+
+class ThreadSubscriber(Subscriber):
+    """Subscriber consumed by a blocking generator (WSGI)"""
+
+    def __init__(self, topics, matcher=None):
+        super().__init__(topics, matcher)
+        self.queue = queue.Queue(maxsize=settings.EVENT_STREAM_QUEUE_SIZE)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.close()
+
+    def close(self):
+        # Drop what is pending; None ends the stream
+        with self.queue.mutex:
+            self.queue.queue.clear()
+        self.queue.put_nowait(None)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber consumed by an async generator on the current event loop (ASGI)"""
+
+    def __init__(self, topics, matcher=None):
+        super().__init__(topics, matcher)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENT_STREAM_QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError
+
+
+class EventBus:
+    def __init__(self, replay_size):
+        # Event ids carry the bus's start time so ids from before a restart are recognised
+        self.epoch = format(time.time_ns() // 1_000_000, 'x')
+        self._seq = 0
+        self._buffer = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, topic, type, data, lat=None, lng=None):
+        with self._lock:
+            self._seq += 1
+            event = Event(self._seq, topic, type, lat, lng, data)
+            self._buffer.append(event)
+            subscribers = [subscriber for subscriber in self._subscribers if subscriber.wants(event)]
+        for subscriber in subscribers:
+            try:
+                subscriber.deliver(event)
+            except RuntimeError:
+                # The subscriber's event loop is gone
+                self.unsubscribe(subscriber)
+        return event
+
+    def _parse_id(self, last_event_id):
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, subscriber, last_event_id=None):
+        """
+        Register `subscriber`, filling its backlog with the buffered events
+        after `last_event_id`, or flagging a reset when they are gone.
+        """
+        with self._lock:
+            if last_event_id:
+                seq = self._parse_id(last_event_id)
+                oldest = self._buffer[0].seq if self._buffer else self._seq + 1
+                if seq is None or seq > self._seq or seq < oldest - 1:
+                    subscriber.reset = True
+                else:
+                    subscriber.backlog = [
+                        event for event in self._buffer if event.seq > seq and subscriber.wants(event)
+                    ]
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = EventBus(settings.EVENT_STREAM_REPLAY_SIZE)
+    return _bus
+
+
+def publish_on_commit(topic, type, data, lat=None, lng=None):
+    """Publish once the current transaction commits, so subscribers never see rolled-back rows"""
+    transaction.on_commit(lambda: get_event_bus().publish(topic, type, data, lat, lng))
+
+
+def publish_detection(detection):
+    publish_on_commit(DETECTIONS, 'detection.created', {
+        'id': detection.id,
+        'detected_objects': detection.detected_objects,
+        'lat': detection.latitude,
+        'lng': detection.longitude,
+        'detected_at': detection.detected_at,
+    }, detection.latitude, detection.longitude)
+
+
+def publish_task(task, previous_status=None, detection=None):
+    """Task creation, or its transition from `previous_status`"""
+    detection = detection or task.detection
+    publish_on_commit(TASKS, 'task.created' if previous_status is None else 'task.status', {
+        'id': task.id,
+        'detection_id': task.detection_id,
+        'status': task.status,
+        'previous_status': previous_status,
+        'assigned_to': task.assigned_to,
+    }, detection.latitude, detection.longitude)
+
+
+def publish_robot_request(robot_request, previous_status=None):
+    """Robot request creation, or its transition from `previous_status`"""
+    publish_on_commit(ROBOTS, 'robot.created' if previous_status is None else 'robot.status', {
+        'id': robot_request.id,
+        'status': robot_request.status,
+        'previous_status': previous_status,
+        'robot_id': robot_request.robot_id,
+        'eta_minutes': robot_request.eta_minutes,
+        'lat': robot_request.latitude,
+        'lng': robot_request.longitude,
+    }, robot_request.latitude, robot_request.longitude)
+
+
+def _opening(bus, subscriber):
+    yield f'retry: {settings.EVENT_STREAM_RETRY_MS}\n\n'
+    if subscriber.reset:
+        yield f'id: {bus.epoch}-{bus._seq}\nevent: reset\ndata: {{}}\n\n'
+    for event in subscriber.backlog:
+        yield event.frame(bus.epoch)
+    subscriber.backlog = []
+
+
+def stream(topics, matcher=None, last_event_id=None):
+    """SSE frames for a blocking (WSGI) response"""
+    bus = get_event_bus()
+    subscriber = bus.subscribe(ThreadSubscriber(topics, matcher), last_event_id)
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        yield from _opening(bus, subscriber)
+        while time.monotonic() < deadline:
+            try:
+                event = subscriber.get(settings.EVENT_STREAM_HEARTBEAT)
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                break
+            yield event.frame(bus.epoch)
+    finally:
+        bus.unsubscribe(subscriber)
+
+
+async def astream(topics, matcher=None, last_event_id=None):
+    """SSE frames for an async (ASGI) response"""
+    bus = get_event_bus()
+    subscriber = bus.subscribe(AsyncSubscriber(topics, matcher), last_event_id)
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        for frame in _opening(bus, subscriber):
+            yield frame
+        while time.monotonic() < deadline:
+            try:
+                event = await subscriber.get(settings.EVENT_STREAM_HEARTBEAT)
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                break
+            yield event.frame(bus.epoch)
+    finally:
+        bus.unsubscribe(subscriber)
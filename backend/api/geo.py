@@ -0,0 +1,211 @@
+"""
+Indexed geo queries over the free-form `location` JSON.
+
+TrashDetection and RobotRequest copy the lat/lng of their location into
+numeric columns on save, plus the id of the fixed-size grid cell the point
+falls in (GEO_CELL_DEGREES on a side, numbered row-major from -90/-180).
+A bounding box becomes a handful of contiguous cell-id ranges, one per
+grid row, so the database walks the geo_cell index instead of the table;
+the exact lat/lng comparison then only runs on those candidates. Boxes
+taller than GEO_MAX_CELL_ROWS use the single range covering their
+latitude band, which row-major numbering keeps contiguous. A radius
+query is the bounding box of the circle plus an equirectangular distance
+check, which needs no trig functions in SQL and is accurate to well under
+1% at city scale.
+"""
+import json
+import math
+
+from django.conf import settings
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import ExpressionWrapper
+
+METERS_PER_DEGREE = 111_320.0
+EARTH_RADIUS_METERS = 6_371_008.8
+MAX_RADIUS_METERS = 100_000
+
+
+def coordinates(location):
+    """(lat, lng) floats from a location dict or JSON string, or (None, None)"""
+    if isinstance(location, str):
+        try:
+            location = json.loads(location)
+        except ValueError:
+            return None, None
+    if not isinstance(location, dict):
+        return None, None
+    try:
+        lat = float(location.get('lat', location.get('latitude')))
+        lng = float(location.get('lng', location.get('longitude')))
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None, None
+    return lat, lng
+
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlmb = phi2 - phi1, math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _grid(size=None):
+    size = size or settings.GEO_CELL_DEGREES
+    return size, math.ceil(360.0 / size) + 1
+
+
+def cell_for(lat, lng, size=None):
+    """Grid cell id of a point; `size` overrides GEO_CELL_DEGREES for other grids"""
+    size, columns = _grid(size)
+    return math.floor((lat + 90.0) / size) * columns + math.floor((lng + 180.0) / size)
+
+
+def geo_columns(location):
+    """Values for the latitude, longitude and geo_cell columns of a location"""
+    lat, lng = coordinates(location)
+    if lat is None:
+        return None, None, None
+    return lat, lng, cell_for(lat, lng)
+
+
+def cell_ranges(min_lat, min_lng, max_lat, max_lng, size=None):
+    """
+    Inclusive geo_cell id ranges covering the box: one per grid row, or a
+    single range over the whole latitude band when the box spans more
+    than GEO_MAX_CELL_ROWS rows.
+    """
+    size, columns = _grid(size)
+    first_row = math.floor((min_lat + 90.0) / size)
+    last_row = math.floor((max_lat + 90.0) / size)
+    first_column = math.floor((min_lng + 180.0) / size)
+    last_column = math.floor((max_lng + 180.0) / size)
+    if last_row - first_row + 1 > settings.GEO_MAX_CELL_ROWS:
+        return [(first_row * columns + first_column, last_row * columns + last_column)]
+    return [
+        (row * columns + first_column, row * columns + last_column)
+        for row in range(first_row, last_row + 1)
+    ]
+
+
+def parse_bbox(value):
+    """'min_lng,min_lat,max_lng,max_lat' (GeoJSON order) -> (min_lat, min_lng, max_lat, max_lng)"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    if not (-90.0 <= min_lat <= max_lat <= 90.0 and -180.0 <= min_lng <= max_lng <= 180.0):
+        raise ValueError('bbox must satisfy min <= max within -180..180 / -90..90 (no antimeridian crossing)')
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def filter_bbox(queryset, min_lat, min_lng, max_lat, max_lng, prefix=''):
+    cells = Q()
+    for first, last in cell_ranges(min_lat, min_lng, max_lat, max_lng):
+        cells |= Q(**{f'{prefix}geo_cell__range': (first, last)})
+    return queryset.filter(cells).filter(**{
+        f'{prefix}latitude__range': (min_lat, max_lat),
+        f'{prefix}longitude__range': (min_lng, max_lng),
+    })
+
+
+def filter_radius(queryset, lat, lng, radius, prefix=''):
+    """Rows within `radius` meters of (lat, lng)"""
+    lat_span = radius / METERS_PER_DEGREE
+    scale = max(math.cos(math.radians(lat)), 1e-6)
+    lng_span = min(lat_span / scale, 180.0)
+    queryset = filter_bbox(
+        queryset,
+        max(lat - lat_span, -90.0), max(lng - lng_span, -180.0),
+        min(lat + lat_span, 90.0), min(lng + lng_span, 180.0),
+        prefix,
+    )
+    dlat = F(f'{prefix}latitude') - lat
+    dlng = (F(f'{prefix}longitude') - lng) * scale
+    return queryset.annotate(
+        geo_distance2=ExpressionWrapper(dlat * dlat + dlng * dlng, output_field=FloatField())
+    ).filter(geo_distance2__lte=lat_span * lat_span)
+
+
+def _radius_params(params):
+    """(lat, lng, radius) of a radius query, None without one. Raises ValueError on malformed values."""
+    if not params.get('radius'):
+        return None
+    try:
+        lat, lng, radius = float(params['lat']), float(params['lng']), float(params['radius'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('radius queries need numeric lat, lng and radius (meters)')
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        raise ValueError('lat/lng out of range')
+    if not 0 < radius <= MAX_RADIUS_METERS:
+        raise ValueError(f'radius must be between 0 and {MAX_RADIUS_METERS} meters')
+    return lat, lng, radius
+
+
+def filter_by_area(queryset, params, prefix=''):
+    """
+    Apply the `bbox` and `lat`/`lng`/`radius` (meters) query parameters,
+    if present. Raises ValueError on malformed values.
+    """
+    if params.get('bbox'):
+        queryset = filter_bbox(queryset, *parse_bbox(params['bbox']), prefix=prefix)
+
+    circle = _radius_params(params)
+    if circle is not None:
+        queryset = filter_radius(queryset, *circle, prefix)
+    return queryset
+
+
+def area_matcher(params):
+    """
+    The same `bbox` and `lat`/`lng`/`radius` filters as filter_by_area, as
+    a predicate on a single (lat, lng) point; None when no area is given.
+    Points without coordinates never match an area.
+    """
+    bbox = parse_bbox(params['bbox']) if params.get('bbox') else None
+    circle = _radius_params(params)
+    if bbox is None and circle is None:
+        return None
+
+    if circle is not None:
+        center_lat, center_lng, radius = circle
+        span = radius / METERS_PER_DEGREE
+        scale = max(math.cos(math.radians(center_lat)), 1e-6)
+
+    def matches(lat, lng):
+        if lat is None or lng is None:
+            return False
+        if bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+                return False
+        if circle is not None:
+            dlat, dlng = lat - center_lat, (lng - center_lng) * scale
+            if dlat * dlat + dlng * dlng > span * span:
+                return False
+        return True
+    return matches
+
+
+def rebuild_geo_columns(model, batch_size=2000):
+    """
+    Recompute the geo columns of every row from its location; used for
+    backfills and after changing GEO_CELL_DEGREES. Migrations pass their
+    historical models.
+    """
+    fields = ['latitude', 'longitude', 'geo_cell']
+    pending = []
+    total = 0
+    for row in model.objects.only('id', 'location').iterator(chunk_size=batch_size):
+        row.latitude, row.longitude, row.geo_cell = geo_columns(row.location)
+        pending.append(row)
+        if len(pending) >= batch_size:
+            model.objects.bulk_update(pending, fields)
+            total += len(pending)
+            pending = []
+    if pending:
+        model.objects.bulk_update(pending, fields)
+        total += len(pending)
+    return total
@@ -0,0 +1,137 @@
+"""
+Incremental clustering of detections into hotspots (HOTSPOT_ENABLED).
+
+A camera sweeping a littered stretch reports the same pile many times, and
+each report used to become its own cleanup task. Instead, a detection with
+trash joins the nearest open hotspot that lies within
+HOTSPOT_RADIUS_METERS of it and was last seen within HOTSPOT_WINDOW_HOURS;
+only a detection that joins nothing opens a new hotspot, and with it a
+cleanup task. Each hotspot keeps the running centroid of its detections
+and per-class object counts.
+
+This is density clustering with a single-point core (DBSCAN with
+min_samples=1, an eps of the radius), run online: hotspots are never
+merged after the fact. Open hotspots are bucketed by their centroid on a
+grid whose cells are HOTSPOT_RADIUS_METERS of latitude on a side, so a
+lookup reads the (status, cell, last_seen) index for the handful of cells
+around the point, independent of how many hotspots exist. A hotspot
+closes when its task completes; the next detection there opens a new one.
+
+attach() takes the database write lock before it looks for a hotspot, so
+concurrent detections at the same spot join one hotspot instead of each
+opening their own.
+"""
+import math
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .events import TASKS, publish_on_commit
+from .geo import METERS_PER_DEGREE, cell_for, cell_ranges, coordinates, haversine_meters
+from .models import CleanupTask, Hotspot
+
+
+def cell_degrees():
+    return settings.HOTSPOT_RADIUS_METERS / METERS_PER_DEGREE
+
+
+def _candidates(lat, lng, since):
+    """Open hotspots seen since `since` in the grid cells around (lat, lng)"""
+    size = cell_degrees()
+    lng_span = min(size / max(math.cos(math.radians(lat)), 1e-6), 180.0)
+    cells = Q()
+    for first, last in cell_ranges(
+        max(lat - size, -90.0), max(lng - lng_span, -180.0),
+        min(lat + size, 90.0), min(lng + lng_span, 180.0),
+        size,
+    ):
+        # status in every branch so each range is its own (status, cell) index seek
+        cells |= Q(status='open', cell__range=(first, last))
+    return Hotspot.objects.filter(cells, last_seen__gte=since)
+
+
+def nearest_hotspot(lat, lng, seen_at):
+    """The closest open hotspot within the radius and time window of a detection, or None"""
+    radius = settings.HOTSPOT_RADIUS_METERS
+    since = seen_at - timedelta(hours=settings.HOTSPOT_WINDOW_HOURS)
+    best, best_distance = None, None
+    for hotspot in _candidates(lat, lng, since):
+        distance = haversine_meters(lat, lng, hotspot.latitude, hotspot.longitude)
+        if distance <= radius and (best is None or distance < best_distance):
+            best, best_distance = hotspot, distance
+    return best
+
+
+def _lock_for_update():
+    """
+    Take SQLite's database-wide write lock for the rest of the transaction.
+    SELECT ... FOR UPDATE is a no-op on SQLite, but the first write of a
+    transaction takes the lock, waiting out the busy timeout while another
+    writer holds it. Must come before the transaction's first read.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {Hotspot._meta.db_table} SET status = status WHERE 0')
+
+
+def attach(location, detected_objects, seen_at):
+    """
+    The hotspot a detection at `location` with `detected_objects` belongs
+    to, and whether it was newly opened (and so needs a cleanup task).
+    Returns (None, True) when clustering is disabled or the location has no
+    coordinates. Must run inside the transaction that saves the detection,
+    before it reads anything, and holds the write lock until it commits.
+    """
+    lat, lng = coordinates(location)
+    if not settings.HOTSPOT_ENABLED or lat is None:
+        return None, True
+
+    _lock_for_update()
+    hotspot = nearest_hotspot(lat, lng, seen_at)
+    if hotspot is None:
+        hotspot = Hotspot.objects.create(
+            latitude=lat,
+            longitude=lng,
+            cell=cell_for(lat, lng, cell_degrees()),
+            detection_count=1,
+            object_count=len(detected_objects),
+            object_counts=dict(Counter(detected_objects)),
+            first_seen=seen_at,
+            last_seen=seen_at,
+        )
+        return hotspot, True
+
+    count = hotspot.detection_count + 1
+    hotspot.latitude += (lat - hotspot.latitude) / count
+    hotspot.longitude += (lng - hotspot.longitude) / count
+    hotspot.cell = cell_for(hotspot.latitude, hotspot.longitude, cell_degrees())
+    hotspot.detection_count = count
+    hotspot.object_count += len(detected_objects)
+    object_counts = Counter(hotspot.object_counts)
+    object_counts.update(detected_objects)
+    hotspot.object_counts = dict(object_counts)
+    hotspot.last_seen = max(hotspot.last_seen, seen_at)
+    hotspot.save()
+    publish_hotspot(hotspot)
+    return hotspot, False
+
+
+def publish_hotspot(hotspot):
+    publish_on_commit(TASKS, 'hotspot.updated', {
+        'id': hotspot.id,
+        'task_id': CleanupTask.objects.filter(hotspot=hotspot).values_list('id', flat=True).first(),
+        'detection_count': hotspot.detection_count,
+        'object_count': hotspot.object_count,
+        'object_counts': hotspot.object_counts,
+        'lat': hotspot.latitude,
+        'lng': hotspot.longitude,
+        'last_seen': hotspot.last_seen,
+    }, hotspot.latitude, hotspot.longitude)
+
+
+def close_hotspot(hotspot_id):
+    """Close a hotspot once its cleanup task is done"""
+    return Hotspot.objects.filter(pk=hotspot_id, status='open').update(status='closed')
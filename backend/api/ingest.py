@@ -0,0 +1,239 @@
+"""
+Batch ingest of many uploaded frames in one request.
+
+Images are hashed and looked up in the result cache first; the misses are
+decoded and run through the detector TRASH_BATCH_MAX_SIZE at a time, so a
+sweep of frames costs a few batched forward passes instead of one per
+request. All TrashDetection and CleanupTask rows of the batch are then
+written with bulk_create in one transaction; detections of a spot that
+already has an open hotspot join it instead of opening another task
+(api.hotspots). bulk_create skips save() and the post_save signals, so the
+geo columns, counters, rollups, cached responses and change events are
+updated here explicitly.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .cv_model import get_detector
+from .events import publish_detection, publish_task
+from .hotspots import attach
+from .models import CleanupTask, TrashDetection
+from .response_cache import DETECTIONS, TASKS, invalidate
+from .result_cache import get_result_cache, result_version
+from .rollups import apply_rollups, detection_rollups, task_rollups
+from .stats import apply_counts, detection_counts
+from .uploads import InvalidImage, decode_upload, hash_upload, persist_upload, upload_name
+
+
+class BatchItem:
+    """One uploaded image of a batch and what became of it"""
+    __slots__ = (
+        'index', 'upload', 'location', 'image_path', 'cache_key', 'detections',
+        'cached', 'error', 'twin', 'detection', 'duplicate',
+    )
+
+    def __init__(self, index, upload, location=None):
+        self.index = index
+        self.upload = upload
+        self.location = location or {}
+        self.image_path = None
+        self.cache_key = None
+        self.detections = None
+        self.cached = None
+        self.error = None
+        self.twin = None  # earlier item of the same batch with identical bytes
+        self.detection = None
+        self.duplicate = False
+
+    def result(self):
+        """Per-image inference result, as streamed"""
+        if self.error is not None:
+            return {'index': self.index, 'name': self.upload.name, 'error': self.error}
+        return {'index': self.index, 'name': self.upload.name, 'detections': self.detections}
+
+    def response(self):
+        """Per-image result once the batch is recorded, shaped like upload_and_detect"""
+        if self.error is not None:
+            return self.result()
+        return {
+            'index': self.index,
+            'name': self.upload.name,
+            'detection_id': self.detection.id,
+            'image_url': self.detection.image_url,
+            'detections': self.detections,
+            'detected_objects': self.detection.detected_objects,
+            'confidence_scores': self.detection.confidence_scores,
+            'location': self.detection.location,
+            'detected_at': self.detection.detected_at,
+            'duplicate': self.duplicate,
+        }
+
+
+def _detect_chunk(detector, images, tiling):
+    """Detections (or the exception raised) for each image of a chunk"""
+    if tiling is None:
+        try:
+            return detector.detect_batch(images)
+        except Exception as e:
+            print(f"Error in batch detection, retrying images one by one: {e}")
+
+    results = []
+    for image in images:
+        try:
+            if tiling is not None:
+                results.append(detector.detect_tiled(image, **tiling))
+            else:
+                results.append(detector.detect_image(image))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def detect_items(items, tiling=None):
+    """
+    Fill in the detections (or error) of every item, yielding each item as
+    soon as it is done: cache hits first, then each inference chunk.
+    Images are decoded chunk by chunk so a large batch never holds every
+    decoded frame in memory at once.
+    """
+    detector = get_detector()
+    cache = get_result_cache()
+    version = result_version(detector.model_version, tiling)
+
+    pending, twins, first_by_digest = [], [], {}
+    for item in items:
+        digest = hash_upload(item.upload)
+        if digest in first_by_digest:
+            item.twin = first_by_digest[digest]
+            twins.append(item)
+            continue
+        first_by_digest[digest] = item
+        if cache is not None:
+            item.cache_key = cache.key(digest, version)
+            item.cached = cache.get(item.cache_key)
+            if item.cached is not None:
+                item.detections = item.cached['detections']
+                yield item
+                continue
+        pending.append(item)
+
+    chunk_size = max(1, settings.TRASH_BATCH_MAX_SIZE)
+    for start in range(0, len(pending), chunk_size):
+        chunk, images = [], []
+        for item in pending[start:start + chunk_size]:
+            try:
+                images.append(decode_upload(item.upload))
+                chunk.append(item)
+            except InvalidImage as e:
+                item.error = str(e)
+                yield item
+
+        results = _detect_chunk(detector, images, tiling) if images else []
+        del images
+        for item, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                item.error = f'Error processing image: {result}'
+            else:
+                item.detections = result
+                if cache is not None:
+                    cache.set(item.cache_key, {'detections': result, 'detection_id': None})
+            yield item
+
+    for item in twins:
+        item.detections, item.error = item.twin.detections, item.twin.error
+        yield item
+
+
+def record_items(items):
+    """
+    Create the detection and cleanup task rows for a detected batch in one
+    transaction. With RESULT_CACHE_LINK_DUPLICATES, images already recorded
+    (per the result cache) or repeated within the batch link to the
+    existing detection instead of creating a new row.
+    """
+    link = settings.RESULT_CACHE_LINK_DUPLICATES
+    detected = [item for item in items if item.error is None]
+
+    existing_ids = [
+        item.cached['detection_id'] for item in detected
+        if link and item.twin is None and item.cached and item.cached['detection_id']
+    ]
+    existing = TrashDetection.objects.in_bulk(existing_ids)
+
+    new_items = []
+    for item in detected:
+        if item.twin is not None and link:
+            continue
+        if link and item.cached and item.cached['detection_id'] in existing:
+            item.detection = existing[item.cached['detection_id']]
+            item.duplicate = True
+            continue
+        item.image_path = upload_name(item.upload)
+        item.detection = TrashDetection(
+            image_url=default_storage.url(item.image_path),
+            detected_objects=[det['class'] for det in item.detections],
+            confidence_scores=[det['confidence'] for det in item.detections],
+            location=item.location,
+        )
+        item.detection.index_location()
+        new_items.append(item)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # One item at a time, so frames of the same spot within the batch share a hotspot
+        opened = []
+        for item in new_items:
+            if item.detection.detected_objects:
+                hotspot, is_new = attach(item.location, item.detection.detected_objects, item.detection.detected_at)
+                item.detection.hotspot = hotspot
+                if is_new:
+                    opened.append(item)
+        TrashDetection.objects.bulk_create([item.detection for item in new_items])
+        tasks = CleanupTask.objects.bulk_create([
+            CleanupTask(detection=item.detection, status='pending', created_at=now, hotspot=item.detection.hotspot)
+            for item in opened
+        ])
+
+        counts, rollups, totals = Counter(), Counter(), Counter()
+        for item in new_items:
+            counts.update(detection_counts(item.detection.detected_at, item.detection.detected_objects))
+            rollups.update(detection_rollups(item.detection.detected_at, item.detection.detected_objects))
+        for task in tasks:
+            task_counts, task_totals = task_rollups(task, None, now)
+            rollups.update(task_counts)
+            totals.update(task_totals)
+        apply_counts(counts)
+        apply_rollups(rollups, totals)
+        if new_items:
+            invalidate(DETECTIONS, TASKS)
+        for item in new_items:
+            publish_detection(item.detection)
+        for task in tasks:
+            publish_task(task, detection=task.detection)
+
+    for item in detected:
+        if item.twin is not None and link:
+            item.detection = item.twin.detection
+            item.duplicate = True
+
+    cache = get_result_cache()
+    for item in new_items:
+        if cache is not None and item.cache_key is not None:
+            cache.set(item.cache_key, {'detections': item.detections, 'detection_id': item.detection.id})
+        persist_upload(item.image_path, item.upload)
+    return items
+
+
+def batch_summary(items):
+    """Response body for a recorded batch"""
+    results = [item.response() for item in items]
+    return {
+        'created': sum(1 for item in items if item.detection is not None and not item.duplicate),
+        'duplicates': sum(1 for item in items if item.duplicate),
+        'failed': sum(1 for item in items if item.error is not None),
+        'results': results,
+    }
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+
+import cv2
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api.async_views import _get_executor
+from api.cv_model import reset_detector
+from api.management.commands.bench_detection import summarize, synthetic_image
+from api.onnx_fixture import write_fixture_model
+from api.result_cache import reset_result_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the WSGI detect-trash view against its async ASGI counterpart under many '
+        'concurrent slow clients. Runs in-process: each request first spends --client-delay-ms '
+        'receiving its upload, which holds a server thread under WSGI (--wsgi-threads of them) '
+        'but only a suspended coroutine under ASGI. Results are written as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None,
+                            help='ONNX model to benchmark (default: a generated fixture model)')
+        parser.add_argument('--concurrency', default='16,64,256', help='Comma-separated numbers of concurrent clients')
+        parser.add_argument('--rounds', type=int, default=2, help='Requests per client')
+        parser.add_argument('--client-delay-ms', type=float, default=200.0,
+                            help='Simulated upload time per request')
+        parser.add_argument('--wsgi-threads', type=int, default=8, help='Request threads of the WSGI server')
+        parser.add_argument('--async-threads', type=int, default=4, help='ASYNC_INFERENCE_THREADS for the ASGI run')
+        parser.add_argument('--resolution', default='1280x720', help='WIDTHxHEIGHT of the uploaded images')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='Result file (default: benchmarks/async-<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        width, height = (int(value) for value in options['resolution'].lower().split('x'))
+        payloads = [
+            cv2.imencode('.jpg', synthetic_image(width, height, options['seed'] + index))[1].tobytes()
+            for index in range(8)
+        ]
+        levels = [int(value) for value in options['concurrency'].split(',')]
+
+        with tempfile.TemporaryDirectory(prefix='ecovision-bench-') as workdir:
+            model_path = options['model'] or write_fixture_model(os.path.join(workdir, 'fixture.onnx'))
+            overrides = {
+                'TRASH_MODEL_PATH': model_path,
+                'TRASH_BATCHING_ENABLED': False,
+                'TRASH_INFERENCE_WORKERS': 0,
+                'RESULT_CACHE_ENABLED': False,  # every request runs inference
+                'UPLOAD_PERSIST_ASYNC': True,
+                'ASYNC_INFERENCE_THREADS': options['async_threads'],
+                'METRICS_ENABLED': False,
+                'MEDIA_ROOT': os.path.join(workdir, 'media'),
+            }
+            # A file database so concurrent request threads can write to it
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+            with override_settings(**overrides):
+                setup_test_environment()
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                reset_detector()
+                reset_result_cache()
+                try:
+                    Client().post('/api/detect-trash/', {'image': self.upload(payloads[0])})  # load the model
+                    scenarios = {}
+                    for clients in levels:
+                        scenarios[f'wsgi/{clients}'] = self.bench_wsgi(payloads, clients, options)
+                        scenarios[f'asgi/{clients}'] = self.bench_asgi(payloads, clients, options)
+                finally:
+                    reset_detector()
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                    teardown_test_environment()
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'opencv': cv2.__version__,
+            },
+            'model': options['model'] or 'fixture',
+            'options': {
+                key: options[key]
+                for key in ('rounds', 'client_delay_ms', 'wsgi_threads', 'async_threads', 'resolution', 'seed')
+            },
+            'scenarios': scenarios,
+        }
+
+        json_path = options['json_path'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"async-{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.report(scenarios)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {json_path}'))
+
+    @staticmethod
+    def upload(data):
+        return SimpleUploadedFile('bench.jpg', data, content_type='image/jpeg')
+
+    def bench_wsgi(self, payloads, clients, options):
+        """`clients` client threads sharing a pool of --wsgi-threads server threads"""
+        delay = options['client_delay_ms'] / 1000.0
+        server_threads = threading.BoundedSemaphore(options['wsgi_threads'])
+        latencies, failures = [], []
+        lock = threading.Lock()
+
+        def client(index):
+            http = Client()
+            for round_index in range(options['rounds']):
+                data = payloads[(index + round_index) % len(payloads)]
+                started = time.perf_counter()
+                with server_threads:
+                    time.sleep(delay)  # the worker thread blocks while the body arrives
+                    response = http.post('/api/detect-trash/', {'image': self.upload(data)})
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = summarize(latencies, len(latencies), elapsed)
+        result.update({'failures': len(failures), 'server_threads': options['wsgi_threads']})
+        return result
+
+    def bench_asgi(self, payloads, clients, options):
+        """`clients` coroutines on one event loop; only the executors use threads"""
+        delay = options['client_delay_ms'] / 1000.0
+        latencies, failures = [], []
+
+        async def client(index):
+            http = AsyncClient()
+            for round_index in range(options['rounds']):
+                data = payloads[(index + round_index) % len(payloads)]
+                started = time.perf_counter()
+                await asyncio.sleep(delay)  # the ASGI server buffers the body without a thread
+                response = await http.post('/api/async/detect-trash/', {'image': self.upload(data)})
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+        async def run():
+            await asyncio.gather(*(client(index) for index in range(clients)))
+
+        _get_executor()  # start the executor outside the timed region
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+
+        # Event loop + Django's database thread + the inference executor
+        result = summarize(latencies, len(latencies), elapsed)
+        result.update({'failures': len(failures), 'server_threads': options['async_threads'] + 2})
+        return result
+
+    def report(self, scenarios):
+        self.stdout.write(f"{'scenario':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'threads':>9}{'fail':>6}")
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name:<14}{result['throughput_images_per_s']:>10.1f}{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['server_threads']:>9}"
+                f"{result['failures']:>6}"
+            )
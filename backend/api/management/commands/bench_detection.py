@@ -0,0 +1,249 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api.batching import InferenceScheduler
+from api.cv_model import TrashDetectionModel, reset_detector
+from api.onnx_fixture import write_fixture_model
+from api.result_cache import reset_result_cache
+
+
+def synthetic_image(width, height, seed):
+    """Smooth noise with a few solid blobs, so JPEG/PNG sizes look like photos"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(8):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(8, max(9, min(width, height) // 10)))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.circle(image, center, radius, color, -1)
+    noise = rng.integers(0, 32, size=image.shape, dtype=np.uint8)
+    return cv2.add(image, noise)
+
+
+def summarize(latencies_ms, images, elapsed):
+    latencies_ms = sorted(latencies_ms)
+    last = len(latencies_ms) - 1
+    return {
+        'requests': len(latencies_ms),
+        'images': images,
+        'throughput_images_per_s': images / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(latencies_ms),
+        'p50_ms': latencies_ms[int(last * 0.50)],
+        'p95_ms': latencies_ms[int(last * 0.95)],
+        'p99_ms': latencies_ms[int(last * 0.99)],
+        'max_ms': latencies_ms[last],
+    }
+
+
+def run_serial(function, arguments):
+    latencies = []
+    started = time.perf_counter()
+    for argument in arguments:
+        call_started = time.perf_counter()
+        function(argument)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies, time.perf_counter() - started
+
+
+def run_concurrent(function, arguments, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_call(argument):
+        call_started = time.perf_counter()
+        function(argument)
+        elapsed = (time.perf_counter() - call_started) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(timed_call, arguments))
+    return latencies, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the detection pipeline offline: the model directly (single, batched, '
+        'scheduler, tiled) and the DRF upload views (cache miss and hit), on synthetic '
+        'images and a generated fixture model. Results are written as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None,
+                            help='ONNX model to benchmark (default: a generated fixture model)')
+        parser.add_argument('--resolutions', default='640x480,1920x1080,4032x3024',
+                            help='Comma-separated WIDTHxHEIGHT source resolutions')
+        parser.add_argument('--iterations', type=int, default=30, help='Requests per scenario')
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent callers for the scheduler scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='Result file (default: benchmarks/detection-<timestamp>.json)')
+        parser.add_argument('--compare', default=None, help='Earlier result file to compare throughput against')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='ecovision-bench-') as workdir:
+            model_path = options['model'] or write_fixture_model(os.path.join(workdir, 'fixture.onnx'))
+            resolutions = [
+                tuple(int(value) for value in spec.lower().split('x'))
+                for spec in options['resolutions'].split(',')
+            ]
+            images = {
+                (width, height): synthetic_image(width, height, options['seed'] + index)
+                for index, (width, height) in enumerate(resolutions)
+            }
+
+            overrides = {
+                'TRASH_MODEL_PATH': model_path,
+                'TRASH_BATCHING_ENABLED': False,
+                'TRASH_INFERENCE_WORKERS': 0,
+                'RESULT_CACHE_ENABLED': True,
+                'RESULT_CACHE_DIR': '',
+                'RESULT_CACHE_LINK_DUPLICATES': True,
+                'MEDIA_ROOT': os.path.join(workdir, 'media'),
+            }
+            with override_settings(**overrides):
+                model = TrashDetectionModel(model_path)
+                model.warm_up()
+                self.warm_up_batches(model, options['batch_size'])
+                scenarios = {}
+                scenarios.update(self.bench_model(model, images, options))
+                scenarios.update(self.bench_views(images, options))
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+            },
+            'model': options['model'] or 'fixture',
+            'input_size': model.input_size,
+            'options': {key: options[key] for key in ('iterations', 'batch_size', 'threads', 'seed')},
+            'scenarios': scenarios,
+        }
+
+        json_path = options['json_path'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"detection-{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.report(scenarios)
+        if options['compare']:
+            self.compare(scenarios, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f'Results written to {json_path}'))
+
+    def warm_up_batches(self, model, batch_size):
+        """
+        Run every batch size up to `batch_size` once. The network's first
+        forward pass at a new batch size is several times slower, which would
+        otherwise be timed as part of the batched and scheduler scenarios.
+        """
+        blank = np.zeros((model.input_size, model.input_size, 3), dtype=np.uint8)
+        for size in range(1, batch_size + 1):
+            model.detect_batch([blank] * size)
+
+    def bench_model(self, model, images, options):
+        iterations = options['iterations']
+        batch_size = options['batch_size']
+        scenarios = {}
+        for (width, height), image in images.items():
+            label = f'{width}x{height}'
+
+            latencies, elapsed = run_serial(model.detect_image, [image] * iterations)
+            scenarios[f'model_single/{label}'] = summarize(latencies, iterations, elapsed)
+
+            batches = max(1, iterations // batch_size)
+            latencies, elapsed = run_serial(model.detect_batch, [[image] * batch_size] * batches)
+            scenarios[f'model_batched/{label}'] = summarize(latencies, batches * batch_size, elapsed)
+
+            scheduler = InferenceScheduler(model, max_batch_size=batch_size, max_wait_ms=5.0)
+            try:
+                latencies, elapsed = run_concurrent(scheduler.detect_image, [image] * iterations, options['threads'])
+            finally:
+                scheduler.stop()
+            scenarios[f'scheduler/{label}'] = summarize(latencies, iterations, elapsed)
+
+            if max(width, height) > model.input_size * 2:
+                tiled_iterations = max(1, iterations // 4)
+                model.detect_tiled(image)  # the tiles form a batch size of their own
+                latencies, elapsed = run_serial(model.detect_tiled, [image] * tiled_iterations)
+                scenarios[f'model_tiled/{label}'] = summarize(latencies, tiled_iterations, elapsed)
+        return scenarios
+
+    def bench_views(self, images, options):
+        iterations = options['iterations']
+        (width, height), image = next(iter(images.items()))
+        label = f'{width}x{height}'
+
+        # Distinct images for the miss path, one image reused for the hit path
+        encoded = [
+            cv2.imencode('.jpg', synthetic_image(width, height, options['seed'] + 1000 + index))[1].tobytes()
+            for index in range(iterations)
+        ]
+        repeated = cv2.imencode('.jpg', image)[1].tobytes()
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        reset_detector()
+        reset_result_cache()
+        try:
+            client = Client()
+
+            def post(data):
+                upload = SimpleUploadedFile('bench.jpg', data, content_type='image/jpeg')
+                response = client.post('/api/detections/upload_and_detect/', {'image': upload})
+                if response.status_code not in (200, 201):
+                    raise RuntimeError(f'Upload failed with {response.status_code}: {response.content[:200]}')
+
+            post(repeated)  # prime the cache for the hit path
+            latencies, elapsed = run_serial(post, encoded)
+            miss = summarize(latencies, iterations, elapsed)
+            latencies, elapsed = run_serial(post, [repeated] * iterations)
+            hit = summarize(latencies, iterations, elapsed)
+        finally:
+            reset_detector()
+            reset_result_cache()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        return {f'view_upload_miss/{label}': miss, f'view_upload_hit/{label}': hit}
+
+    def report(self, scenarios):
+        self.stdout.write(f"{'scenario':<34}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name:<34}{result['throughput_images_per_s']:>10.1f}{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            )
+
+    def compare(self, scenarios, path):
+        with open(path) as f:
+            previous = json.load(f)['scenarios']
+        self.stdout.write(f'\nThroughput relative to {path}:')
+        for name, result in scenarios.items():
+            if name in previous and previous[name]['throughput_images_per_s']:
+                ratio = result['throughput_images_per_s'] / previous[name]['throughput_images_per_s']
+                self.stdout.write(f'{name:<34}{ratio:>9.2f}x')
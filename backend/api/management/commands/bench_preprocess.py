@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.cv_model import TrashDetectionModel
+
+
+def legacy_preprocess(image, size):
+    """The original preprocess_image: stretch resize with full-size temporaries"""
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image = cv2.resize(image, (size, size))
+    image = image.astype(np.float32) / 255.0
+    image = np.expand_dims(image, axis=0)
+    return image
+
+
+def blob_preprocess(image, size):
+    """Stretch resize through cv2.dnn.blobFromImage, allocating a new blob per call"""
+    return cv2.dnn.blobFromImage(image, 1 / 255.0, (size, size), swapRB=True, crop=False)
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark letterbox preprocessing against the previous implementations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--sizes', default='640x480,1920x1080,4032x3024',
+                            help='Comma-separated WIDTHxHEIGHT source resolutions')
+        parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this file')
+
+    def measure(self, function, image, iterations):
+        function(image)  # warm buffers and caches
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            function(image)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        function(image)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'median_ms': statistics.median(timings),
+            'p95_ms': sorted(timings)[int(len(timings) * 0.95) - 1],
+            'peak_alloc_kb': peak / 1024,
+        }
+
+    def handle(self, *args, **options):
+        model = TrashDetectionModel(model_path='')
+        size = model.input_size
+        rng = np.random.default_rng(0)
+        candidates = {
+            'legacy': lambda image: legacy_preprocess(image, size),
+            'blob_from_image': lambda image: blob_preprocess(image, size),
+            'letterbox': model.preprocess_image,
+        }
+
+        results = {}
+        for spec in options['sizes'].split(','):
+            width, height = (int(value) for value in spec.lower().split('x'))
+            image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+            results[spec] = {
+                name: self.measure(function, image, options['iterations'])
+                for name, function in candidates.items()
+            }
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+        self.stdout.write(json.dumps(results, indent=2))
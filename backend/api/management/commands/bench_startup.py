@@ -0,0 +1,69 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter so nothing is already imported or loaded
+CHILD_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecovision.settings')
+django.setup()
+import ecovision.urls  # imports every view module, as the first request would
+ready = time.perf_counter()
+heavy = sorted(name for name in ('cv2', 'numpy') if name in sys.modules)
+from api.cv_model import warm_up
+warm_up()
+warmed = time.perf_counter()
+print(json.dumps({
+    'startup_ms': (ready - started) * 1000,
+    'warm_up_ms': (warmed - ready) * 1000,
+    'heavy_modules_at_startup': heavy,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure process startup time and first-use model load time in fresh interpreters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--model', default=None, help='ONNX model to load (defaults to TRASH_MODEL_PATH)')
+        parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env['TRASH_MODEL_WARMUP'] = 'False'
+        if options['model'] is not None:
+            env['TRASH_MODEL_PATH'] = options['model']
+
+        runs = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-c', CHILD_SCRIPT],
+                cwd=settings.BASE_DIR, env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result['process_ms'] = (time.perf_counter() - started) * 1000
+            runs.append(result)
+
+        summary = {'runs': len(runs), 'heavy_modules_at_startup': runs[-1]['heavy_modules_at_startup']}
+        for key in ('startup_ms', 'warm_up_ms', 'process_ms'):
+            values = [run[key] for run in runs]
+            summary[key] = {
+                'median': statistics.median(values),
+                'min': min(values),
+                'max': max(values),
+            }
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(summary, f, indent=2)
+        self.stdout.write(json.dumps(summary, indent=2))
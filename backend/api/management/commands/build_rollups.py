@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import compact_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Compact finished days of hourly rollups into daily buckets (run hourly), '
+        'or rebuild every rollup from the source tables with --rebuild'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute all buckets from TrashDetection and CleanupTask')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = rebuild_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups; {rows} daily buckets'))
+        else:
+            rows = compact_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Compacted {rows} daily buckets'))
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from api.onnx_fixture import write_fixture_model
+
+
+class Command(BaseCommand):
+    help = 'Write a tiny YOLOv8-shaped ONNX model for local development and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output .onnx file')
+        parser.add_argument('--num-classes', type=int, default=10)
+        parser.add_argument('--input-size', type=int, default=640)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        directory = os.path.dirname(options['path'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_fixture_model(
+            options['path'],
+            num_classes=options['num_classes'],
+            input_size=options['input_size'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fixture model written to {options['path']}"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.response_cache import DETECTIONS, invalidate
+from api.stats import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the pre-aggregated detection counters from the TrashDetection table'
+
+    def handle(self, *args, **options):
+        rows = rebuild_counters()
+        invalidate(DETECTIONS)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} detection counters'))
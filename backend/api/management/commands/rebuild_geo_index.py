@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.geo import rebuild_geo_columns
+from api.models import RobotRequest, TrashDetection
+
+
+class Command(BaseCommand):
+    help = 'Recompute the indexed latitude/longitude/geo_cell columns from the location JSON'
+
+    def handle(self, *args, **options):
+        for model in (TrashDetection, RobotRequest):
+            rows = rebuild_geo_columns(model)
+            self.stdout.write(self.style.SUCCESS(f'Re-indexed {rows} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,241 @@
+import heapq
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api.dispatch import FleetIndex, get_dispatcher
+from api.geo import haversine_meters, parse_bbox
+from api.management.commands.bench_detection import summarize
+from api.models import Robot
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a synthetic stream of robot requests against the dispatcher. The fleet index '
+        'is driven on a simulated clock (robots travel, clean for --service-minutes and become '
+        'idle where they finished); dispatch latency is measured in wall-clock time. '
+        '--verify checks the first dispatches against a brute-force search and --db-requests '
+        'additionally times the full contact-robot endpoint on a test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--robots', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--rate', type=float, default=3.0,
+                            help='Requests per simulated second (a 5000-robot fleet sustains about 4)')
+        parser.add_argument('--bbox', default='121.30,31.10,121.70,31.35',
+                            help='min_lng,min_lat,max_lng,max_lat of the service area')
+        parser.add_argument('--service-minutes', type=float, default=10.0, help='Time spent at each request')
+        parser.add_argument('--verify', type=int, default=500, help='Dispatches checked against brute force')
+        parser.add_argument('--db-requests', type=int, default=0,
+                            help='Also post this many requests to /api/contact-robot/ on a test database')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='Result file (default: benchmarks/dispatch-<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        area = parse_bbox(options['bbox'])
+        rng = random.Random(options['seed'])
+        fleet = [
+            (f'SIM_{index:05d}', *self.point(rng, area), rng.choice((1.2, 1.5, 2.0)))
+            for index in range(options['robots'])
+        ]
+        requests = [self.point(rng, area) for _ in range(options['requests'])]
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'options': {
+                key: options[key]
+                for key in ('robots', 'requests', 'rate', 'bbox', 'service_minutes', 'verify', 'db_requests', 'seed')
+            },
+            'settings': {
+                key: getattr(settings, key)
+                for key in ('DISPATCH_CELL_DEGREES', 'DISPATCH_MAX_DISTANCE_METERS', 'DISPATCH_ROUTE_FACTOR')
+            },
+            'simulation': self.simulate(fleet, requests, rng, options),
+        }
+        if options['db_requests']:
+            results['endpoint'] = self.bench_endpoint(fleet, requests[:options['db_requests']])
+
+        json_path = options['json_path'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"dispatch-{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.report(results)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {json_path}'))
+
+    @staticmethod
+    def point(rng, area):
+        min_lat, min_lng, max_lat, max_lng = area
+        return rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)
+
+    @staticmethod
+    def brute_force(index, lat, lng, max_distance):
+        best = None
+        for robots in index._cells.values():
+            for robot_lat, robot_lng, speed in robots.values():
+                distance = haversine_meters(lat, lng, robot_lat, robot_lng)
+                if distance <= max_distance:
+                    eta = distance * settings.DISPATCH_ROUTE_FACTOR / speed
+                    best = eta if best is None else min(best, eta)
+        return best
+
+    def simulate(self, fleet, requests, rng, options):
+        max_distance = settings.DISPATCH_MAX_DISTANCE_METERS
+        service = options['service_minutes'] * 60
+        index = FleetIndex(settings.DISPATCH_CELL_DEGREES)
+        speeds = {}
+        for robot_id, lat, lng, speed in fleet:
+            index.add(robot_id, lat, lng, speed)
+            speeds[robot_id] = speed
+
+        busy = []  # (free at, robot_id, lat, lng)
+        queued = deque()  # (requested at, lat, lng)
+        latencies, etas, waits = [], [], []
+        mismatches = checked = max_queue = 0
+        clock = 0.0
+        dispatch_time = 0.0
+
+        def dispatch(lat, lng, requested_at):
+            nonlocal mismatches, checked, dispatch_time
+            expected = None
+            if checked < options['verify']:
+                expected = self.brute_force(index, lat, lng, max_distance)
+            started = time.perf_counter()
+            candidate = index.claim_nearest(lat, lng, max_distance)
+            elapsed = time.perf_counter() - started
+            dispatch_time += elapsed
+            latencies.append(elapsed * 1000)
+            if checked < options['verify']:
+                checked += 1
+                got = candidate[0] if candidate else None
+                if (got is None) != (expected is None) or (got is not None and not math.isclose(got, expected)):
+                    mismatches += 1
+            if candidate is None:
+                return False
+            eta, distance, robot_id = candidate
+            etas.append(eta / 60)
+            waits.append((clock - requested_at) / 60)
+            heapq.heappush(busy, (clock + eta + service, robot_id, lat, lng))
+            return True
+
+        def release(robot_id, lat, lng):
+            # Like Dispatcher.release: take the oldest queued request within reach, else go idle
+            for position, (requested_at, request_lat, request_lng) in enumerate(queued):
+                distance = haversine_meters(lat, lng, request_lat, request_lng)
+                if distance <= max_distance:
+                    del queued[position]
+                    eta = distance * settings.DISPATCH_ROUTE_FACTOR / speeds[robot_id]
+                    etas.append(eta / 60)
+                    waits.append((clock - requested_at) / 60)
+                    heapq.heappush(busy, (clock + eta + service, robot_id, request_lat, request_lng))
+                    return
+            index.add(robot_id, lat, lng, speeds[robot_id])
+
+        for lat, lng in requests:
+            clock += rng.expovariate(options['rate'])
+            while busy and busy[0][0] <= clock:
+                free_at, robot_id, robot_lat, robot_lng = heapq.heappop(busy)
+                release(robot_id, robot_lat, robot_lng)
+            if not dispatch(lat, lng, clock):
+                queued.append((clock, lat, lng))
+                max_queue = max(max_queue, len(queued))
+
+        result = summarize(latencies, len(latencies), dispatch_time)
+        result['lookups'] = result.pop('requests')
+        result['requests'] = len(requests)
+        result['dispatches_per_s'] = result.pop('throughput_images_per_s')
+        result.pop('images')
+        etas.sort()
+        result.update({
+            'simulated_seconds': clock,
+            'dispatched': len(etas),
+            'queued_at_end': len(queued),
+            'max_queue': max_queue,
+            'mean_eta_min': statistics.fmean(etas) if etas else None,
+            'p95_eta_min': etas[int((len(etas) - 1) * 0.95)] if etas else None,
+            'mean_wait_min': statistics.fmean(waits) if waits else None,
+            'verified': checked,
+            'mismatches': mismatches,
+        })
+        return result
+
+    def bench_endpoint(self, fleet, requests):
+        """Time /api/contact-robot/ end to end against a test database holding the fleet"""
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        dispatcher = get_dispatcher()
+        try:
+            robots = [
+                Robot(robot_id=robot_id, location={'lat': lat, 'lng': lng}, speed_mps=speed)
+                for robot_id, lat, lng, speed in fleet
+            ]
+            for robot in robots:
+                robot.index_location()
+            Robot.objects.bulk_create(robots, batch_size=1000)
+            dispatcher.reset()
+
+            http = Client()
+            latencies, dispatched = [], 0
+            started = time.perf_counter()
+            for lat, lng in requests:
+                call_started = time.perf_counter()
+                response = http.post(
+                    '/api/contact-robot/', {'location': {'lat': lat, 'lng': lng}}, content_type='application/json'
+                )
+                latencies.append((time.perf_counter() - call_started) * 1000)
+                dispatched += response.json().get('status') == 'dispatched'
+            elapsed = time.perf_counter() - started
+        finally:
+            dispatcher.reset()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        result = summarize(latencies, len(latencies), elapsed)
+        result['requests_per_s'] = result.pop('throughput_images_per_s')
+        result.pop('images')
+        result['dispatched'] = dispatched
+        return result
+
+    def report(self, results):
+        sim = results['simulation']
+        self.stdout.write(
+            f"simulation: {sim['requests']} requests over {sim['simulated_seconds']:.0f} simulated s, "
+            f"{sim['dispatched']} dispatched, queue max {sim['max_queue']}, {sim['queued_at_end']} left"
+        )
+        self.stdout.write(
+            f"  {sim['lookups']} lookups, p50 {sim['p50_ms'] * 1000:.1f} us, p99 {sim['p99_ms'] * 1000:.1f} us, "
+            f"{sim['dispatches_per_s']:.0f} dispatches/s"
+        )
+        if sim['mean_eta_min'] is not None:
+            self.stdout.write(
+                f"  eta mean {sim['mean_eta_min']:.1f} min, p95 {sim['p95_eta_min']:.1f} min, "
+                f"queue wait mean {sim['mean_wait_min']:.1f} min"
+            )
+        self.stdout.write(f"  verified {sim['verified']} against brute force, {sim['mismatches']} mismatches")
+        if 'endpoint' in results:
+            endpoint = results['endpoint']
+            self.stdout.write(
+                f"endpoint: {endpoint['requests_per_s']:.0f} req/s, p50 {endpoint['p50_ms']:.2f} ms, "
+                f"p95 {endpoint['p95_ms']:.2f} ms, {endpoint['dispatched']} dispatched"
+            )
@@ -0,0 +1,223 @@
+"""
+Lightweight in-process metrics for the detection pipeline.
+
+Hot-path code wraps each stage in ``with timed('forward'):``. When
+METRICS_ENABLED is off, timed() returns a shared no-op context manager, so
+the instrumentation costs one settings lookup per stage.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Upper bounds in milliseconds, roughly exponential
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+        labels = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else 0.0,
+            'buckets': dict(zip(labels, counts)),
+        }
+
+
+class RollingWindow:
+    """Thread-safe ring buffer of the most recent samples, for percentiles"""
+
+    def __init__(self, size):
+        self.size = size
+        self._samples = [0.0] * size
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._samples[self._next] = value
+            self._next = (self._next + 1) % self.size
+            self._count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = self._samples[:min(self._count, self.size)]
+            count = self._count
+        if not samples:
+            return {'count': count, 'window': 0}
+
+        samples.sort()
+        last = len(samples) - 1
+        return {
+            'count': count,
+            'window': len(samples),
+            'mean_ms': sum(samples) / len(samples),
+            'p50_ms': samples[int(last * 0.50)],
+            'p95_ms': samples[int(last * 0.95)],
+            'p99_ms': samples[int(last * 0.99)],
+            'max_ms': samples[last],
+        }
+
+
+class StageMetrics:
+    """Rolling latency windows keyed by pipeline stage name"""
+
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, value):
+        window = self._windows.get(stage)
+        if window is None:
+            with self._lock:
+                window = self._windows.setdefault(stage, RollingWindow(self.window_size))
+        window.observe(value)
+
+    def summary(self):
+        with self._lock:
+            windows = dict(self._windows)
+        return {stage: window.summary() for stage, window in sorted(windows.items())}
+
+
+stage_metrics = StageMetrics(settings.METRICS_WINDOW_SIZE)
+
+# Stage durations of the request being served on this thread/task, for Server-Timing
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def record(stage, value):
+    """Record `value` milliseconds for `stage` globally and on the current request"""
+    stage_metrics.observe(stage, value)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + value
+
+
+def record_many(stages):
+    for stage, value in stages.items():
+        record(stage, value)
+
+
+def current_stages():
+    """The stage dict of the current request, or None outside a collected request"""
+    return _request_stages.get()
+
+
+@contextmanager
+def collect():
+    """Collect the stage durations recorded inside the block into a fresh dict"""
+    stages = {}
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, (time.perf_counter() - self.started) * 1000.0)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    """Context manager timing one pipeline stage; a no-op when METRICS_ENABLED is off"""
+    if not settings.METRICS_ENABLED:
+        return _NULL_TIMER
+    return _StageTimer(stage)
+
+
+def server_timing(stages):
+    return ', '.join(f'{stage};dur={value:.2f}' for stage, value in stages.items())
+
+
+class StageTimingMiddleware:
+    """
+    Times the whole request as the 'total' stage and, with
+    METRICS_SERVER_TIMING, reports every stage recorded during the request
+    in a Server-Timing response header. Works in both sync and async
+    middleware chains, so async views are not pushed onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        with collect() as stages:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            record('total', (time.perf_counter() - started) * 1000.0)
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(stages)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        with collect() as stages:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            record('total', (time.perf_counter() - started) * 1000.0)
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(stages)
+        return response
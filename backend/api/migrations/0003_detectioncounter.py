@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from api.stats import rebuild_counters
+
+    rebuild_counters(
+        detection_model=apps.get_model('api', 'TrashDetection'),
+        counter_model=apps.get_model('api', 'DetectionCounter'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_cooperationrequest_robotrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10)),
+                ('trash_class', models.CharField(blank=True, max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='detectioncounter',
+            constraint=models.UniqueConstraint(fields=('period', 'trash_class'), name='unique_detection_counter'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    from api.rollups import rebuild_rollups
+
+    rebuild_rollups(
+        detection_model=apps.get_model('api', 'TrashDetection'),
+        task_model=apps.get_model('api', 'CleanupTask'),
+        bucket_model=apps.get_model('api', 'RollupBucket'),
+        watermark_model=apps.get_model('api', 'RollupWatermark'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_detectioncounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('metric', models.CharField(max_length=40)),
+                ('dimension', models.CharField(blank=True, max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=4, unique=True)),
+                ('compacted_until', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rollupbucket',
+            constraint=models.UniqueConstraint(fields=('level', 'metric', 'bucket_start', 'dimension'), name='unique_rollup_bucket'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+def backfill_geo_columns(apps, schema_editor):
+    from api.geo import rebuild_geo_columns
+
+    rebuild_geo_columns(apps.get_model('api', 'TrashDetection'))
+    rebuild_geo_columns(apps.get_model('api', 'RobotRequest'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_rollupbucket_rollupwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='robotrequest',
+            name='geo_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='robotrequest',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='robotrequest',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='trashdetection',
+            name='geo_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='trashdetection',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='trashdetection',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_geo_columns, migrations.RunPython.noop),
+    ]
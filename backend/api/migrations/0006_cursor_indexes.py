@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_geo_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cleanuptask',
+            index=models.Index(fields=['created_at', 'id'], name='task_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cooperationrequest',
+            index=models.Index(fields=['created_at', 'id'], name='cooperation_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robotrequest',
+            index=models.Index(fields=['request_time', 'id'], name='robot_request_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trashdetection',
+            index=models.Index(fields=['detected_at', 'id'], name='detection_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cleanuptask',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='task_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robotrequest',
+            index=models.Index(fields=['status', 'request_time', 'id'], name='robot_request_status_idx'),
+        ),
+    ]
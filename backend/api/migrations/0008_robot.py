@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_status_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Robot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField(blank=True, editable=False, null=True)),
+                ('longitude', models.FloatField(blank=True, editable=False, null=True)),
+                ('geo_cell', models.BigIntegerField(blank=True, db_index=True, editable=False, null=True)),
+                ('robot_id', models.CharField(max_length=50, unique=True)),
+                ('location', models.JSONField(default=dict)),
+                ('state', models.CharField(choices=[('idle', 'Idle'), ('dispatched', 'Dispatched'), ('charging', 'Charging'), ('offline', 'Offline')], default='idle', max_length=20)),
+                ('battery', models.FloatField(default=100.0)),
+                ('speed_mps', models.FloatField(default=1.5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('current_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.robotrequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state'], name='robot_state_idx')],
+            },
+        ),
+    ]
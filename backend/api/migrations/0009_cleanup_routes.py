@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_robot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cleanuptask',
+            name='route_order',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CleanupRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('completed', 'Completed')], default='active', max_length=20)),
+                ('stops', models.PositiveIntegerField(default=0)),
+                ('distance_m', models.FloatField(default=0.0)),
+                ('eta_minutes', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('robot', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='routes', to='api.robot')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cleanuptask',
+            name='route',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='api.cleanuproute'),
+        ),
+    ]
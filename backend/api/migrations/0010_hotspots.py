@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_cleanup_routes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hotspot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('closed', 'Closed')], default='open', max_length=20)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('cell', models.BigIntegerField()),
+                ('detection_count', models.PositiveIntegerField(default=0)),
+                ('object_count', models.PositiveIntegerField(default=0)),
+                ('object_counts', models.JSONField(default=dict)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'cell', 'last_seen'], name='hotspot_lookup_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='cleanuptask',
+            name='hotspot',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task', to='api.hotspot'),
+        ),
+        migrations.AddField(
+            model_name='trashdetection',
+            name='hotspot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='detections', to='api.hotspot'),
+        ),
+    ]
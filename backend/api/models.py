@@ -1,16 +1,54 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
-class TrashDetection(models.Model):
+from .geo import geo_columns
+
+class GeoIndexedModel(models.Model):
+    """
+    Copies the lat/lng of `location` into indexed columns on save, for the
+    bbox/radius filters in api.geo. Subclasses define `location`.
+    """
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geo_cell = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+    
+    class Meta:
+        abstract = True
+    
+    def index_location(self):
+        """Refresh the geo columns; bulk_create callers must call this themselves"""
+        self.latitude, self.longitude, self.geo_cell = geo_columns(self.location)
+    
+    def save(self, *args, **kwargs):
+        self.index_location()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'latitude', 'longitude', 'geo_cell'}
+        super().save(*args, **kwargs)
+
+class TrashDetection(GeoIndexedModel):
     image_url = models.URLField(max_length=500)
     detected_objects = models.JSONField(default=list)
     confidence_scores = models.JSONField(default=list)
     location = models.JSONField(default=dict)  # {"lat": 0.0, "lng": 0.0, "address": ""}
     detected_at = models.DateTimeField(default=timezone.now)
     processed = models.BooleanField(default=False)
+    # Set when the detection was merged into a hotspot (api.hotspots)
+    hotspot = models.ForeignKey(
+        'Hotspot', null=True, blank=True, on_delete=models.SET_NULL, related_name='detections'
+    )
     
-    class Meta:
+    class Meta(GeoIndexedModel.Meta):
         ordering = ['-detected_at']
+        indexes = [
+            # Keyset pagination order of the list endpoint
+            models.Index(fields=['detected_at', 'id'], name='detection_cursor_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # The post_save handlers update DetectionCounter and the rollups; keep them in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Detection at {self.detected_at}"
@@ -26,6 +64,34 @@ class TrashCategory(models.Model):
     class Meta:
         verbose_name_plural = "Trash Categories"
 
+class Hotspot(models.Model):
+    """
+    Detections close in space and time, merged into one cleanup task.
+    The position is the running centroid of its detections.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('closed', 'Closed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    cell = models.BigIntegerField()  # HOTSPOT_RADIUS_METERS grid cell of the centroid
+    detection_count = models.PositiveIntegerField(default=0)
+    object_count = models.PositiveIntegerField(default=0)
+    object_counts = models.JSONField(default=dict)  # {"bottle": 12, ...}
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'cell', 'last_seen'], name='hotspot_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Hotspot {self.id} - {self.detection_count} detections - {self.status}"
+
 class CleanupTask(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -40,11 +106,32 @@ class CleanupTask(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     completed_at = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
+    # Set by the route planner (api.routing): the route and the task's stop number on it
+    route = models.ForeignKey(
+        'CleanupRoute', null=True, blank=True, on_delete=models.SET_NULL, related_name='tasks'
+    )
+    route_order = models.PositiveIntegerField(null=True, blank=True)
+    # The hotspot (api.hotspots) this task cleans up; later detections there join it
+    hotspot = models.OneToOneField(
+        Hotspot, null=True, blank=True, on_delete=models.SET_NULL, related_name='task'
+    )
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='task_cursor_idx'),
+            # pending_tasks and other status-filtered lists, newest first
+            models.Index(fields=['status', 'created_at', 'id'], name='task_status_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # Status transitions are rolled up by a post_save handler in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Task for detection {self.detection.id} - {self.status}"
 
-class RobotRequest(models.Model):
+class RobotRequest(GeoIndexedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('dispatched', 'Dispatched'),
@@ -60,9 +147,60 @@ class RobotRequest(models.Model):
     robot_id = models.CharField(max_length=50, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['request_time', 'id'], name='robot_request_cursor_idx'),
+            models.Index(fields=['status', 'request_time', 'id'], name='robot_request_status_idx'),
+        ]
+    
     def __str__(self):
         return f"Robot Request {self.id} - {self.status}"
 
+class Robot(GeoIndexedModel):
+    """A cleanup robot of the fleet; api.dispatch assigns robot requests to idle ones"""
+    STATE_CHOICES = [
+        ('idle', 'Idle'),
+        ('dispatched', 'Dispatched'),
+        ('charging', 'Charging'),
+        ('offline', 'Offline'),
+    ]
+    
+    robot_id = models.CharField(max_length=50, unique=True)
+    location = models.JSONField(default=dict)  # current position, {"lat": 0.0, "lng": 0.0}
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='idle')
+    battery = models.FloatField(default=100.0)  # percent
+    speed_mps = models.FloatField(default=1.5)
+    current_request = models.ForeignKey(
+        RobotRequest, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['state'], name='robot_state_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.robot_id} - {self.state}"
+
+class CleanupRoute(models.Model):
+    """Ordered cleanup tasks planned for one robot; the tasks carry their stop order"""
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+    ]
+    
+    robot = models.ForeignKey(Robot, null=True, on_delete=models.SET_NULL, related_name='routes')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    stops = models.PositiveIntegerField(default=0)
+    distance_m = models.FloatField(default=0.0)  # straight-line legs from the robot's start
+    eta_minutes = models.IntegerField(default=0)  # to the last stop
+    created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Route {self.id} - {self.stops} stops - {self.status}"
+
 class CooperationRequest(models.Model):
     content = models.TextField()
     contact_info = models.CharField(max_length=255, blank=True)
@@ -70,5 +208,69 @@ class CooperationRequest(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     responded_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='cooperation_cursor_idx'),
+        ]
+    
     def __str__(self):
         return f"Cooperation Request {self.id} - {self.status}"
+
+class DetectionCounter(models.Model):
+    """
+    Pre-aggregated detection counts, kept in step with TrashDetection by
+    the signal handlers in api.signals. `period` is 'all' for all-time
+    totals or an ISO date; a blank `trash_class` counts detections, any
+    other value counts detected objects of that class.
+    """
+    ALL_TIME = 'all'
+    
+    period = models.CharField(max_length=10)
+    trash_class = models.CharField(max_length=100, blank=True)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'trash_class'], name='unique_detection_counter')
+        ]
+    
+    def __str__(self):
+        return f"{self.period} {self.trash_class or 'detections'}: {self.count}"
+
+class RollupBucket(models.Model):
+    """
+    Time-bucketed aggregate maintained by api.rollups. Hourly buckets are
+    updated as rows change; daily buckets are compacted from the hourly
+    ones. `dimension` is the trash class, the task status, or blank.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    LEVEL_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+    
+    level = models.CharField(max_length=4, choices=LEVEL_CHOICES)
+    bucket_start = models.DateTimeField()
+    metric = models.CharField(max_length=40)
+    dimension = models.CharField(max_length=100, blank=True)
+    count = models.BigIntegerField(default=0)
+    total = models.FloatField(default=0.0)  # Sum of a measured value, e.g. completion latency in seconds
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['level', 'metric', 'bucket_start', 'dimension'], name='unique_rollup_bucket'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.metric} {self.dimension or '-'} {self.level} {self.bucket_start}: {self.count}"
+
+class RollupWatermark(models.Model):
+    """Daily buckets are complete for every day before `compacted_until`"""
+    level = models.CharField(max_length=4, unique=True)
+    compacted_until = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.level} rollups until {self.compacted_until}"
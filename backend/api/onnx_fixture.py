@@ -0,0 +1,128 @@
+"""
+Tiny YOLOv8-shaped ONNX model for local development and benchmarks.
+
+The graph is a single strided convolution followed by a sigmoid, a
+per-channel scale and a reshape, which gives the same output layout as an
+exported YOLOv8 detector: [batch, 4 + num_classes, num_anchors] with boxes
+as (cx, cy, w, h) in input pixels. The protobuf is written by hand so the
+``onnx`` package is not needed.
+"""
+import numpy as np
+
+# ONNX enum values
+_FLOAT = 1
+_INT64 = 7
+_ATTR_INT = 2
+_ATTR_INTS = 7
+
+
+def _varint(value):
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _int(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes(field, value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _tensor(name, array):
+    data_type = _INT64 if array.dtype == np.int64 else _FLOAT
+    array = np.ascontiguousarray(array, dtype=np.int64 if data_type == _INT64 else np.float32)
+    msg = b''.join(_int(1, dim) for dim in array.shape)
+    msg += _int(2, data_type)
+    msg += _bytes(8, name)
+    msg += _bytes(9, array.tobytes())
+    return msg
+
+
+def _value_info(name, dims):
+    shape = b''
+    for dim in dims:
+        if isinstance(dim, str):
+            shape += _bytes(1, _bytes(2, dim))
+        else:
+            shape += _bytes(1, _int(1, dim))
+    tensor_type = _int(1, _FLOAT) + _bytes(2, shape)
+    return _bytes(1, name) + _bytes(2, _bytes(1, tensor_type))
+
+
+def _attribute(name, value):
+    if isinstance(value, (list, tuple)):
+        return _bytes(1, name) + b''.join(_int(8, v) for v in value) + _int(20, _ATTR_INTS)
+    return _bytes(1, name) + _int(3, value) + _int(20, _ATTR_INT)
+
+
+def _node(op_type, inputs, outputs, **attributes):
+    msg = b''.join(_bytes(1, name) for name in inputs)
+    msg += b''.join(_bytes(2, name) for name in outputs)
+    msg += _bytes(3, outputs[0])
+    msg += _bytes(4, op_type)
+    msg += b''.join(_bytes(5, _attribute(k, v)) for k, v in attributes.items())
+    return msg
+
+
+def build_fixture_model(num_classes=10, input_size=640, stride=32, seed=0):
+    """Return the serialized bytes of a deterministic YOLOv8-shaped ONNX model."""
+    if input_size % stride:
+        raise ValueError('input_size must be a multiple of stride')
+
+    rng = np.random.default_rng(seed)
+    channels = 4 + num_classes
+    grid = input_size // stride
+
+    weights = rng.normal(0.0, 0.02, size=(channels, 3, stride, stride)).astype(np.float32)
+    bias = np.zeros(channels, dtype=np.float32)
+    bias[4:] = -2.0  # keep most anchors below the default confidence threshold
+    scale = np.ones((1, channels, 1, 1), dtype=np.float32)
+    scale[0, :2] = input_size
+    scale[0, 2:4] = input_size / 4
+    shape = np.array([-1, channels, grid * grid], dtype=np.int64)
+
+    nodes = [
+        _node('Conv', ['images', 'W', 'B'], ['conv'],
+              kernel_shape=[stride, stride], strides=[stride, stride]),
+        _node('Sigmoid', ['conv'], ['act']),
+        _node('Mul', ['act', 'scale'], ['scaled']),
+        _node('Reshape', ['scaled', 'shape'], ['output0']),
+    ]
+    initializers = [
+        _tensor('W', weights),
+        _tensor('B', bias),
+        _tensor('scale', scale),
+        _tensor('shape', shape),
+    ]
+
+    graph = b''.join(_bytes(1, node) for node in nodes)
+    graph += _bytes(2, 'ecovision_fixture')
+    graph += b''.join(_bytes(5, tensor) for tensor in initializers)
+    graph += _bytes(11, _value_info('images', ['batch', 3, input_size, input_size]))
+    graph += _bytes(12, _value_info('output0', ['batch', channels, grid * grid]))
+
+    opset = _bytes(1, '') + _int(2, 13)
+    return _int(1, 8) + _bytes(2, 'ecovision') + _bytes(7, graph) + _bytes(8, opset)
+
+
+def write_fixture_model(path, **kwargs):
+    """Write the fixture model to ``path`` and return the path."""
+    with open(path, 'wb') as f:
+        f.write(build_fixture_model(**kwargs))
+    return path
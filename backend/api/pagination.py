@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class TimeCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the list endpoints. Views set `cursor_ordering`,
+    newest first on their timestamp with the primary key as tie-breaker,
+    so pages stay stable while rows are inserted and every page is an
+    index range scan instead of an OFFSET.
+    """
+    ordering = ('-id',)
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', self.ordering))
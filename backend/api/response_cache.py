@@ -0,0 +1,118 @@
+"""
+Cache of the polled read endpoints (statistics, recent detections, pending
+tasks, categories).
+
+Responses are cached per view and query string in the Django cache named
+by RESPONSE_CACHE_ALIAS: local memory by default, or any shared backend
+(Redis, Memcached) configured through RESPONSE_CACHE_BACKEND. Each entry
+key embeds the current generation of the data scopes the view reads; the
+signal handlers in api.signals bump a scope's generation after every
+committed write to its models, so stale entries are simply never looked up
+again and age out. With the local-memory backend each process only sees
+its own writes, so RESPONSE_CACHE_TTL bounds staleness across processes.
+
+Every cached response carries an ETag over its content; a poll with a
+matching If-None-Match gets 304 without a body.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+DETECTIONS = 'detections'
+TASKS = 'tasks'
+CATEGORIES = 'categories'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def generations(scopes):
+    """Current generation of each scope, starting unseen ones at a fresh value"""
+    cache = get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # A fresh, unique start so entries cached before an eviction never match again
+            cache.add(key, time.time_ns(), timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(scopes):
+    cache = get_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_generation_key(scope))
+        except ValueError:
+            cache.set(_generation_key(scope), time.time_ns(), timeout=None)
+
+
+def invalidate(*scopes):
+    """Drop the cached responses of `scopes` once the current transaction commits"""
+    if settings.RESPONSE_CACHE_ENABLED:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def etag_for(data):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+
+
+def _matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def _conditional(request, data, etag):
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if _matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def cached_response(*scopes):
+    """
+    Cache the 200 responses of a viewset method, keyed on the view, its
+    query parameters and the generations of `scopes`.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not settings.RESPONSE_CACHE_ENABLED:
+                return method(self, request, *args, **kwargs)
+
+            query = sorted(request.query_params.lists())
+            fingerprint = hashlib.sha1(repr((query, args, sorted(kwargs.items()))).encode()).hexdigest()
+            versions = '.'.join(str(value) for value in generations(scopes))
+            key = f'response:{type(self).__name__}.{method.__name__}:{versions}:{fingerprint}'
+
+            cache = get_cache()
+            entry = cache.get(key)
+            if entry is not None:
+                return _conditional(request, *entry)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag = etag_for(response.data)
+            cache.set(key, (response.data, etag), settings.RESPONSE_CACHE_TTL)
+            return _conditional(request, response.data, etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,149 @@
+"""
+Content-hash cache of detection results.
+
+Field devices often re-upload the same photo after a retry. Results are
+keyed on the SHA-256 of the uploaded bytes plus the model version, kept in
+a bounded in-process LRU with a TTL and, optionally, in a directory shared
+by every worker process on the host.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class DetectionResultCache:
+    """
+    Two-tier cache of {'detections': [...], 'detection_id': int | None}
+    entries. The memory tier is an LRU bounded by `max_entries`; the optional
+    disk tier stores one JSON file per key under `disk_dir`. Both tiers
+    expire entries after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(image_digest, model_version):
+        return f'{model_version}-{image_digest}'
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, entry = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return entry
+                del self._entries[key]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+        self._memory_set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self._memory_set(key, entry)
+        self._disk_set(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters['hits'] + counters['disk_hits'] + counters['misses']
+        return {
+            **counters,
+            'entries': size,
+            'max_entries': self.max_entries,
+            'hit_ratio': (counters['hits'] + counters['disk_hits']) / lookups if lookups else 0.0,
+            'disk_tier': bool(self.disk_dir),
+        }
+
+    def _memory_set(self, key, entry):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[-2:], f'{key}.json')
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing result cache entry {key}: {e}")
+
+
+def result_version(model_version, tiling=None):
+    """Version component of a cache key; tiled results depend on the tiling options too"""
+    if tiling is None:
+        return model_version
+    return model_version + '-tiled-' + '-'.join(str(tiling[name]) for name in sorted(tiling))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide result cache, or None when RESULT_CACHE_ENABLED is off"""
+    global _cache
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DetectionResultCache(
+                    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+                    ttl=settings.RESULT_CACHE_TTL,
+                    disk_dir=settings.RESULT_CACHE_DIR or None,
+                )
+    return _cache
+
+
+def reset_result_cache():
+    """Drop the process-wide cache so the next get_result_cache() rebuilds it from settings"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,316 @@
+"""
+Time-bucketed rollups for the analytics endpoint.
+
+Hourly RollupBucket rows are kept in step with TrashDetection and
+CleanupTask by the signal handlers in api.signals. `compact_rollups()` (run
+hourly by the build_rollups command) folds every finished day of hourly
+buckets into daily ones and advances the day watermark; later changes to a
+compacted day update both levels. Range queries read daily buckets for the
+compacted days in the range and hourly buckets for the rest, and
+let the database group them to the requested granularity.
+
+Metrics:
+    detections       detections per bucket
+    objects          detected objects per bucket, by trash class
+    task_status      cleanup task status transitions, by the status entered
+    task_completion  completed tasks, with the summed created -> completed
+                     latency in seconds so the mean can be reported
+
+Detection metrics follow the table: deleting a detection removes it from
+its bucket. Task metrics are events and are not undone when a task changes
+again or is deleted.
+
+Buckets are aligned to UTC.
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import CleanupTask, RollupBucket, RollupWatermark, TrashDetection
+
+HOUR = RollupBucket.HOUR
+DAY = RollupBucket.DAY
+
+DETECTIONS = 'detections'
+OBJECTS = 'objects'
+TASK_STATUS = 'task_status'
+TASK_COMPLETION = 'task_completion'
+METRICS = [DETECTIONS, OBJECTS, TASK_STATUS, TASK_COMPLETION]
+# Metrics broken down by `dimension`, and metrics that report a mean of `total`
+DIMENSIONED = {OBJECTS, TASK_STATUS}
+MEASURED = {TASK_COMPLETION}
+
+GRANULARITIES = ['hour', 'day', 'week', 'month']
+_STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+
+def truncate(value, granularity):
+    """Start of the UTC hour/day/week (Monday)/month containing `value`"""
+    value = value.astimezone(dt_timezone.utc)
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(value, granularity):
+    if granularity == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value + _STEPS[granularity]
+
+
+def detection_rollups(detected_at, detected_objects):
+    """Hourly bucket counts contributed by one detection, keyed on (metric, bucket_start, dimension)"""
+    bucket = truncate(detected_at, HOUR)
+    counts = Counter({(DETECTIONS, bucket, ''): 1})
+    for trash_class in detected_objects or []:
+        counts[(OBJECTS, bucket, str(trash_class))] += 1
+    return counts
+
+
+def task_rollups(task, previous_status, changed_at):
+    """
+    Hourly bucket counts and totals for a task entering a new status.
+    `previous_status` is None for a new task, whose initial status is
+    counted at `created_at`; other transitions are counted at `changed_at`.
+    """
+    counts, totals = Counter(), Counter()
+    if task.status == previous_status:
+        return counts, totals
+
+    at = task.created_at if previous_status is None else changed_at
+    completed = task.status == 'completed' and task.completed_at is not None
+    if completed:
+        at = task.completed_at
+    bucket = truncate(at, HOUR)
+    counts[(TASK_STATUS, bucket, task.status)] += 1
+    if completed:
+        counts[(TASK_COMPLETION, bucket, '')] += 1
+        totals[(TASK_COMPLETION, bucket, '')] += max(0.0, (task.completed_at - task.created_at).total_seconds())
+    return counts, totals
+
+
+def compacted_until(watermark_model=RollupWatermark):
+    return watermark_model.objects.filter(level=DAY).values_list('compacted_until', flat=True).first()
+
+
+def _add(level, bucket_start, metric, dimension, count, total):
+    rows = RollupBucket.objects.filter(level=level, metric=metric, bucket_start=bucket_start, dimension=dimension)
+    if rows.update(count=F('count') + count, total=F('total') + total):
+        return
+    try:
+        with transaction.atomic():
+            RollupBucket.objects.create(
+                level=level, metric=metric, bucket_start=bucket_start, dimension=dimension,
+                count=count, total=total,
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(count=F('count') + count, total=F('total') + total)
+
+
+def apply_rollups(counts, totals=None, sign=1):
+    """
+    Add (sign=1) or subtract (sign=-1) hourly bucket deltas atomically.
+    Deltas that fall on an already compacted day are applied to its daily
+    bucket as well.
+    """
+    totals = totals or Counter()
+    keys = sorted(set(counts) | set(totals))
+    if not keys:
+        return
+    with transaction.atomic():
+        watermark = compacted_until()
+        for key in keys:
+            count, total = counts[key] * sign, totals[key] * sign
+            if not count and not total:
+                continue
+            metric, bucket_start, dimension = key
+            _add(HOUR, bucket_start, metric, dimension, count, total)
+            if watermark is not None and bucket_start < watermark:
+                _add(DAY, truncate(bucket_start, DAY), metric, dimension, count, total)
+
+
+def compact_rollups(now=None, bucket_model=RollupBucket, watermark_model=RollupWatermark):
+    """
+    Build daily buckets from the hourly ones for every finished day after
+    the watermark, advance it, and drop hourly buckets older than
+    ROLLUP_HOURLY_RETENTION_DAYS. Returns the number of daily rows written.
+    """
+    until = truncate(now or timezone.now(), DAY)
+    with transaction.atomic():
+        watermark = watermark_model.objects.select_for_update().filter(level=DAY).first()
+        if watermark is not None:
+            since = watermark.compacted_until
+        else:
+            first = (
+                bucket_model.objects.filter(level=HOUR).order_by('bucket_start')
+                .values_list('bucket_start', flat=True).first()
+            )
+            since = truncate(first, DAY) if first is not None else until
+        if since > until:
+            return 0
+
+        # On SQLite deleting first takes the write lock, so no hourly update
+        # can land between the aggregation and the watermark move
+        bucket_model.objects.filter(level=DAY, bucket_start__gte=since, bucket_start__lt=until).delete()
+        rows = (
+            bucket_model.objects.filter(level=HOUR, bucket_start__gte=since, bucket_start__lt=until)
+            .annotate(day=Trunc('bucket_start', 'day', tzinfo=dt_timezone.utc))
+            .values('day', 'metric', 'dimension')
+            .annotate(day_count=Sum('count'), day_total=Sum('total'))
+        )
+        daily = [
+            bucket_model(
+                level=DAY, bucket_start=row['day'], metric=row['metric'], dimension=row['dimension'],
+                count=row['day_count'], total=row['day_total'],
+            )
+            for row in rows
+            if row['day_count'] or row['day_total']
+        ]
+        bucket_model.objects.bulk_create(daily, batch_size=1000)
+        watermark_model.objects.update_or_create(level=DAY, defaults={'compacted_until': until})
+
+        if settings.ROLLUP_HOURLY_RETENTION_DAYS:
+            cutoff = min(until, truncate(until - timedelta(days=settings.ROLLUP_HOURLY_RETENTION_DAYS), DAY))
+            bucket_model.objects.filter(level=HOUR, bucket_start__lt=cutoff).delete()
+    return len(daily)
+
+
+def rebuild_rollups(detection_model=TrashDetection, task_model=CleanupTask,
+                    bucket_model=RollupBucket, watermark_model=RollupWatermark, now=None, batch_size=2000):
+    """
+    Recompute every bucket from the source tables; used for backfills.
+    Tasks only record when they were created and completed, so earlier
+    intermediate transitions are not recoverable: each task counts as
+    entering 'pending' at created_at and 'completed' at completed_at.
+    Migrations pass their historical models.
+    """
+    counts, totals = Counter(), Counter()
+    rows = detection_model.objects.values_list('detected_at', 'detected_objects')
+    for detected_at, detected_objects in rows.iterator(chunk_size=batch_size):
+        counts.update(detection_rollups(detected_at, detected_objects))
+
+    rows = task_model.objects.values_list('created_at', 'completed_at')
+    for created_at, completed_at in rows.iterator(chunk_size=batch_size):
+        counts[(TASK_STATUS, truncate(created_at, HOUR), 'pending')] += 1
+        if completed_at is not None:
+            bucket = truncate(completed_at, HOUR)
+            counts[(TASK_STATUS, bucket, 'completed')] += 1
+            counts[(TASK_COMPLETION, bucket, '')] += 1
+            totals[(TASK_COMPLETION, bucket, '')] += max(0.0, (completed_at - created_at).total_seconds())
+
+    with transaction.atomic():
+        bucket_model.objects.all().delete()
+        watermark_model.objects.all().delete()
+        bucket_model.objects.bulk_create(
+            [
+                bucket_model(
+                    level=HOUR, metric=metric, bucket_start=bucket_start, dimension=dimension,
+                    count=count, total=totals[(metric, bucket_start, dimension)],
+                )
+                for (metric, bucket_start, dimension), count in counts.items()
+                if count
+            ],
+            batch_size=batch_size,
+        )
+        return compact_rollups(now=now, bucket_model=bucket_model, watermark_model=watermark_model)
+
+
+def plan_segments(start, end, granularity):
+    """
+    Split [start, end) into (level, start, end) segments: daily buckets for
+    whole compacted days when the granularity is a day or coarser, hourly
+    buckets for everything else.
+    """
+    if granularity == 'hour':
+        return [(HOUR, start, end)]
+    watermark = compacted_until()
+    day_from = truncate(start, DAY)
+    if day_from < start:
+        day_from += timedelta(days=1)
+    day_to = truncate(end, DAY)
+    if watermark is not None:
+        day_to = min(day_to, watermark)
+    if watermark is None or day_from >= day_to:
+        return [(HOUR, start, end)]
+
+    segments = [(DAY, day_from, day_to)]
+    if start < day_from:
+        segments.insert(0, (HOUR, start, day_from))
+    if day_to < end:
+        segments.append((HOUR, day_to, end))
+    return segments
+
+
+def query_rollups(metric, start, end, granularity='day', dimension=None):
+    """
+    Aggregate `metric` over [start, end) into `granularity` buckets.
+    Bounds are widened to whole hours for hourly queries and to whole days
+    otherwise, so hourly buckets dropped by retention are never needed for
+    a partial day; a partial first week or month only counts the days
+    inside the range. Raises ValueError when the range spans more than
+    ANALYTICS_MAX_BUCKETS buckets.
+    """
+    unit = HOUR if granularity == 'hour' else DAY
+    start = truncate(start, unit)
+    if truncate(end, unit) != end:
+        end = next_period(truncate(end, unit), unit)
+
+    periods = []
+    period = truncate(start, granularity)
+    while period < end:
+        periods.append(period)
+        if len(periods) > settings.ANALYTICS_MAX_BUCKETS:
+            raise ValueError(
+                f'Range spans more than {settings.ANALYTICS_MAX_BUCKETS} {granularity} buckets; '
+                'use a coarser granularity or a shorter range'
+            )
+        period = next_period(period, granularity)
+
+    values = {period: {} for period in periods}
+    segments = plan_segments(start, end, granularity)
+    for level, segment_start, segment_end in segments:
+        rows = RollupBucket.objects.filter(
+            level=level, metric=metric, bucket_start__gte=segment_start, bucket_start__lt=segment_end
+        )
+        if dimension is not None:
+            rows = rows.filter(dimension=dimension)
+        rows = (
+            rows.annotate(period=Trunc('bucket_start', granularity, tzinfo=dt_timezone.utc))
+            .values('period', 'dimension')
+            .annotate(bucket_count=Sum('count'), bucket_total=Sum('total'))
+        )
+        for row in rows:
+            count, total = values[row['period']].get(row['dimension'], (0, 0.0))
+            values[row['period']][row['dimension']] = (count + row['bucket_count'], total + row['bucket_total'])
+
+    buckets = []
+    for period in periods:
+        by_dimension = values[period]
+        count = sum(count for count, _ in by_dimension.values())
+        bucket = {'start': period.isoformat(), 'count': count}
+        if metric in DIMENSIONED:
+            bucket['values'] = {key: count for key, (count, _) in sorted(by_dimension.items()) if count}
+        if metric in MEASURED:
+            total = sum(total for _, total in by_dimension.values())
+            bucket['mean'] = total / count if count else None
+        buckets.append(bucket)
+
+    return {
+        'metric': metric,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'levels': [level for level, _, _ in segments],
+        'buckets': buckets,
+    }
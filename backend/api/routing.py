@@ -0,0 +1,344 @@
+"""
+Batch route planning of pending cleanup tasks over the idle fleet.
+
+Task and robot positions are projected to local meters (equirectangular
+around their centroid, as in api.geo) and every distance is computed as
+a numpy matrix, never pair by pair in Python (numpy is imported inside
+the functions that use it, as in api.cv_model, since the signal handlers
+import this module at startup). Planning runs in three steps:
+
+1. Assignment: tasks, closest first, go to their nearest robot that still
+   has room (ROUTE_MAX_STOPS), which groups them into compact clusters.
+   Tasks farther than DISPATCH_MAX_DISTANCE_METERS from every robot, or
+   left over once every route is full, stay pending for the next run.
+2. Construction: each robot's tasks are chained nearest-neighbor first,
+   starting from the robot's position. Routes are open: robots do not
+   return to their start.
+3. Improvement: 2-opt (reverse a segment) and or-opt (move a run of up to
+   three stops, possibly reversed) until no move helps or the time budget
+   (ROUTE_PLAN_TIME_BUDGET_MS) runs out, longest routes first. Each move
+   is evaluated against all positions at once with numpy.
+
+The plan is written back as a CleanupRoute per robot, with the tasks
+assigned to it in stop order (route, route_order, assigned_to, status
+'assigned') and the robot dispatched. A route completes, and its robot
+becomes available again at the last stop, once all its tasks are done.
+"""
+import math
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .dispatch import eta_minutes, get_dispatcher
+from .events import publish_task
+from .geo import EARTH_RADIUS_METERS
+from .models import CleanupRoute, CleanupTask, Robot
+from .response_cache import TASKS, invalidate
+from .rollups import apply_rollups, task_rollups
+
+EPSILON = 1e-6  # meters; smaller gains are rounding noise
+
+
+def project(lats, lngs, origin):
+    """(n, 2) local x/y in meters of the given points, around origin = (lat, lng)"""
+    import numpy as np
+
+    lat0, lng0 = origin
+    scale = math.cos(math.radians(lat0))
+    x = np.radians(np.asarray(lngs, dtype=np.float64) - lng0) * scale
+    y = np.radians(np.asarray(lats, dtype=np.float64) - lat0)
+    return np.column_stack((x, y)) * EARTH_RADIUS_METERS
+
+
+def distance_matrix(a, b):
+    """Euclidean distances between the rows of `a` (n, 2) and `b` (m, 2), as an (n, m) array"""
+    import numpy as np
+
+    squared = (a * a).sum(axis=1)[:, None] + (b * b).sum(axis=1)[None, :] - 2.0 * (a @ b.T)
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def path_length(path, matrix):
+    return float(matrix[path[:-1], path[1:]].sum())
+
+
+def assign(task_xy, robot_xy, max_stops, max_distance):
+    """Robot index of each task (-1: unassigned), nearest robot with room first"""
+    import numpy as np
+
+    distances = distance_matrix(task_xy, robot_xy)
+    owner = np.full(len(task_xy), -1, dtype=np.int64)
+    if not len(robot_xy):
+        return owner
+    load = np.zeros(len(robot_xy), dtype=np.int64)
+    full = np.zeros(len(robot_xy), dtype=bool)
+    for task in np.argsort(distances.min(axis=1), kind='stable'):
+        if full.all():
+            break
+        row = np.where(full, np.inf, distances[task])
+        robot = int(row.argmin())
+        if row[robot] > max_distance:
+            continue
+        owner[task] = robot
+        load[robot] += 1
+        full[robot] = load[robot] >= max_stops
+    return owner
+
+
+def nearest_neighbor(matrix):
+    """Open path over every node of `matrix`, from node 0, always to the closest unvisited node"""
+    import numpy as np
+
+    visited = np.zeros(len(matrix), dtype=bool)
+    visited[0] = True
+    path = [0]
+    for _ in range(len(matrix) - 1):
+        row = np.where(visited, np.inf, matrix[path[-1]])
+        node = int(row.argmin())
+        visited[node] = True
+        path.append(node)
+    return np.array(path, dtype=np.int64)
+
+
+def two_opt(path, matrix, deadline):
+    """One pass of 2-opt over an open path with a fixed start; True if anything improved"""
+    import numpy as np
+
+    improved = False
+    n = len(path)
+    for i in range(1, n - 1):
+        if time.monotonic() > deadline:
+            break
+        a, b = path[i - 1], path[i]
+        ends = np.arange(i + 1, n)
+        c = path[ends]
+        has_next = ends + 1 < n
+        d = path[np.minimum(ends + 1, n - 1)]
+        # Reversing path[i..j] replaces edges (a, b) and (c, d) with (a, c) and (b, d)
+        delta = matrix[a, c] - matrix[a, b] + np.where(has_next, matrix[b, d] - matrix[c, d], 0.0)
+        best = int(delta.argmin())
+        if delta[best] < -EPSILON:
+            j = ends[best]
+            path[i:j + 1] = path[i:j + 1][::-1].copy()
+            improved = True
+    return improved
+
+
+def or_opt(path, matrix, deadline):
+    """One pass of or-opt (move runs of 1-3 stops, possibly reversed); True if anything improved"""
+    import numpy as np
+
+    improved = False
+    for length in (1, 2, 3):
+        i = 1
+        while i + length <= len(path):
+            if time.monotonic() > deadline:
+                return improved
+            segment = path[i:i + length]
+            first, last = segment[0], segment[-1]
+            before = path[i - 1]
+            gain = matrix[before, first]
+            if i + length < len(path):
+                after = path[i + length]
+                gain += matrix[last, after] - matrix[before, after]
+
+            rest = np.concatenate((path[:i], path[i + length:]))
+            a, b = rest[:-1], rest[1:]
+            # Insert between a[p] and b[p], or after the last stop, either way round
+            forward = np.append(matrix[a, first] + matrix[last, b] - matrix[a, b], matrix[rest[-1], first])
+            backward = np.append(matrix[a, last] + matrix[first, b] - matrix[a, b], matrix[rest[-1], last])
+            position = int(np.minimum(forward, backward).argmin())
+            cost = min(forward[position], backward[position])
+            if cost < gain - EPSILON:
+                moved = segment if forward[position] <= backward[position] else segment[::-1]
+                path[:] = np.concatenate((rest[:position + 1], moved, rest[position + 1:]))
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+class PlannedRoute:
+    __slots__ = ('robot', 'tasks', 'path', 'matrix', 'construction_m')
+
+    def __init__(self, robot, tasks, path, matrix):
+        self.robot = robot  # index into the robots passed to plan()
+        self.tasks = tasks  # task indices, matrix node i + 1 is tasks[i]
+        self.path = path
+        self.matrix = matrix
+        self.construction_m = path_length(path, matrix)
+
+    @property
+    def length_m(self):
+        return path_length(self.path, self.matrix)
+
+    @property
+    def stops(self):
+        """Task indices in visiting order"""
+        return [self.tasks[node - 1] for node in self.path[1:]]
+
+
+def plan(task_points, robot_points, max_stops=None, time_budget_ms=None):
+    """
+    Routes over (lat, lng) task points for (lat, lng) robot points.
+    Returns (routes, unassigned task indices).
+    """
+    import numpy as np
+
+    max_stops = max_stops or settings.ROUTE_MAX_STOPS
+    budget = settings.ROUTE_PLAN_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+    deadline = time.monotonic() + budget / 1000.0
+    if not task_points:
+        return [], []
+    if not robot_points:
+        return [], list(range(len(task_points)))
+
+    points = np.asarray(task_points + robot_points, dtype=np.float64)
+    xy = project(points[:, 0], points[:, 1], points.mean(axis=0))
+    task_xy, robot_xy = xy[:len(task_points)], xy[len(task_points):]
+
+    owner = assign(task_xy, robot_xy, max_stops, settings.DISPATCH_MAX_DISTANCE_METERS)
+    routes = []
+    for robot in np.unique(owner[owner >= 0]):
+        tasks = np.flatnonzero(owner == robot)
+        nodes = np.vstack((robot_xy[robot:robot + 1], task_xy[tasks]))
+        matrix = distance_matrix(nodes, nodes)
+        routes.append(PlannedRoute(int(robot), tasks.tolist(), nearest_neighbor(matrix), matrix))
+
+    for route in sorted(routes, key=lambda route: route.construction_m, reverse=True):
+        while time.monotonic() < deadline:
+            improved = two_opt(route.path, route.matrix, deadline)
+            improved = or_opt(route.path, route.matrix, deadline) or improved
+            if not improved:
+                break
+    return routes, np.flatnonzero(owner < 0).tolist()
+
+
+def plan_routes(tasks=None, robot_ids=None, max_stops=None, time_budget_ms=None, dry_run=False):
+    """
+    Plan routes for the pending, unrouted tasks of `tasks` (default: all)
+    over the idle robots (optionally only `robot_ids`), and unless
+    `dry_run` write them back. Returns a summary of the plan.
+    """
+    started = time.monotonic()
+    tasks = CleanupTask.objects.all() if tasks is None else tasks
+    task_rows = list(
+        tasks.filter(status='pending', route__isnull=True, detection__latitude__isnull=False)
+        .values_list('id', 'detection__latitude', 'detection__longitude')
+    )
+    robots = Robot.objects.filter(
+        state='idle', battery__gte=settings.DISPATCH_MIN_BATTERY, latitude__isnull=False
+    )
+    if robot_ids:
+        robots = robots.filter(robot_id__in=robot_ids)
+    robot_rows = list(robots.values_list('id', 'robot_id', 'latitude', 'longitude', 'speed_mps'))
+
+    routes, unassigned = plan(
+        [(lat, lng) for _, lat, lng in task_rows],
+        [(lat, lng) for _, _, lat, lng, _ in robot_rows],
+        max_stops, time_budget_ms,
+    )
+    planning_ms = (time.monotonic() - started) * 1000
+
+    planned = []
+    for route in routes:
+        pk, robot_id, lat, lng, speed = robot_rows[route.robot]
+        length = route.length_m
+        planned.append({
+            'robot': pk,
+            'robot_id': robot_id,
+            'tasks': [task_rows[index][0] for index in route.stops],
+            'distance_m': round(length, 1),
+            'construction_distance_m': round(route.construction_m, 1),
+            'eta_minutes': eta_minutes(length * settings.DISPATCH_ROUTE_FACTOR / speed),
+        })
+    if not dry_run:
+        save_routes(planned)
+
+    return {
+        'dry_run': dry_run,
+        'tasks': len(task_rows),
+        'robots': len(robot_rows),
+        'assigned': sum(len(route['tasks']) for route in planned),
+        'unassigned': len(unassigned),
+        'distance_m': round(sum(route['distance_m'] for route in planned), 1),
+        'construction_distance_m': round(sum(route['construction_distance_m'] for route in planned), 1),
+        'planning_ms': round(planning_ms, 1),
+        'routes': planned,
+    }
+
+
+def save_routes(planned):
+    """
+    Write planned routes back: a CleanupRoute per robot, its tasks assigned
+    in stop order and the robot dispatched. Each robot is claimed with a
+    conditional update; robots that are no longer idle and tasks that are
+    no longer pending are skipped. bulk_update skips the
+    signal handlers, so rollups, cached responses and events are updated
+    here, as in api.ingest.
+    """
+    now = timezone.now()
+    task_ids = [task_id for route in planned for task_id in route['tasks']]
+    with transaction.atomic():
+        tasks = CleanupTask.objects.filter(
+            pk__in=task_ids, status='pending', route__isnull=True
+        ).select_related('detection').in_bulk()
+
+        updated, dispatched = [], []
+        counts, totals = Counter(), Counter()
+        for route in planned:
+            stops = [tasks[task_id] for task_id in route['tasks'] if task_id in tasks]
+            # Conditional update, as in api.dispatch: a robot the dispatcher claimed
+            # since the plan was made is not given a route on top
+            if not stops or not Robot.objects.filter(pk=route['robot'], state='idle').update(state='dispatched'):
+                route['tasks'] = []
+                continue
+            route['tasks'] = [task.id for task in stops]
+            row = CleanupRoute.objects.create(
+                robot_id=route['robot'], stops=len(stops), distance_m=route['distance_m'],
+                eta_minutes=route['eta_minutes'], created_at=now,
+            )
+            route['route_id'] = row.id
+            dispatched.append(route['robot_id'])
+            for order, task in enumerate(stops, start=1):
+                task.route = row
+                task.route_order = order
+                task.assigned_to = route['robot_id']
+                task.status = 'assigned'
+                updated.append(task)
+                task_counts, task_totals = task_rollups(task, 'pending', now)
+                counts.update(task_counts)
+                totals.update(task_totals)
+
+        CleanupTask.objects.bulk_update(updated, ['route', 'route_order', 'assigned_to', 'status'], batch_size=500)
+        if updated:
+            apply_rollups(counts, totals)
+            invalidate(TASKS)
+        for task in updated:
+            publish_task(task, 'pending', detection=task.detection)
+
+        dispatcher = get_dispatcher()
+        transaction.on_commit(lambda: [dispatcher.forget(robot_id) for robot_id in dispatched])
+    planned[:] = [route for route in planned if route['tasks']]
+    return planned
+
+
+def finish_route(route_id):
+    """Complete a route once all its tasks are done, freeing its robot at the last stop"""
+    if CleanupTask.objects.filter(route_id=route_id).exclude(status='completed').exists():
+        return None
+    route = CleanupRoute.objects.select_related('robot').filter(pk=route_id, status='active').first()
+    if route is None:
+        return None
+    route.status = 'completed'
+    route.completed_at = timezone.now()
+    route.save(update_fields=['status', 'completed_at'])
+
+    robot = route.robot
+    last = CleanupTask.objects.filter(route=route).select_related('detection').order_by('-route_order').first()
+    if robot is not None and robot.state == 'dispatched' and robot.current_request_id is None and last is not None:
+        get_dispatcher().free(robot, last.detection.location, travelled=route.distance_m)
+    return route
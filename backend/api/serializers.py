@@ -1,33 +1,178 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
 from rest_framework import serializers
-from .models import TrashDetection, TrashCategory, CleanupTask, RobotRequest, CooperationRequest
+from .models import TrashDetection, TrashCategory, CleanupTask, Hotspot, Robot, RobotRequest, CooperationRequest
+from .rollups import GRANULARITIES, METRICS
 
-class TrashDetectionSerializer(serializers.ModelSerializer):
+def parse_fields(value):
+    """'id,status,detection.location' -> {'id': None, 'status': None, 'detection': {'location': None}}"""
+    tree = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        *parents, leaf = path.split('.')
+        node = tree
+        for name in parents:
+            if name in node and node[name] is None:
+                break  # the whole nested object was already requested
+            node = node.setdefault(name, {})
+        else:
+            node[leaf] = None
+    return tree
+
+def prune_fields(serializer, tree):
+    """Drop every field of `serializer` not named in `tree`, recursing into nested serializers"""
+    unknown = set(tree) - set(serializer.fields)
+    if unknown:
+        raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in sorted(unknown)]})
+    for name in list(serializer.fields):
+        if name not in tree:
+            serializer.fields.pop(name)
+            continue
+        nested = serializer.fields[name]
+        nested = getattr(nested, 'child', nested)
+        if tree[name] is not None and isinstance(nested, serializers.BaseSerializer):
+            prune_fields(nested, tree[name])
+
+def serializer_columns(serializer, model, prefix=''):
+    """
+    (select_related paths, only() columns) covering what `serializer` reads
+    from `model`, or None when a field is not a plain model column and the
+    queryset must load everything.
+    """
+    related, columns = [], [prefix + model._meta.pk.name]
+    for field in serializer.fields.values():
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        nested = getattr(field, 'child', field)
+        if isinstance(nested, serializers.BaseSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one) or nested is not field:
+                return None
+            inner = serializer_columns(nested, model_field.related_model, f'{prefix}{field.source}__')
+            if inner is None:
+                return None
+            related.append(prefix + field.source)
+            related.extend(inner[0])
+            columns.append(prefix + field.source)
+            columns.extend(inner[1])
+        elif model_field.concrete:
+            columns.append(prefix + model_field.name)
+        else:
+            return None
+    return related, columns
+
+class SparseFieldsMixin:
+    """
+    Honours `?fields=a,b,nested.c` on GET requests so clients can ask for a
+    compact projection; nested serializers are pruned with dotted names.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method == 'GET' and request.query_params.get('fields'):
+            prune_fields(self, parse_fields(request.query_params['fields']))
+
+class TrashDetectionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TrashDetection
         fields = '__all__'
 
-class TrashCategorySerializer(serializers.ModelSerializer):
+class TrashCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TrashCategory
         fields = '__all__'
 
-class CleanupTaskSerializer(serializers.ModelSerializer):
+class CleanupTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     detection = TrashDetectionSerializer(read_only=True)
     
     class Meta:
         model = CleanupTask
         fields = '__all__'
+        read_only_fields = ['route', 'route_order']
+
+class TilingOptionsSerializer(serializers.Serializer):
+    """Per-request options for tiled detection of high-resolution images"""
+    tiled = serializers.BooleanField(required=False, default=False)
+    tile_size = serializers.IntegerField(required=False, min_value=64, max_value=8192)
+    tile_overlap = serializers.FloatField(required=False, min_value=0.0, max_value=0.9)
+    max_tiles = serializers.IntegerField(required=False, min_value=1, max_value=64)
 
-class ImageUploadSerializer(serializers.Serializer):
+    @staticmethod
+    def tiling(validated_data):
+        """detect_tiled keyword arguments, or None when tiling was not requested"""
+        if not validated_data.get('tiled'):
+            return None
+        return {
+            'tile_size': validated_data.get('tile_size'),
+            'overlap': validated_data.get('tile_overlap'),
+            'max_tiles': validated_data.get('max_tiles'),
+        }
+
+class ImageUploadSerializer(TilingOptionsSerializer):
     image = serializers.ImageField()
     location = serializers.JSONField(required=False)
 
-class RobotRequestSerializer(serializers.ModelSerializer):
+class BatchUploadSerializer(TilingOptionsSerializer):
+    """
+    Many images in one multipart request. `locations` is an optional JSON
+    list with one location per image, in upload order. Images are not
+    validated here so one bad frame fails on its own, not the batch.
+    """
+    images = serializers.ListField(
+        child=serializers.FileField(), allow_empty=False, max_length=settings.BATCH_UPLOAD_MAX_IMAGES
+    )
+    locations = serializers.JSONField(required=False)
+    stream = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        locations = data.get('locations')
+        if locations is not None and (
+            not isinstance(locations, list) or len(locations) != len(data['images'])
+        ):
+            raise serializers.ValidationError({'locations': 'Expected a list with one location per image'})
+        return data
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    """Query parameters of the analytics endpoint; `end` defaults to now"""
+    metric = serializers.ChoiceField(choices=METRICS)
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField(required=False)
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default='day')
+    dimension = serializers.CharField(required=False, max_length=100)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.now())
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError('start must be before end')
+        return data
+
+class RoutePlanSerializer(serializers.Serializer):
+    """Options of a route planning run; the tasks can be narrowed with the bbox/radius query parameters"""
+    robots = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+    max_stops = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+    time_budget_ms = serializers.IntegerField(min_value=0, max_value=60000, required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+class RobotRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = RobotRequest
         fields = '__all__'
 
-class CooperationRequestSerializer(serializers.ModelSerializer):
+class RobotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Robot
+        fields = '__all__'
+        read_only_fields = ['current_request']
+
+class HotspotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    task = serializers.PrimaryKeyRelatedField(read_only=True)
+    
+    class Meta:
+        model = Hotspot
+        fields = '__all__'
+
+class CooperationRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CooperationRequest
         fields = '__all__'
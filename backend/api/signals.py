@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import events, response_cache
+from .dispatch import get_dispatcher
+from .hotspots import close_hotspot
+from .models import CleanupTask, Robot, RobotRequest, TrashCategory, TrashDetection
+from .rollups import apply_rollups, detection_rollups, task_rollups
+from .routing import finish_route
+from .stats import apply_counts, detection_counts
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """WAL journaling and relaxed fsyncs for every new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if settings.SQLITE_WAL:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}')
+
+
+@receiver(pre_save, sender=TrashDetection)
+def remember_counted_state(sender, instance, raw=False, **kwargs):
+    """Keep the stored day/objects of an updated detection so only the difference is applied"""
+    instance._counted_state = None
+    if raw or instance.pk is None:
+        return
+    instance._counted_state = (
+        sender.objects.filter(pk=instance.pk).values_list('detected_at', 'detected_objects').first()
+    )
+
+
+@receiver(post_save, sender=TrashDetection)
+def count_saved_detection(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    counts = detection_counts(instance.detected_at, instance.detected_objects)
+    previous = getattr(instance, '_counted_state', None)
+    if not created and previous is not None:
+        counts.subtract(detection_counts(*previous))
+    apply_counts(counts)
+
+    rollups = detection_rollups(instance.detected_at, instance.detected_objects)
+    if not created and previous is not None:
+        rollups.subtract(detection_rollups(*previous))
+    apply_rollups(rollups)
+
+
+@receiver(post_delete, sender=TrashDetection)
+def uncount_deleted_detection(sender, instance, **kwargs):
+    apply_counts(detection_counts(instance.detected_at, instance.detected_objects), sign=-1)
+    apply_rollups(detection_rollups(instance.detected_at, instance.detected_objects), sign=-1)
+
+
+@receiver(pre_save, sender=CleanupTask)
+def remember_task_status(sender, instance, raw=False, **kwargs):
+    """Keep the stored status so only real transitions reach the rollups"""
+    instance._rolled_up_status = None
+    if raw or instance.pk is None:
+        return
+    instance._rolled_up_status = sender.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=CleanupTask)
+def roll_up_task_transition(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rolled_up_status', None)
+    apply_rollups(*task_rollups(instance, previous, timezone.now()))
+
+
+@receiver(post_save, sender=TrashDetection)
+@receiver(post_delete, sender=TrashDetection)
+def invalidate_detection_responses(sender, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate(response_cache.DETECTIONS)
+
+
+@receiver(post_save, sender=CleanupTask)
+@receiver(post_delete, sender=CleanupTask)
+def invalidate_task_responses(sender, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate(response_cache.TASKS)
+
+
+@receiver(post_save, sender=TrashCategory)
+@receiver(post_delete, sender=TrashCategory)
+def invalidate_category_responses(sender, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate(response_cache.CATEGORIES)
+
+
+@receiver(post_save, sender=TrashDetection)
+def publish_new_detection(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.publish_detection(instance)
+
+
+@receiver(post_save, sender=CleanupTask)
+def publish_task_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rolled_up_status', None)
+    if created:
+        events.publish_task(instance)
+    elif previous is not None and previous != instance.status:
+        events.publish_task(instance, previous)
+
+
+@receiver(pre_save, sender=RobotRequest)
+def remember_robot_request_status(sender, instance, raw=False, **kwargs):
+    instance._published_status = None
+    if raw or instance.pk is None:
+        return
+    instance._published_status = sender.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=RobotRequest)
+def publish_robot_request_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_published_status', None)
+    if created:
+        events.publish_robot_request(instance)
+    elif previous is not None and previous != instance.status:
+        events.publish_robot_request(instance, previous)
+
+
+@receiver(post_save, sender=RobotRequest)
+def release_finished_robot(sender, instance, created, raw=False, **kwargs):
+    """A completed request frees its robot, which may go straight on to a queued one"""
+    if raw or created or not instance.robot_id:
+        return
+    if instance.status == 'completed' and getattr(instance, '_published_status', None) != 'completed':
+        get_dispatcher().release(instance)
+
+
+@receiver(post_save, sender=Robot)
+def index_saved_robot(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: get_dispatcher().sync(instance))
+
+
+@receiver(post_delete, sender=Robot)
+def unindex_deleted_robot(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_dispatcher().forget(instance.robot_id))
+
+
+@receiver(post_save, sender=CleanupTask)
+def finish_completed_route(sender, instance, created, raw=False, **kwargs):
+    """The last completed task of a route completes it and frees its robot"""
+    if raw or created or instance.route_id is None or instance.status != 'completed':
+        return
+    if getattr(instance, '_rolled_up_status', None) != 'completed':
+        finish_route(instance.route_id)
+
+
+@receiver(post_save, sender=CleanupTask)
+def close_cleaned_hotspot(sender, instance, created, raw=False, **kwargs):
+    """A completed task closes its hotspot; later detections there open a new one"""
+    if not raw and instance.hotspot_id is not None and instance.status == 'completed':
+        close_hotspot(instance.hotspot_id)
+
+
+@receiver(post_delete, sender=CleanupTask)
+def close_orphaned_hotspot(sender, instance, **kwargs):
+    """
+    A hotspot whose task is deleted (directly or with its detection) is closed,
+    or later detections would keep joining it without ever getting a task
+    """
+    if instance.hotspot_id is not None:
+        close_hotspot(instance.hotspot_id)
@@ -0,0 +1,97 @@
+"""
+Incrementally maintained detection statistics.
+
+Every TrashDetection contributes to DetectionCounter rows for its day and
+for the all-time totals: one for the detection itself and one per detected
+object class. The signal handlers in api.signals apply the difference on
+every create, update and delete inside the same transaction, so the
+statistics endpoint reads a handful of rows instead of scanning the table.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DetectionCounter, TrashDetection
+
+ALL_TIME = DetectionCounter.ALL_TIME
+
+
+def period_for(detected_at):
+    return timezone.localdate(detected_at).isoformat()
+
+
+def detection_counts(detected_at, detected_objects):
+    """Counter deltas contributed by one detection, keyed on (period, trash_class)"""
+    counts = Counter()
+    for period in (ALL_TIME, period_for(detected_at)):
+        counts[(period, '')] += 1
+        for trash_class in detected_objects or []:
+            counts[(period, str(trash_class))] += 1
+    return counts
+
+
+def apply_counts(counts, sign=1, counter_model=DetectionCounter):
+    """Add (sign=1) or subtract (sign=-1) counter deltas atomically"""
+    with transaction.atomic():
+        for (period, trash_class), amount in sorted(counts.items()):
+            amount *= sign
+            if not amount:
+                continue
+            rows = counter_model.objects.filter(period=period, trash_class=trash_class)
+            if rows.update(count=F('count') + amount):
+                continue
+            try:
+                with transaction.atomic():
+                    counter_model.objects.create(period=period, trash_class=trash_class, count=amount)
+            except IntegrityError:
+                # Another writer created the row first
+                rows.update(count=F('count') + amount)
+
+
+def rebuild_counters(detection_model=TrashDetection, counter_model=DetectionCounter, batch_size=2000):
+    """
+    Recompute every counter from the detection table; used for backfills.
+    Migrations pass their historical models.
+    """
+    totals = Counter()
+    rows = detection_model.objects.values_list('detected_at', 'detected_objects')
+    for detected_at, detected_objects in rows.iterator(chunk_size=batch_size):
+        totals.update(detection_counts(detected_at, detected_objects))
+
+    with transaction.atomic():
+        counter_model.objects.all().delete()
+        counter_model.objects.bulk_create(
+            [
+                counter_model(period=period, trash_class=trash_class, count=count)
+                for (period, trash_class), count in totals.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(totals)
+
+
+def detection_statistics(today=None):
+    """Totals for the statistics endpoint, read from the pre-aggregated rows"""
+    today = (today or timezone.localdate()).isoformat()
+    rows = DetectionCounter.objects.filter(period__in=[ALL_TIME, today]).values_list(
+        'period', 'trash_class', 'count'
+    )
+
+    total_detections = today_detections = 0
+    trash_counts = {}
+    for period, trash_class, count in rows:
+        if trash_class == '':
+            if period == ALL_TIME:
+                total_detections = count
+            else:
+                today_detections = count
+        elif period == ALL_TIME and count:
+            trash_counts[trash_class] = count
+
+    return {
+        'total_detections': total_detections,
+        'today_detections': today_detections,
+        'trash_counts': trash_counts,
+    }
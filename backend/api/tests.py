@@ -0,0 +1,166 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from .cv_model import LETTERBOX_FILL, ModelLoadError, TrashDetectionModel
+from .onnx_fixture import write_fixture_model
+
+INPUT_SIZE = 320
+
+
+def reference_postprocess(model, predictions, image_shape, letterbox):
+    """Row-by-row YOLOv8 decode with per-class NMS, for checking the vectorized path"""
+    scale, pad_x, pad_y = letterbox
+    boxes, confidences, class_ids = [], [], []
+    for row in predictions.T:
+        scores = row[4:]
+        class_id = int(np.argmax(scores))
+        confidence = float(scores[class_id])
+        if confidence <= model.conf_threshold:
+            continue
+        cx, cy, w, h = row[:4]
+        cx, cy, w, h = (cx - pad_x) / scale, (cy - pad_y) / scale, w / scale, h / scale
+        boxes.append([cx - w / 2, cy - h / 2, w, h])
+        confidences.append(confidence)
+        class_ids.append(class_id)
+
+    kept = []
+    for class_id in set(class_ids):
+        members = [i for i, c in enumerate(class_ids) if c == class_id]
+        indices = cv2.dnn.NMSBoxes(
+            [boxes[i] for i in members], [confidences[i] for i in members],
+            model.conf_threshold, model.nms_threshold
+        )
+        kept.extend(members[i] for i in np.asarray(indices).reshape(-1))
+    kept.sort(key=lambda i: -confidences[i])
+    kept = kept[:model.max_detections]
+
+    image_height, image_width = image_shape[:2]
+    detections = []
+    for i in kept:
+        left, top, w, h = boxes[i]
+        bbox = [
+            min(max(left, 0), image_width), min(max(top, 0), image_height),
+            min(max(left + w, 0), image_width), min(max(top + h, 0), image_height),
+        ]
+        detections.append({
+            'class': model.class_names[class_ids[i]],
+            'confidence': round(confidences[i], 4),
+            'bbox': [int(round(v)) for v in bbox],
+        })
+    return detections
+
+
+def sort_key(detection):
+    return (-detection['confidence'], detection['class'], detection['bbox'])
+
+
+@override_settings(TRASH_MODEL_INPUT_SIZE=INPUT_SIZE)
+class PostprocessTests(SimpleTestCase):
+    def test_vectorized_decode_matches_reference_loop(self):
+        model = TrashDetectionModel(model_path='')
+        rng = np.random.default_rng(0)
+        num_classes = len(model.class_names)
+        num_anchors = 500
+        predictions = np.empty((4 + num_classes, num_anchors), dtype=np.float32)
+        # Boxes clustered in a few spots so NMS has overlaps to suppress
+        centers = rng.uniform(40, INPUT_SIZE - 40, size=(5, 2))
+        picked = centers[rng.integers(0, len(centers), num_anchors)]
+        predictions[:2] = (picked + rng.normal(0, 4, size=picked.shape)).T
+        predictions[2:4] = rng.uniform(10, 80, size=(2, num_anchors))
+        predictions[4:] = rng.uniform(0, 1, size=(num_classes, num_anchors)) ** 4
+        image_shape = (240, 320)
+        letterbox = (1.0, 0, 40)
+
+        detections = model.postprocess_predictions(predictions, image_shape, letterbox)
+        expected = reference_postprocess(model, predictions, image_shape, letterbox)
+
+        self.assertTrue(expected)
+        self.assertEqual(
+            sorted(({k: d[k] for k in ('class', 'confidence', 'bbox')} for d in detections), key=sort_key),
+            sorted(expected, key=sort_key),
+        )
+
+    def test_letterbox_pads_and_maps_back(self):
+        model = TrashDetectionModel(model_path='')
+        image = np.zeros((160, 320, 3), dtype=np.uint8)
+        image[:, :, 0] = 255  # pure blue in BGR
+        canvas, blob = model.input_buffers(1)
+
+        scale, pad_x, pad_y = model.letterbox_into(image, canvas, blob[0])
+
+        self.assertEqual((scale, pad_x, pad_y), (1.0, 0, 80))
+        fill = np.float32(LETTERBOX_FILL / 255.0)
+        np.testing.assert_allclose(blob[0][:, :80], fill)
+        np.testing.assert_allclose(blob[0][:, 240:], fill)
+        # BGR -> RGB: blue ends up in the last plane
+        np.testing.assert_allclose(blob[0][2, 80:240], 1.0)
+        np.testing.assert_allclose(blob[0][:2, 80:240], 0.0)
+
+        # A box drawn on a downscaled image maps back to original pixels
+        scale, pad_x, pad_y, _, _ = model.letterbox_params((480, 1280))
+        self.assertEqual((scale, pad_x, pad_y), (0.25, 0, 100))
+        predictions = np.zeros((4 + len(model.class_names), 1), dtype=np.float32)
+        predictions[:4, 0] = [50 + 20, 100 + 30 + 10, 40, 20]  # (cx, cy, w, h) in input pixels
+        predictions[5, 0] = 0.9
+        detections = model.postprocess_predictions(predictions, (480, 1280), (scale, pad_x, pad_y))
+        self.assertEqual(detections[0]['class'], 'can')
+        self.assertEqual(detections[0]['bbox'], [200, 120, 360, 200])
+
+
+@override_settings(TRASH_MODEL_INPUT_SIZE=INPUT_SIZE)
+class FixtureModelTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.model_path = write_fixture_model(
+            os.path.join(cls.workdir.name, 'fixture.onnx'), input_size=INPUT_SIZE
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+        super().tearDownClass()
+
+    def test_detect_batch_matches_detect_image(self):
+        model = TrashDetectionModel(model_path=self.model_path)
+        model.conf_threshold = 0.1  # the fixture's class scores sit around 0.12
+        rng = np.random.default_rng(0)
+        images = [
+            rng.integers(0, 256, size=shape, dtype=np.uint8)
+            for shape in [(240, 320, 3), (480, 360, 3), (100, 700, 3)]
+        ]
+
+        batched = model.detect_batch(images)
+        single = [model.detect_image(image) for image in images]
+
+        self.assertTrue(any(single))
+        self.assertEqual(len(batched), len(images))
+        for got, expected in zip(batched, single):
+            self.assertEqual([d['class'] for d in got], [d['class'] for d in expected])
+            for a, b in zip(got, expected):
+                self.assertAlmostEqual(a['confidence'], b['confidence'], places=3)
+                np.testing.assert_allclose(a['bbox'], b['bbox'], atol=1)
+
+    def test_missing_model_raises(self):
+        model = TrashDetectionModel(model_path=os.path.join(self.workdir.name, 'missing.onnx'))
+        with self.assertRaises(ModelLoadError):
+            model.detect_image(np.zeros((64, 64, 3), dtype=np.uint8))
+        self.assertFalse(model.loaded)
+
+    def test_corrupt_model_raises(self):
+        path = os.path.join(self.workdir.name, 'corrupt.onnx')
+        with open(path, 'wb') as f:
+            f.write(b'not an onnx model')
+        model = TrashDetectionModel(model_path=path)
+        with self.assertRaises(ModelLoadError):
+            model.ensure_loaded()
+        self.assertFalse(model.loaded)
+
+    def test_unconfigured_model_uses_mocks(self):
+        model = TrashDetectionModel(model_path='')
+        self.assertEqual(model.detect_image(np.zeros((64, 64, 3), dtype=np.uint8)), model.mock_detections())
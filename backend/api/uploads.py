@@ -0,0 +1,93 @@
+"""
+Helpers that keep uploaded images off the detection latency path.
+
+Detection decodes straight from the upload buffer; the file is written to
+storage afterwards on a background thread (UPLOAD_PERSIST_ASYNC).
+"""
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .metrics import timed
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    """The uploaded file could not be decoded as an image"""
+
+
+def upload_buffer(upload):
+    """
+    Return the uploaded bytes as a buffer. In-memory uploads are exposed as
+    a memoryview of Django's BytesIO without copying; call release() on it
+    once decoding is done so the upload can be closed.
+    """
+    upload.seek(0)
+    file = getattr(upload, 'file', None)
+    if hasattr(file, 'getbuffer'):
+        return file.getbuffer()
+    return memoryview(upload.read())
+
+
+def upload_name(upload, prefix=''):
+    """Storage name for an upload; unique so the URL is known before the file is saved"""
+    name = f"uploads/{prefix}{timezone.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{upload.name}"
+    return default_storage.generate_filename(name)
+
+
+def _save(name, data):
+    try:
+        with timed('storage_save'):
+            default_storage.save(name, ContentFile(data))
+    except Exception as e:
+        print(f"Error saving upload {name}: {e}")
+
+
+def persist_upload(name, upload):
+    """Write the upload to storage under `name`, in the background if configured"""
+    upload.seek(0)
+    data = upload.read()
+    if not settings.UPLOAD_PERSIST_ASYNC:
+        _save(name, data)
+        return
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.UPLOAD_PERSIST_WORKERS, thread_name_prefix='upload-persist'
+            )
+    _executor.submit(_save, name, data)
+
+
+def decode_upload(upload):
+    """Decode an uploaded image straight from its buffer; raises InvalidImage if it is not one"""
+    from .cv_model import decode_image
+
+    buffer = upload_buffer(upload)
+    try:
+        with timed('decode'):
+            image = decode_image(buffer)
+    finally:
+        buffer.release()
+    if image is None:
+        raise InvalidImage(f'{upload.name} could not be decoded as an image')
+    return image
+
+
+def hash_upload(upload):
+    """SHA-256 hex digest of the uploaded bytes"""
+    buffer = upload_buffer(upload)
+    try:
+        with timed('hash'):
+            return hashlib.sha256(buffer).hexdigest()
+    finally:
+        buffer.release()
@@ -1,18 +1,35 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'detections', views.TrashDetectionViewSet)
 router.register(r'categories', views.TrashCategoryViewSet)
 router.register(r'tasks', views.CleanupTaskViewSet)
 router.register(r'robot-requests', views.RobotRequestViewSet)
+router.register(r'robots', views.RobotViewSet)
+router.register(r'hotspots', views.HotspotViewSet)
 router.register(r'cooperation-requests', views.CooperationRequestViewSet)
 
-urlpatterns = [
+urlpatterns = []
+if settings.ASYNC_DETECTION_VIEWS:
+    # Serve the async detection views at the usual URLs (ASGI deployments)
+    urlpatterns += [
+        path('detections/upload_and_detect/', async_views.upload_and_detect),
+        path('detect-trash/', async_views.detect_trash),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
     # New simplified endpoints for frontend
     path('detect-trash/', views.detect_trash, name='detect_trash'),
     path('contact-robot/', views.contact_robot, name='contact_robot'),
     path('cooperation/', views.cooperation_request, name='cooperation_request'),
+    path('inference-stats/', views.inference_stats, name='inference_stats'),
+    path('metrics/', views.pipeline_metrics, name='pipeline_metrics'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('events/', views.event_stream, name='event_stream'),
+    path('async/detect-trash/', async_views.detect_trash, name='async_detect_trash'),
+    path('async/detections/upload_and_detect/', async_views.upload_and_detect, name='async_upload_and_detect'),
 ]
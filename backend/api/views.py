@@ -1,65 +1,166 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.utils import timezone
 import os
 import json
 
-from .models import TrashDetection, TrashCategory, CleanupTask, RobotRequest, CooperationRequest
+from .models import TrashDetection, TrashCategory, CleanupTask, Hotspot, Robot, RobotRequest, CooperationRequest
 from .serializers import (
     TrashDetectionSerializer, 
     TrashCategorySerializer, 
     CleanupTaskSerializer,
     ImageUploadSerializer,
+    BatchUploadSerializer,
+    TilingOptionsSerializer,
+    AnalyticsQuerySerializer,
+    RoutePlanSerializer,
     RobotRequestSerializer,
-    CooperationRequestSerializer
+    RobotSerializer,
+    HotspotSerializer,
+    CooperationRequestSerializer,
+    serializer_columns
 )
-from .cv_model import trash_detector
+from .cv_model import get_detector
+from .dispatch import get_dispatcher
+from .events import TOPICS, astream, stream
+from .geo import area_matcher, filter_by_area
+from .ingest import BatchItem, batch_summary, detect_items, record_items
+from .metrics import stage_metrics, timed
+from .response_cache import CATEGORIES, DETECTIONS, TASKS, cached_response
+from .result_cache import get_result_cache, result_version
+from .rollups import query_rollups
+from .routing import plan_routes
+from .stats import detection_statistics
+from .uploads import InvalidImage, decode_upload, hash_upload, persist_upload, upload_name
+from .write_queue import record_detection
 
-class TrashDetectionViewSet(viewsets.ModelViewSet):
+def detect_upload(image, tiling=None):
+    """
+    Run detection on an uploaded image, consulting the content-hash result
+    cache first. `tiling` holds detect_tiled options, or None for a single
+    pass. Returns (detections, cache_key, cached_entry); cached_entry is None
+    on a miss. Raises InvalidImage if the upload is not an image.
+    """
+    detector = get_detector()
+    cache = get_result_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(hash_upload(image), result_version(detector.model_version, tiling))
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry['detections'], cache_key, entry
+    
+    # Decode straight from the upload buffer; the file is persisted afterwards
+    decoded = decode_upload(image)
+    if tiling is not None:
+        detections = detector.detect_tiled(decoded, **tiling)
+    else:
+        detections = detector.detect_image(decoded)
+    if cache is not None:
+        cache.set(cache_key, {'detections': detections, 'detection_id': None})
+    return detections, cache_key, None
+
+def remember_detection(cache_key, detections, detection):
+    """Point the cached result at the detection row created for it"""
+    cache = get_result_cache()
+    if cache is not None and cache_key is not None:
+        cache.set(cache_key, {'detections': detections, 'detection_id': detection.id})
+
+class GeoFilterMixin:
+    """
+    Filters list queries by `?bbox=min_lng,min_lat,max_lng,max_lat` and
+    `?lat=&lng=&radius=` (meters) using the indexed geo columns.
+    `geo_prefix` is the lookup path to the model holding the location.
+    """
+    geo_prefix = ''
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        try:
+            return filter_by_area(queryset, self.request.query_params, self.geo_prefix)
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
+
+class ProjectionMixin:
+    """
+    On GET requests, loads only the columns the serializer (after any
+    `?fields=` pruning) reads and joins nested objects with select_related.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        projection = serializer_columns(self.get_serializer(), queryset.model)
+        if projection is None:
+            return queryset
+        related, columns = projection
+        # The paginator reads the ordering fields to build the next cursor
+        columns.extend(field.lstrip('-') for field in getattr(self, 'cursor_ordering', ()))
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+class TrashDetectionViewSet(ProjectionMixin, GeoFilterMixin, viewsets.ModelViewSet):
     queryset = TrashDetection.objects.all()
     serializer_class = TrashDetectionSerializer
+    cursor_ordering = ('-detected_at', '-id')
     
     @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def upload_and_detect(self, request):
         """Upload image and detect trash"""
-        serializer = ImageUploadSerializer(data=request.data)
+        with timed('parse'):
+            serializer = ImageUploadSerializer(data=request.data)
+            valid = serializer.is_valid()
         
-        if serializer.is_valid():
+        if valid:
             image = serializer.validated_data['image']
             location = serializer.validated_data.get('location', {})
             
-            # Save uploaded image
-            image_name = f"uploads/{timezone.now().strftime('%Y%m%d_%H%M%S')}_{image.name}"
-            image_path = default_storage.save(image_name, ContentFile(image.read()))
-            full_image_path = default_storage.path(image_path)
+            image_path = upload_name(image)
             
             try:
                 # Detect trash in the image
-                detections = trash_detector.detect_trash(full_image_path)
+                detections, cache_key, cached = detect_upload(
+                    image, ImageUploadSerializer.tiling(serializer.validated_data)
+                )
+                
+                # A re-upload of an already recorded image links to the existing detection
+                if cached and cached['detection_id'] and settings.RESULT_CACHE_LINK_DUPLICATES:
+                    detection = TrashDetection.objects.filter(id=cached['detection_id']).first()
+                    if detection is not None:
+                        return Response({
+                            'detection_id': detection.id,
+                            'image_url': detection.image_url,
+                            'detections': detections,
+                            'detected_objects': detection.detected_objects,
+                            'confidence_scores': detection.confidence_scores,
+                            'location': detection.location,
+                            'detected_at': detection.detected_at,
+                            'duplicate': True
+                        }, status=status.HTTP_200_OK)
                 
                 # Extract detected objects and confidence scores
                 detected_objects = [det['class'] for det in detections]
                 confidence_scores = [det['confidence'] for det in detections]
                 
-                # Create detection record
-                detection = TrashDetection.objects.create(
-                    image_url=default_storage.url(image_path),
-                    detected_objects=detected_objects,
-                    confidence_scores=confidence_scores,
-                    location=location
-                )
-                
-                # Create cleanup task if trash is detected
-                if detected_objects:
-                    CleanupTask.objects.create(
-                        detection=detection,
-                        status='pending'
+                with timed('db'):
+                    # Create the detection record, and a cleanup task if trash is detected
+                    detection = record_detection(
+                        default_storage.url(image_path), detections, location, with_task=True
                     )
                 
+                remember_detection(cache_key, detections, detection)
+                persist_upload(image_path, image)
+                
                 # Return detection results with bounding boxes
                 return Response({
                     'detection_id': detection.id,
@@ -71,6 +172,8 @@ class TrashDetectionViewSet(viewsets.ModelViewSet):
                     'detected_at': detection.detected_at
                 }, status=status.HTTP_201_CREATED)
                 
+            except InvalidImage as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({
                     'error': f'Error processing image: {str(e)}'
@@ -78,42 +181,81 @@ class TrashDetectionViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    def batch_upload(self, request):
+        """
+        Detect trash in many images at once. Returns per-image results and
+        errors; with stream=true, NDJSON lines are sent as each inference
+        batch completes, followed by a summary once the rows are written.
+        """
+        serializer = BatchUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        locations = data.get('locations') or [None] * len(data['images'])
+        items = [
+            BatchItem(index, image, location)
+            for index, (image, location) in enumerate(zip(data['images'], locations))
+        ]
+        tiling = BatchUploadSerializer.tiling(data)
+        
+        if data['stream']:
+            def lines():
+                for item in detect_items(items, tiling):
+                    yield json.dumps({'type': 'result', **item.result()}) + '\n'
+                try:
+                    record_items(items)
+                except Exception as e:
+                    yield json.dumps({'type': 'error', 'error': f'Error saving detections: {str(e)}'}) + '\n'
+                    return
+                yield json.dumps({'type': 'summary', **batch_summary(items)}, cls=DjangoJSONEncoder) + '\n'
+            
+            return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+        
+        try:
+            for _ in detect_items(items, tiling):
+                pass
+            record_items(items)
+        except Exception as e:
+            return Response({
+                'error': f'Error processing batch: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        summary = batch_summary(items)
+        created = summary['created'] > 0
+        return Response(summary, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
     @action(detail=False, methods=['get'])
+    @cached_response(DETECTIONS)
     def recent_detections(self, request):
         """Get recent trash detections"""
-        recent = self.queryset.filter(
+        recent = self.get_queryset().filter(
             detected_at__gte=timezone.now() - timezone.timedelta(days=7)
         )[:20]
         serializer = self.get_serializer(recent, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @cached_response(DETECTIONS)
     def statistics(self, request):
-        """Get detection statistics"""
-        total_detections = self.queryset.count()
-        today_detections = self.queryset.filter(
-            detected_at__date=timezone.now().date()
-        ).count()
-        
-        # Count by trash type
-        trash_counts = {}
-        for detection in self.queryset.all():
-            for obj in detection.detected_objects:
-                trash_counts[obj] = trash_counts.get(obj, 0) + 1
-        
-        return Response({
-            'total_detections': total_detections,
-            'today_detections': today_detections,
-            'trash_counts': trash_counts
-        })
+        """Get detection statistics from the pre-aggregated counters"""
+        return Response(detection_statistics())
 
-class TrashCategoryViewSet(viewsets.ModelViewSet):
+class TrashCategoryViewSet(ProjectionMixin, viewsets.ModelViewSet):
     queryset = TrashCategory.objects.all()
     serializer_class = TrashCategorySerializer
+    cursor_ordering = ('id',)
+    
+    @cached_response(CATEGORIES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
-class CleanupTaskViewSet(viewsets.ModelViewSet):
+class CleanupTaskViewSet(ProjectionMixin, GeoFilterMixin, viewsets.ModelViewSet):
     queryset = CleanupTask.objects.all()
     serializer_class = CleanupTaskSerializer
+    geo_prefix = 'detection__'
+    cursor_ordering = ('-created_at', '-id')
     
     @action(detail=True, methods=['patch'])
     def update_status(self, request, pk=None):
@@ -135,63 +277,93 @@ class CleanupTaskViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
+    @cached_response(TASKS, DETECTIONS)
     def pending_tasks(self, request):
         """Get pending cleanup tasks"""
-        pending = self.queryset.filter(status='pending')
-        serializer = self.get_serializer(pending, many=True)
-        return Response(serializer.data)
+        pending = self.get_queryset().filter(status='pending')
+        page = self.paginate_queryset(pending)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def plan_routes(self, request):
+        """Plan multi-stop routes over the idle robots for the pending tasks and assign them"""
+        serializer = RoutePlanSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        options = serializer.validated_data
+        summary = plan_routes(
+            self.get_queryset(),
+            robot_ids=options.get('robots'),
+            max_stops=options.get('max_stops'),
+            time_budget_ms=options.get('time_budget_ms'),
+            dry_run=options['dry_run']
+        )
+        created = summary['assigned'] > 0 and not summary['dry_run']
+        return Response(summary, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 # New API endpoints for the frontend
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
-import random
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
 def detect_trash(request):
     """Simple trash detection endpoint for frontend"""
-    if 'image' not in request.FILES:
+    with timed('parse'):
+        files = request.FILES
+    if 'image' not in files:
         return Response({'error': 'No image provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    image = request.FILES['image']
+    image = files['image']
+    options = TilingOptionsSerializer(data=request.data)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    # Save uploaded image
-    image_name = f"uploads/detect_{timezone.now().strftime('%Y%m%d_%H%M%S')}_{image.name}"
-    image_path = default_storage.save(image_name, ContentFile(image.read()))
+    image_path = upload_name(image, prefix='detect_')
     
     try:
-        # For demo purposes, simulate trash detection
-        # In production, you would use actual computer vision models
-        trash_types = ['plastic_bottle', 'paper_cup', 'food_waste', 'cigarette_butt', 'metal_can']
-        
-        # Simulate detection result
-        trash_detected = random.choice([True, False])
+        detections, cache_key, cached = detect_upload(
+            image, TilingOptionsSerializer.tiling(options.validated_data)
+        )
         
-        if trash_detected:
-            trash_type = random.choice(trash_types)
-            confidence = random.randint(75, 95)
+        if detections:
+            best = max(detections, key=lambda det: det['confidence'])
+            trash_type = best['class']
+            confidence = round(best['confidence'] * 100)
             
-            # Create detection record
-            detection = TrashDetection.objects.create(
-                image_url=default_storage.url(image_path),
-                detected_objects=[trash_type],
-                confidence_scores=[confidence],
-                location=request.data.get('location', {})
-            )
+            # A re-upload of an already recorded image links to the existing detection
+            detection = None
+            if cached and cached['detection_id'] and settings.RESULT_CACHE_LINK_DUPLICATES:
+                detection = TrashDetection.objects.filter(id=cached['detection_id']).first()
+            
+            if detection is None:
+                # Create detection record
+                with timed('db'):
+                    detection = record_detection(
+                        default_storage.url(image_path), detections, request.data.get('location', {})
+                    )
+                remember_detection(cache_key, detections, detection)
+                persist_upload(image_path, image)
             
             return Response({
                 'trash_detected': True,
                 'trash_type': trash_type,
                 'confidence': confidence,
                 'detection_id': detection.id,
+                'detections': detections,
                 'message': f'检测到{trash_type}，置信度{confidence}%'
             })
         else:
+            persist_upload(image_path, image)
             return Response({
                 'trash_detected': False,
                 'message': '未检测到垃圾'
             })
             
+    except InvalidImage:
+        return Response({'error': '无法解析上传的图像'}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'error': f'检测失败: {str(e)}'
@@ -204,17 +376,21 @@ def contact_robot(request):
         data = json.loads(request.body) if request.body else {}
         location = data.get('location', {'lat': 0, 'lng': 0})
         
-        # Create robot request
+        # Create the robot request and hand it to the robot that can reach it soonest
         robot_request = RobotRequest.objects.create(
             location=location,
-            status='pending',
-            eta_minutes=random.randint(15, 45),
-            robot_id=f'ROBOT_{random.randint(1000, 9999)}'
+            status='pending'
         )
         
-        # Simulate robot dispatch
-        robot_request.status = 'dispatched'
-        robot_request.save()
+        if not get_dispatcher().dispatch(robot_request):
+            return Response({
+                'success': True,
+                'request_id': robot_request.id,
+                'eta': None,
+                'robot_id': '',
+                'status': robot_request.status,
+                'message': '暂无可用机器人，请求已排队，机器人空闲后将自动派出'
+            })
         
         return Response({
             'success': True,
@@ -259,10 +435,93 @@ def cooperation_request(request):
             'error': f'合作请求失败: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class RobotRequestViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def inference_stats(request):
+    """Runtime statistics of the detector front end and the result cache"""
+    detector = get_detector()
+    cache = get_result_cache()
+    stats = {
+        'mode': type(detector).__name__,
+        'model_version': detector.model_version,
+        'result_cache': cache.stats() if cache is not None else None,
+    }
+    if hasattr(detector, 'stats'):
+        stats.update(detector.stats())
+    return Response(stats)
+
+@api_view(['GET'])
+def pipeline_metrics(request):
+    """Rolling per-stage latency percentiles of the detection pipeline"""
+    if not settings.METRICS_ENABLED:
+        return Response({'enabled': False})
+    
+    return Response({
+        'enabled': True,
+        'window_size': settings.METRICS_WINDOW_SIZE,
+        'stages': stage_metrics.summary()
+    })
+
+@api_view(['GET'])
+def analytics(request):
+    """Time-series of a rollup metric over an arbitrary range, e.g. objects per hour by class"""
+    serializer = AnalyticsQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        return Response(query_rollups(**serializer.validated_data))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@require_GET
+def event_stream(request):
+    """
+    Server-Sent Events of new detections, task and robot request status changes.
+    Plain Django view: DRF's content negotiation would reject Accept: text/event-stream.
+    """
+    topics = [topic for topic in request.GET.get('topics', ','.join(TOPICS)).split(',') if topic]
+    unknown = sorted(set(topics) - set(TOPICS))
+    if unknown or not topics:
+        return JsonResponse({'error': f'topics must be a comma-separated subset of {", ".join(TOPICS)}'}, status=400)
+    try:
+        matcher = area_matcher(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    # ASGI streams from a coroutine on the event loop; WSGI holds a thread per stream
+    events = astream if isinstance(request, ASGIRequest) else stream
+    response = StreamingHttpResponse(events(topics, matcher, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class RobotRequestViewSet(ProjectionMixin, GeoFilterMixin, viewsets.ModelViewSet):
     queryset = RobotRequest.objects.all()
     serializer_class = RobotRequestSerializer
+    cursor_ordering = ('-request_time', '-id')
+
+class RobotViewSet(ProjectionMixin, GeoFilterMixin, viewsets.ModelViewSet):
+    """Fleet registry; robots report position, state and battery by updating their record"""
+    queryset = Robot.objects.all()
+    serializer_class = RobotSerializer
+    cursor_ordering = ('id',)
+
+class HotspotViewSet(ProjectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Detection clusters with their aggregate counts; ?status=open|closed"""
+    queryset = Hotspot.objects.all()
+    serializer_class = HotspotSerializer
+    cursor_ordering = ('-last_seen', '-id')
+    
+    def get_queryset(self):
+        # The reverse task relation is not a column, so the projection loads full rows
+        queryset = super().get_queryset().select_related('task')
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
 
-class CooperationRequestViewSet(viewsets.ModelViewSet):
+class CooperationRequestViewSet(ProjectionMixin, viewsets.ModelViewSet):
     queryset = CooperationRequest.objects.all()
     serializer_class = CooperationRequestSerializer
+    cursor_ordering = ('-created_at', '-id')
@@ -0,0 +1,357 @@
+"""
+Process-pool inference so detection is not serialised on the GIL.
+
+Each worker process loads the model once. Images are handed over through a
+per-worker shared-memory segment; only the shape/dtype and the small list
+of detections cross the pipe. A worker that crashes or hangs is replaced
+and only the request it was serving fails.
+"""
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from . import metrics
+from .cv_model import ModelLoadError
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker process dies or times out while serving a request"""
+
+
+def _worker_main(conn, model_path, cv_threads=1):
+    # Imported here so the parent never pays for it on behalf of a worker
+    from .cv_model import TrashDetectionModel
+
+    # Parallelism comes from the pool; N workers each running OpenCV's full
+    # thread pool would oversubscribe the cores
+    cv2.setNumThreads(cv_threads)
+
+    model = TrashDetectionModel(model_path)
+    try:
+        model.warm_up()
+    except ModelLoadError as e:
+        # Re-raised by the parent: retrying cannot fix a missing or corrupt model
+        conn.send(('load_error', str(e)))
+        return
+    conn.send(('ready', None))
+
+    segment = None
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+
+            name, shape, dtype, tiling = message
+            if segment is None or segment.name != name:
+                if segment is not None:
+                    segment.close()
+                segment = shared_memory.SharedMemory(name=name)
+
+            image = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            with metrics.collect() as stages:
+                try:
+                    if tiling is not None:
+                        result = ('ok', model.detect_tiled(image, **tiling), stages)
+                    else:
+                        result = ('ok', model.detect_image(image), stages)
+                except Exception as e:
+                    result = ('error', f'{type(e).__name__}: {e}', stages)
+            del image
+            conn.send(result)
+    finally:
+        if segment is not None:
+            segment.close()
+
+
+class _Worker:
+    def __init__(self, index, context, model_path, slot_bytes, startup_timeout, cv_threads=1):
+        self.index = index
+        self.cv_threads = cv_threads
+        self.startup_timeout = startup_timeout
+        self.context = context
+        self.model_path = model_path
+        self.segment = shared_memory.SharedMemory(create=True, size=slot_bytes)
+        self.requests = 0
+        self.restarts = 0
+        self.process = None
+        self.conn = None
+        try:
+            self.spawn()
+        except Exception:
+            self.release()
+            raise
+
+    def spawn(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_path, self.cv_threads),
+            name=f'inference-worker-{self.index}',
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.requests = 0
+
+        # Wait until the model is loaded and warmed up before taking traffic
+        try:
+            ready = self.conn.poll(self.startup_timeout) and self.conn.recv()
+        except (EOFError, OSError):
+            ready = None
+        if ready and ready[0] == 'load_error':
+            self.kill()
+            raise ModelLoadError(ready[1])
+        if not ready:
+            self.kill()
+            raise WorkerError(f'Inference worker {self.index} failed to start')
+
+    def respawn(self):
+        self.kill()
+        self.restarts += 1
+        self.spawn()
+
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def terminate(self):
+        """Kill the process but leave the pipe to the request thread blocked on it, which then sees EOF"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+    def kill(self):
+        self.terminate()
+        self.conn.close()
+
+    def ensure_capacity(self, nbytes):
+        if nbytes > self.segment.size:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = shared_memory.SharedMemory(create=True, size=nbytes)
+
+    def release(self):
+        self.segment.close()
+        self.segment.unlink()
+
+
+class ProcessPoolDetector:
+    """
+    Runs detection in `num_workers` processes. Each request thread borrows an
+    idle worker, copies its image into that worker's shared-memory segment
+    and waits for the result, so up to `num_workers` images are processed in
+    parallel.
+
+    Exposes the same detect_trash/detect_image interface as
+    TrashDetectionModel so views can use either.
+    """
+
+    def __init__(self, model_path, num_workers, slot_bytes=32 * 1024 * 1024,
+                 timeout=30.0, max_requests_per_worker=0, startup_timeout=120.0, cv_threads=1):
+        self.model_path = model_path
+        self.num_workers = num_workers
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.max_requests_per_worker = max_requests_per_worker
+        self.startup_timeout = startup_timeout
+        self.cv_threads = cv_threads
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []
+        self._idle = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def model_version(self):
+        from .cv_model import model_version
+        return model_version(self.model_path)
+
+    def start(self):
+        with self._start_lock:
+            if self._workers:
+                return
+            for index in range(self.num_workers):
+                worker = _Worker(
+                    index, self._context, self.model_path, self.slot_bytes, self.startup_timeout,
+                    self.cv_threads,
+                )
+                self._workers.append(worker)
+                self._idle.put(worker)
+            atexit.register(self.shutdown)
+
+    def warm_up(self):
+        """Start every worker; each one loads the model and runs a dummy forward pass"""
+        self.start()
+
+    def _drain(self, timeout):
+        """
+        Take every worker out of the idle queue, waiting up to `timeout`
+        seconds in all (default: the request timeout) for busy ones. Returns
+        (idle workers, workers still held by a request).
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        taken = []
+        for _ in range(len(self._workers)):
+            try:
+                taken.append(self._idle.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        stuck = [worker for worker in self._workers if not any(worker is idle for idle in taken)]
+        return taken, stuck
+
+    def restart(self, timeout=None):
+        """
+        Gracefully replace every worker, waiting for in-flight requests to
+        finish. A worker still busy after `timeout` is killed; the request it
+        was serving fails and respawns it.
+        """
+        taken, stuck = self._drain(timeout)
+        for worker in stuck:
+            worker.terminate()
+        for worker in taken:
+            worker.stop()
+            worker.restarts += 1
+            worker.spawn()
+            self._idle.put(worker)
+
+    def shutdown(self, timeout=None):
+        if self._closed:
+            return
+        self._closed = True
+        taken, stuck = self._drain(timeout)
+        for worker in taken:
+            worker.stop()
+        for worker in stuck:
+            worker.terminate()
+        for worker in self._workers:
+            worker.release()
+
+    def _replace(self, worker):
+        """Respawn a failed worker, unless the pool has been shut down meanwhile"""
+        if self._closed:
+            worker.kill()
+        else:
+            worker.respawn()
+
+    def detect_image(self, image, tiling=None):
+        if self._closed:
+            raise WorkerError('Inference worker pool is shut down')
+        if not self._workers:
+            self.start()
+        image = np.ascontiguousarray(image)
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise WorkerError(f'No inference worker became free within {self.timeout} s') from None
+        try:
+            worker.ensure_capacity(image.nbytes)
+            np.ndarray(image.shape, dtype=image.dtype, buffer=worker.segment.buf)[...] = image
+            try:
+                self._send(worker, (worker.segment.name, image.shape, image.dtype.str, tiling))
+                if not worker.conn.poll(self.timeout):
+                    self._replace(worker)
+                    raise WorkerError(f'Inference worker {worker.index} timed out')
+                outcome, payload, stages = worker.conn.recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+                self._replace(worker)
+                raise WorkerError(f'Inference worker {worker.index} died')
+
+            worker.requests += 1
+            if self.max_requests_per_worker and worker.requests >= self.max_requests_per_worker:
+                self._recycle(worker)
+        finally:
+            self._idle.put(worker)
+
+        # Stage timings measured in the worker count towards this request
+        metrics.record_many(stages)
+        if outcome == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+    def _recycle(self, worker):
+        """
+        Replace a worker that reached max_requests_per_worker. The request
+        that triggered it already has its result, so a replacement that fails
+        to start is left dead for the next request's _send to respawn.
+        """
+        worker.stop()
+        worker.restarts += 1
+        try:
+            worker.spawn()
+        except (WorkerError, ModelLoadError) as e:
+            print(f"Error recycling inference worker {worker.index}: {e}")
+
+    def _send(self, worker, message):
+        """
+        Hand a request to `worker`. A worker that died while idle (or whose
+        pipe breaks on this send) is respawned and the send retried once:
+        the request never reached it, so it should not fail.
+        """
+        for attempt in range(2):
+            if not worker.process.is_alive():
+                worker.respawn()
+            try:
+                worker.conn.send(message)
+                return
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                if attempt:
+                    raise
+                worker.respawn()
+
+    def detect_batch(self, images):
+        """Spread several images over the workers; one result list per image"""
+        with ThreadPoolExecutor(max_workers=min(self.num_workers, len(images)) or 1) as executor:
+            return list(executor.map(self.detect_image, images))
+
+    def detect_tiled(self, image, **options):
+        return self.detect_image(image, tiling=options)
+
+    def detect_trash(self, image_path):
+        """Same contract as TrashDetectionModel.detect_trash"""
+        try:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Could not read image {image_path}")
+            return self.detect_image(image)
+
+        except ModelLoadError:
+            # A configured model that cannot load fails the request instead of finding nothing
+            raise
+        except Exception as e:
+            print(f"Error in trash detection: {e}")
+            return []
+
+    def stats(self):
+        return {
+            'num_workers': self.num_workers,
+            'idle_workers': self._idle.qsize(),
+            'workers': [
+                {
+                    'index': worker.index,
+                    'pid': worker.process.pid,
+                    'alive': worker.process.is_alive(),
+                    'requests': worker.requests,
+                    'restarts': worker.restarts,
+                }
+                for worker in self._workers
+            ],
+        }
@@ -0,0 +1,192 @@
+"""
+Group commit of detection inserts (WRITE_QUEUE_ENABLED).
+
+SQLite takes a database-wide lock for every write transaction, so each
+upload committing its own TrashDetection and CleanupTask rows serializes
+on that lock and on one fsync per request; under load requests start
+failing with "database is locked". With the write queue, requests hand
+their inserts to a single writer thread and wait for the result, for at
+most WRITE_QUEUE_TIMEOUT seconds. The
+writer takes everything queued (waiting up to WRITE_QUEUE_MAX_DELAY_MS
+for stragglers, at most WRITE_QUEUE_MAX_BATCH jobs) and runs it in one
+transaction, each job in its own savepoint so a failing insert does not
+take the rest of the group down. Ids are handed back once the group has
+committed, so a response never refers to a row that is not yet visible.
+
+The rows are created through the ORM, so the signal handlers (counters,
+rollups, cache invalidation, events) run as usual inside the group's
+transaction.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .hotspots import attach
+from .models import CleanupTask, TrashDetection
+
+
+class WriteTimeout(RuntimeError):
+    """A queued write was not committed within WRITE_QUEUE_TIMEOUT"""
+
+
+class GroupCommitWriter:
+    def __init__(self, max_batch, max_delay, timeout=30.0):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.groups = 0
+        self.jobs = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Commit whatever is queued and stop the writer thread"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue `func(*args, **kwargs)` for the next group; returns a Future of its result"""
+        self.start()
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def result(self, future):
+        """
+        Wait for a submitted write. If the writer is stalled or dead, give up
+        after `timeout` seconds with WriteTimeout; a write that has not
+        started by then is cancelled and never runs.
+        """
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise WriteTimeout(f'Write not committed within {self.timeout} s') from None
+
+    def run(self, func, *args, **kwargs):
+        return self.result(self.submit(func, *args, **kwargs))
+
+    def _collect(self, first):
+        jobs = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(jobs) < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            jobs, stopping = self._collect(job)
+            self._commit(jobs)
+        connection.close()
+
+    def _commit(self, jobs):
+        jobs = [job for job in jobs if job[3].set_running_or_notify_cancel()]
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for func, args, kwargs, future in jobs:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((func(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((None, e))
+        except Exception as e:
+            # The commit itself failed: nothing of the group was written
+            print(f"Group commit of {len(jobs)} writes failed: {e}")
+            for func, args, kwargs, future in jobs:
+                future.set_exception(e)
+            close_old_connections()
+            return
+
+        self.groups += 1
+        self.jobs += len(jobs)
+        for (func, args, kwargs, future), (result, error) in zip(jobs, outcomes):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = GroupCommitWriter(
+                settings.WRITE_QUEUE_MAX_BATCH, settings.WRITE_QUEUE_MAX_DELAY_MS / 1000.0,
+                timeout=settings.WRITE_QUEUE_TIMEOUT,
+            )
+    return _writer
+
+
+def insert_detection(image_url, detections, location, with_task=False):
+    """
+    Create a detection for `detections`. If `with_task` and anything was
+    found, it joins the nearby open hotspot, or opens one with a pending
+    cleanup task (see api.hotspots).
+    """
+    detected_objects = [det['class'] for det in detections]
+    detected_at = timezone.now()
+    with transaction.atomic():
+        hotspot, opened = None, False
+        if with_task and detected_objects:
+            hotspot, opened = attach(location, detected_objects, detected_at)
+        detection = TrashDetection.objects.create(
+            image_url=image_url,
+            detected_objects=detected_objects,
+            confidence_scores=[det['confidence'] for det in detections],
+            location=location,
+            detected_at=detected_at,
+            hotspot=hotspot,
+        )
+        if opened:
+            CleanupTask.objects.create(detection=detection, status='pending', hotspot=hotspot)
+    return detection
+
+
+def submit_detection(image_url, detections, location, with_task=False):
+    """insert_detection on the group-commit writer; returns a Future of the detection"""
+    return get_writer().submit(insert_detection, image_url, detections, location, with_task)
+
+
+def record_detection(image_url, detections, location, with_task=False):
+    """insert_detection, through the group-commit writer when WRITE_QUEUE_ENABLED"""
+    if settings.WRITE_QUEUE_ENABLED:
+        return get_writer().run(insert_detection, image_url, detections, location, with_task)
+    return insert_detection(image_url, detections, location, with_task)
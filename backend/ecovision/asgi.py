@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecovision.settings')
 
 application = get_asgi_application()
+
+# Optionally load the model and run a dummy forward pass before serving traffic
+from django.conf import settings  # noqa: E402
+
+if settings.TRASH_MODEL_WARMUP:
+    from api.cv_model import warm_up  # noqa: E402
+    warm_up()
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.StageTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -64,8 +65,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests instead of reconnecting every time
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a writer waits for the database lock before "database is locked"
+            'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+        },
     }
 }
+# Write-ahead logging lets reads proceed while a write is in progress;
+# synchronous=NORMAL is durable across application crashes in WAL mode
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'True') == 'True'
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -108,7 +120,11 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    # Cursor pagination on every list endpoint; ?page_size= up to API_MAX_PAGE_SIZE
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.TimeCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '500'))
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
@@ -123,3 +139,122 @@ CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Computer vision model settings
+# Path to a YOLOv8 ONNX export; leave empty to serve mock detections
+TRASH_MODEL_PATH = os.getenv('TRASH_MODEL_PATH', '')
+TRASH_MODEL_INPUT_SIZE = int(os.getenv('TRASH_MODEL_INPUT_SIZE', '640'))
+TRASH_MODEL_CONF_THRESHOLD = float(os.getenv('TRASH_MODEL_CONF_THRESHOLD', '0.25'))
+TRASH_MODEL_NMS_THRESHOLD = float(os.getenv('TRASH_MODEL_NMS_THRESHOLD', '0.45'))
+TRASH_MODEL_MAX_DETECTIONS = int(os.getenv('TRASH_MODEL_MAX_DETECTIONS', '300'))
+# The model is loaded on first use; set this to load it and run a dummy
+# forward pass when the WSGI/ASGI application starts instead
+TRASH_MODEL_WARMUP = os.getenv('TRASH_MODEL_WARMUP', 'False') == 'True'
+
+# Micro-batching: gather concurrent detection requests into one forward pass
+TRASH_BATCHING_ENABLED = os.getenv('TRASH_BATCHING_ENABLED', 'False') == 'True'
+TRASH_BATCH_MAX_SIZE = int(os.getenv('TRASH_BATCH_MAX_SIZE', '8'))
+TRASH_BATCH_MAX_WAIT_MS = float(os.getenv('TRASH_BATCH_MAX_WAIT_MS', '5'))
+# Seconds a request waits for its batch before failing
+TRASH_BATCH_TIMEOUT = float(os.getenv('TRASH_BATCH_TIMEOUT', '30'))
+
+# Process-pool inference: run detection in N worker processes (0 = in-process).
+# Takes precedence over micro-batching when enabled.
+TRASH_INFERENCE_WORKERS = int(os.getenv('TRASH_INFERENCE_WORKERS', '0'))
+TRASH_WORKER_SLOT_MB = int(os.getenv('TRASH_WORKER_SLOT_MB', '32'))
+TRASH_WORKER_TIMEOUT = float(os.getenv('TRASH_WORKER_TIMEOUT', '30'))
+TRASH_WORKER_MAX_REQUESTS = int(os.getenv('TRASH_WORKER_MAX_REQUESTS', '0'))  # 0 = never recycle
+# OpenCV threads per worker; keep workers x threads at or below the core count
+TRASH_WORKER_CV_THREADS = int(os.getenv('TRASH_WORKER_CV_THREADS', '1'))
+
+# Uploaded images are decoded in memory for detection and written to storage
+# afterwards; with UPLOAD_PERSIST_ASYNC the write happens on a background thread
+UPLOAD_PERSIST_ASYNC = os.getenv('UPLOAD_PERSIST_ASYNC', 'True') == 'True'
+UPLOAD_PERSIST_WORKERS = int(os.getenv('UPLOAD_PERSIST_WORKERS', '2'))
+
+# Async detection views for ASGI deployments (also served under /api/async/)
+ASYNC_DETECTION_VIEWS = os.getenv('ASYNC_DETECTION_VIEWS', 'False') == 'True'
+ASYNC_INFERENCE_THREADS = int(os.getenv('ASYNC_INFERENCE_THREADS', '4'))  # decode/inference executor size
+
+# Group commit: detection inserts from concurrent requests share one transaction
+WRITE_QUEUE_ENABLED = os.getenv('WRITE_QUEUE_ENABLED', 'False') == 'True'
+WRITE_QUEUE_MAX_BATCH = int(os.getenv('WRITE_QUEUE_MAX_BATCH', '64'))  # writes per transaction
+WRITE_QUEUE_MAX_DELAY_MS = float(os.getenv('WRITE_QUEUE_MAX_DELAY_MS', '2'))  # wait for more writes
+# Seconds a request waits for its write to commit; keep above SQLITE_BUSY_TIMEOUT
+WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', '30'))
+
+# Images accepted by one /api/detections/batch_upload/ request
+BATCH_UPLOAD_MAX_IMAGES = int(os.getenv('BATCH_UPLOAD_MAX_IMAGES', '64'))
+DATA_UPLOAD_MAX_NUMBER_FILES = max(100, BATCH_UPLOAD_MAX_IMAGES)
+
+# Content-hash cache of detection results for re-uploaded images
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True') == 'True'
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '3600'))  # seconds
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')  # shared on-disk tier; empty disables it
+# Return the existing detection for a duplicate upload instead of creating a new row
+RESULT_CACHE_LINK_DUPLICATES = os.getenv('RESULT_CACHE_LINK_DUPLICATES', 'True') == 'True'
+
+# Cached responses of the polled read endpoints, invalidated on writes to the models they read.
+# Local memory by default; point RESPONSE_CACHE_BACKEND/LOCATION at a shared cache (e.g.
+# django.core.cache.backends.redis.RedisCache, redis://127.0.0.1:6379/1) for multi-process deployments.
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '60'))  # seconds; bounds staleness across processes
+RESPONSE_CACHE_ALIAS = 'responses'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': os.getenv('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'ecovision-responses'),
+        'TIMEOUT': RESPONSE_CACHE_TTL,
+    },
+}
+
+# Tiled detection for high-resolution images (per-request options override these)
+TRASH_TILE_SIZE = int(os.getenv('TRASH_TILE_SIZE', '0'))  # source pixels per tile; 0 = model input size
+TRASH_TILE_OVERLAP = float(os.getenv('TRASH_TILE_OVERLAP', '0.2'))
+TRASH_TILE_MAX = int(os.getenv('TRASH_TILE_MAX', '16'))
+# Suppress a box when this fraction of it lies inside a stronger box of the same class
+TRASH_TILE_CONTAINMENT_THRESHOLD = float(os.getenv('TRASH_TILE_CONTAINMENT_THRESHOLD', '0.8'))
+
+# Per-stage latency instrumentation of the detection pipeline
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_WINDOW_SIZE = int(os.getenv('METRICS_WINDOW_SIZE', '2048'))  # samples kept per stage
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'False') == 'True'
+
+# Time-bucketed rollups behind /api/analytics/
+# Hourly buckets older than this many days are dropped once compacted into daily ones; 0 keeps them
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.getenv('ROLLUP_HOURLY_RETENTION_DAYS', '90'))
+ANALYTICS_MAX_BUCKETS = int(os.getenv('ANALYTICS_MAX_BUCKETS', '2000'))  # per analytics response
+
+# Robot dispatch: requests go to the idle robot that reaches them soonest
+DISPATCH_CELL_DEGREES = float(os.getenv('DISPATCH_CELL_DEGREES', '0.01'))  # fleet index grid cell
+DISPATCH_MAX_DISTANCE_METERS = float(os.getenv('DISPATCH_MAX_DISTANCE_METERS', '20000'))  # farther requests queue
+DISPATCH_MIN_BATTERY = float(os.getenv('DISPATCH_MIN_BATTERY', '20'))  # percent
+DISPATCH_ROUTE_FACTOR = float(os.getenv('DISPATCH_ROUTE_FACTOR', '1.3'))  # street distance / straight line
+DISPATCH_BATTERY_PER_KM = float(os.getenv('DISPATCH_BATTERY_PER_KM', '0.5'))  # percent
+DISPATCH_INDEX_TTL = float(os.getenv('DISPATCH_INDEX_TTL', '30'))  # seconds between reloads from the database
+
+# Batch route planning of pending cleanup tasks (POST /api/tasks/plan_routes/)
+ROUTE_MAX_STOPS = int(os.getenv('ROUTE_MAX_STOPS', '50'))  # tasks per robot route
+ROUTE_PLAN_TIME_BUDGET_MS = int(os.getenv('ROUTE_PLAN_TIME_BUDGET_MS', '2000'))  # local search budget
+
+# Detections within HOTSPOT_RADIUS_METERS of an open hotspot seen in the last HOTSPOT_WINDOW_HOURS
+# join it instead of opening another cleanup task
+HOTSPOT_ENABLED = os.getenv('HOTSPOT_ENABLED', 'True') == 'True'
+HOTSPOT_RADIUS_METERS = float(os.getenv('HOTSPOT_RADIUS_METERS', '30'))
+HOTSPOT_WINDOW_HOURS = float(os.getenv('HOTSPOT_WINDOW_HOURS', '24'))
+
+# Server-Sent Events at /api/events/ (per process: serve it from a single ASGI worker)
+EVENT_STREAM_REPLAY_SIZE = int(os.getenv('EVENT_STREAM_REPLAY_SIZE', '1000'))  # events kept for reconnects
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv('EVENT_STREAM_QUEUE_SIZE', '256'))  # backlog before a slow client is dropped
+EVENT_STREAM_HEARTBEAT = float(os.getenv('EVENT_STREAM_HEARTBEAT', '15'))  # seconds between keepalives
+# Streams are closed after this many seconds and the client reconnects with Last-Event-ID
+EVENT_STREAM_MAX_AGE = float(os.getenv('EVENT_STREAM_MAX_AGE', '300'))
+EVENT_STREAM_RETRY_MS = int(os.getenv('EVENT_STREAM_RETRY_MS', '3000'))  # client reconnect delay
+
+# Grid index behind the bbox/radius filters; run `manage.py rebuild_geo_index` after changing the cell size
+GEO_CELL_DEGREES = float(os.getenv('GEO_CELL_DEGREES', '0.01'))  # ~1.1 km at the equator
+GEO_MAX_CELL_ROWS = int(os.getenv('GEO_MAX_CELL_ROWS', '64'))  # taller boxes scan their whole latitude band
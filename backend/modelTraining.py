@@ -35,6 +35,8 @@ os.makedirs(IMAGES_DIR, exist_ok=True)
 
 # --- 3. Data Simulation (in place of downloading 4000 hyperlinks) ---
 # In a real-world application, you would use the function below to download images.
+# For the image/mask URL lists in model_training/images/*.csv, use
+# model_training/download_dataset.py instead: it downloads concurrently, retries and resumes.
 # To make this script runnable without 4000 actual links, we'll simulate the data.
 
 def download_images_from_hyperlinks(hyperlinks, save_dir):
@@ -88,6 +90,10 @@ simulate_image_data(NUM_IMAGES, NUM_CLASSES, IMAGES_DIR)
 # --- 4. Data Preprocessing and Augmentation ---
 # We use ImageDataGenerator to load images from directories, preprocess them,
 # and apply data augmentation to improve model generalization.
+# flow_from_directory decodes every PNG again each epoch; model_training/pack_dataset.py
+# packs the images once into memory-mapped shards that PackedDataset serves batches from.
+# model_training/augment_pipeline.py applies the augmentations below to those batches
+# in a pool of worker processes, prefetching ahead of training.
 
 # Create data generators for training and validation
 datagen = ImageDataGenerator(
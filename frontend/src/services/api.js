@@ -65,6 +65,20 @@ class ApiService {
     async getCooperationRequests() {
         return this.makeRequest('/cooperation-requests/')
     }
+
+    // Live updates: detection.created, task.created/task.status, robot.created/robot.status
+    // and reset (refetch lists, missed events are no longer buffered). Returns the EventSource;
+    // call close() on it to unsubscribe. The browser reconnects with Last-Event-ID by itself.
+    subscribeEvents(handlers, { topics, bbox } = {}) {
+        const params = new URLSearchParams()
+        if (topics) params.set('topics', topics.join(','))
+        if (bbox) params.set('bbox', bbox.join(','))
+        const source = new EventSource(`${this.baseUrl}/events/?${params}`)
+        for (const [type, handler] of Object.entries(handlers)) {
+            source.addEventListener(type, (event) => handler(type === 'reset' ? {} : JSON.parse(event.data)))
+        }
+        return source
+    }
 }
 
 export default new ApiService() 
\ No newline at end of file
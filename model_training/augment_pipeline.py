@@ -0,0 +1,299 @@
+# Multi-process augmentation and prefetch pipeline over a packed dataset (see pack_dataset.py).
+#
+# Applies the augmentations of the ImageDataGenerator in modelTraining.py - rotation,
+# width/height shift, shear, zoom, horizontal flip, nearest fill, 1/255 rescale -
+# without Keras. For each batch the random parameters are drawn and the affine
+# matrices composed for all images at once in NumPy, flip included, so every image
+# then takes a single cv2.warpAffine (masks are warped with the same matrix,
+# nearest-neighbour).
+#
+# Batches are augmented by a pool of worker processes, each reading its images from
+# the dataset's memory maps and writing the result straight into one of
+# prefetch + 1 shared-memory slots, so no image data is pickled between processes.
+# Up to --prefetch batches are in flight ahead of the consumer.
+#
+# Each batch is seeded from (seed, epoch, batch number), so the output does not
+# depend on the number of workers or on which worker ran which batch.
+#
+# Usage (throughput benchmark):
+#   python model_training/augment_pipeline.py PACKED_DIR [--workers N] [--prefetch 4] [--batches 200]
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import get_context, shared_memory
+
+import cv2
+import numpy as np
+
+from pack_dataset import PackedDataset
+
+# Same settings as the ImageDataGenerator in modelTraining.py
+AUGMENTATION = {
+    "rotation_range": 20,        # degrees
+    "width_shift_range": 0.2,    # fraction of the width
+    "height_shift_range": 0.2,   # fraction of the height
+    "shear_range": 0.2,          # degrees, as in Keras
+    "zoom_range": 0.2,           # each axis scaled by [1 - z, 1 + z]
+    "horizontal_flip": True,
+}
+RESCALE = 1.0 / 255
+
+
+def sample_parameters(rng, count, config=AUGMENTATION):
+    """Random augmentation parameters of `count` images, one array per parameter"""
+    zoom = config["zoom_range"]
+    return {
+        "rotation": np.deg2rad(rng.uniform(-config["rotation_range"], config["rotation_range"], count)),
+        "shift_x": rng.uniform(-config["width_shift_range"], config["width_shift_range"], count),
+        "shift_y": rng.uniform(-config["height_shift_range"], config["height_shift_range"], count),
+        "shear": np.deg2rad(rng.uniform(-config["shear_range"], config["shear_range"], count)),
+        "zoom_x": rng.uniform(1 - zoom, 1 + zoom, count),
+        "zoom_y": rng.uniform(1 - zoom, 1 + zoom, count),
+        "flip": (rng.random(count) < 0.5) if config["horizontal_flip"] else np.zeros(count, dtype=bool),
+    }
+
+
+def affine_matrices(params, height, width):
+    """
+    (count, 2, 3) matrices mapping output pixels to input pixels (for
+    WARP_INVERSE_MAP), composed like Keras' apply_affine_transform around the
+    image centre: rotation, shift, shear, zoom, then the horizontal flip.
+    """
+    count = len(params["rotation"])
+
+    def stack(rows):
+        matrix = np.zeros((count, 3, 3))
+        for (r, c), value in rows.items():
+            matrix[:, r, c] = value
+        matrix[:, 2, 2] = 1.0
+        return matrix
+
+    cos, sin = np.cos(params["rotation"]), np.sin(params["rotation"])
+    rotation = stack({(0, 0): cos, (0, 1): -sin, (1, 0): sin, (1, 1): cos})
+    shift = stack({(0, 0): 1.0, (1, 1): 1.0, (0, 2): params["shift_x"] * width, (1, 2): params["shift_y"] * height})
+    shear = stack({(0, 0): 1.0, (0, 1): -np.sin(params["shear"]), (1, 1): np.cos(params["shear"])})
+    zoom = stack({(0, 0): params["zoom_x"], (1, 1): params["zoom_y"]})
+    center_x, center_y = (width - 1) / 2.0, (height - 1) / 2.0
+    to_center = stack({(0, 0): 1.0, (1, 1): 1.0, (0, 2): -center_x, (1, 2): -center_y})
+    from_center = stack({(0, 0): 1.0, (1, 1): 1.0, (0, 2): center_x, (1, 2): center_y})
+    flip_x = np.where(params["flip"], -1.0, 1.0)
+    flip = stack({(0, 0): flip_x, (1, 1): 1.0, (0, 2): np.where(params["flip"], width - 1.0, 0.0)})
+    return (from_center @ rotation @ shift @ shear @ zoom @ to_center @ flip)[:, :2, :]
+
+
+def augment_batch(images, targets, rng, out, mask_out=None, config=AUGMENTATION, rescale=RESCALE):
+    """
+    Augments a batch into `out` (float32 images are also rescaled) and, for
+    image/mask datasets, the masks into `mask_out`.
+    """
+    count, height, width = images.shape[:3]
+    matrices = affine_matrices(sample_parameters(rng, count, config), height, width)
+    flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+    scratch = np.empty(images.shape[1:], dtype=np.uint8) if out.dtype != np.uint8 else None
+    for i in range(count):
+        dst = out[i] if scratch is None else scratch
+        cv2.warpAffine(images[i], matrices[i], (width, height), dst=dst, flags=flags, borderMode=cv2.BORDER_REPLICATE)
+        if scratch is not None:
+            np.multiply(scratch, rescale, out=out[i], casting="unsafe")
+        if mask_out is not None:
+            cv2.warpAffine(targets[i], matrices[i], (width, height), dst=mask_out[i],
+                           flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+
+
+def batch_rng(seed, epoch, number=None):
+    """Generator of batch `number` of an epoch, or of the epoch's shuffle order without one"""
+    return np.random.default_rng(np.random.SeedSequence([seed, epoch, 0 if number is None else number + 1]))
+
+
+# Per-process state of the pool workers, set by _init_worker
+_worker = {}
+
+
+def _attach(name, shape, dtype):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _init_worker(dataset_path, indices, slots, config, rescale):
+    # One thread per process: parallelism comes from the pool
+    cv2.setNumThreads(1)
+    _worker["dataset"] = PackedDataset(dataset_path, indices)
+    _worker["slots"] = [
+        tuple(_attach(*spec) if spec is not None else (None, None) for spec in slot)
+        for slot in slots
+    ]
+    _worker["config"], _worker["rescale"] = config, rescale
+
+
+def _run_batch(slot, batch_indices, seed, epoch, number):
+    """Augments one batch into shared-memory `slot`; returns the labels (None for masks or unlabelled data)"""
+    dataset = _worker["dataset"]
+    (_, out), (_, mask_out) = _worker["slots"][slot]
+    images, targets = dataset.gather(batch_indices)
+    count = len(batch_indices)
+    augment_batch(images, targets, batch_rng(seed, epoch, number), out[:count],
+                  None if mask_out is None else mask_out[:count], _worker["config"], _worker["rescale"])
+    return None if dataset.has_masks else targets
+
+
+class AugmentationPipeline:
+    """
+    Augmented, shuffled batches of a PackedDataset.
+        with AugmentationPipeline(dataset, batch_size=32, workers=4) as pipeline:
+            for images, targets in pipeline.epoch(0):
+                ...
+    Yielded arrays live in a shared-memory slot that is reused once the next
+    batch is requested; copy them to keep them longer. workers=0 augments in
+    the calling process (same output).
+    """
+
+    def __init__(self, dataset, batch_size=32, workers=None, prefetch=4, seed=0, shuffle=True,
+                 dtype=np.float32, config=AUGMENTATION, rescale=RESCALE):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self.prefetch = max(1, prefetch)
+        self.seed = seed
+        self.shuffle = shuffle
+        self.dtype = np.dtype(dtype)
+        self.config = config
+        self.rescale = rescale
+        self._memory = []
+        self._slots = []
+        self._pool = None
+
+    def __len__(self):
+        return -(-len(self.dataset) // self.batch_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _allocate(self, shape, dtype):
+        """A shared-memory array: (spec the workers attach with, view for this process)"""
+        dtype = np.dtype(dtype)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self._memory.append(memory)
+        return (memory.name, shape, dtype.str), np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+    def _start(self):
+        if self._pool is not None or not self.workers:
+            return
+        image_shape = (self.batch_size,) + self.dataset.image_shape
+        specs = []
+        for _ in range(self.prefetch + 1):
+            images = self._allocate(image_shape, self.dtype)
+            masks = self._allocate(image_shape[:3], np.uint8) if self.dataset.has_masks else (None, None)
+            specs.append((images[0], masks[0]))
+            self._slots.append((images[1], masks[1]))
+        self._pool = get_context("fork" if sys.platform != "win32" else "spawn").Pool(
+            self.workers, _init_worker,
+            (self.dataset.path, self.dataset.indices, specs, self.config, self.rescale),
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._slots = []
+        for memory in self._memory:
+            try:
+                memory.close()
+            except BufferError:
+                # The caller still holds a yielded batch; the mapping goes away with it
+                pass
+            memory.unlink()
+        self._memory = []
+
+    def _order(self, epoch):
+        if self.shuffle:
+            return batch_rng(self.seed, epoch).permutation(len(self.dataset))
+        return np.arange(len(self.dataset))
+
+    def epoch(self, epoch=0):
+        """Yields the (images, targets) batches of one epoch; the shuffle and augmentation follow (seed, epoch)"""
+        order = self._order(epoch)
+        batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+        if not self.workers:
+            yield from self._serial(batches, epoch)
+            return
+
+        self._start()
+        pending = deque()
+        submitted = 0
+        for number, batch_indices in enumerate(batches):
+            while submitted < len(batches) and submitted <= number + self.prefetch:
+                slot = submitted % len(self._slots)
+                pending.append(self._pool.apply_async(
+                    _run_batch, (slot, batches[submitted], self.seed, epoch, submitted)))
+                submitted += 1
+            labels = pending.popleft().get()
+            out, mask_out = self._slots[number % len(self._slots)]
+            count = len(batch_indices)
+            yield out[:count], (mask_out[:count] if mask_out is not None else labels)
+
+    def _serial(self, batches, epoch):
+        image_shape = (self.batch_size,) + self.dataset.image_shape
+        out = np.empty(image_shape, dtype=self.dtype)
+        mask_out = np.empty(image_shape[:3], dtype=np.uint8) if self.dataset.has_masks else None
+        for number, batch_indices in enumerate(batches):
+            images, targets = self.dataset.gather(batch_indices)
+            count = len(batch_indices)
+            augment_batch(images, targets, batch_rng(self.seed, epoch, number), out[:count],
+                          None if mask_out is None else mask_out[:count], self.config, self.rescale)
+            yield out[:count], (mask_out[:count] if mask_out is not None else targets)
+
+
+def benchmark(dataset, batch_size, workers, prefetch, batches, seed=0):
+    """Images per second of the pipeline over the first `batches` batches, after one warm-up batch"""
+    with AugmentationPipeline(dataset, batch_size=batch_size, workers=workers, prefetch=prefetch, seed=seed) as pipeline:
+        produced = 0
+        started = None
+        epoch = 0
+        while produced < batches * batch_size:
+            for images, targets in pipeline.epoch(epoch):
+                if started is None:
+                    started = time.perf_counter()
+                    continue
+                produced += len(images)
+                if produced >= batches * batch_size:
+                    break
+            epoch += 1
+        elapsed = time.perf_counter() - started
+    return {"workers": workers, "images": produced, "seconds": elapsed, "images_per_s": produced / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the augmentation pipeline on a packed dataset.")
+    parser.add_argument("dataset", help="Directory written by pack_dataset.py")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count()],
+                        help="Worker counts to compare (0 = in-process)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches augmented ahead of the consumer")
+    parser.add_argument("--batches", type=int, default=100, help="Batches timed per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    dataset = PackedDataset(args.dataset)
+    results = []
+    for workers in args.workers:
+        result = benchmark(dataset, args.batch_size, workers, args.prefetch, args.batches, args.seed)
+        results.append(result)
+        print(f"workers={workers}: {result['images_per_s']:.0f} images/s "
+              f"({result['images']} images in {result['seconds']:.2f} s)")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"batch_size": args.batch_size, "prefetch": args.prefetch, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
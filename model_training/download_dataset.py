@@ -0,0 +1,244 @@
+# Dataset downloader for the image/mask URL lists in model_training/images/
+#
+# testing.csv and verification.csv hold one "image_url,mask_url" pair per row.
+# Files are fetched by a bounded pool of worker threads, each keeping its own
+# requests.Session so connections to the image host are reused. Failed requests
+# (connection errors, timeouts, 429 and 5xx) are retried with exponential
+# backoff, and an interrupted transfer continues from its partial file with an
+# HTTP Range request.
+#
+# Files are stored as downloaded (no re-encoding), content-addressed under
+# objects/<sha256[:2]>/<sha256>, so identical files are kept once.
+# Every finished URL is appended to manifest.jsonl; a rerun skips the URLs
+# already in the manifest whose object is on disk and only fetches the rest.
+#
+# Usage:
+#   python model_training/download_dataset.py [CSV ...] [--out DIR] [--workers 16]
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSVS = [
+    os.path.join(HERE, "images", "testing.csv"),
+    os.path.join(HERE, "images", "verification.csv"),
+]
+DEFAULT_OUT = os.path.join(HERE, "data")
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """A URL that could not be fetched (after retries, if the failure was transient)"""
+
+
+def read_pairs(csv_path):
+    """
+    Reads an image/mask URL list.
+    Returns:
+        list: (split, row, kind, url) for every URL, split being the CSV's file name without extension.
+    """
+    split = os.path.splitext(os.path.basename(csv_path))[0]
+    entries = []
+    with open(csv_path, newline="") as f:
+        for row, fields in enumerate(csv.reader(f)):
+            for kind, url in zip(("image", "mask"), fields):
+                url = url.strip()
+                if url:
+                    entries.append((split, row, kind, url))
+    return entries
+
+
+def load_manifest(path):
+    """url -> manifest entry of every completed download; a torn last line is ignored"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[entry["url"]] = entry
+    return done
+
+
+class Downloader:
+    def __init__(self, out_dir, workers=16, retries=4, timeout=30.0, backoff=0.5):
+        self.out_dir = out_dir
+        self.objects_dir = os.path.join(out_dir, "objects")
+        self.partial_dir = os.path.join(out_dir, "partial")
+        self.manifest_path = os.path.join(out_dir, "manifest.jsonl")
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self._local = threading.local()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def _session(self):
+        """This thread's session; its connection pool is reused for every file the thread fetches"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _delay(self, attempt, retry_after=None):
+        """Seconds before retry `attempt`: the server's Retry-After, else jittered exponential backoff"""
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    def _fetch(self, url, partial):
+        """
+        Downloads `url` into `partial`, continuing from its current size.
+        Returns:
+            tuple: (done, retry_after); done is False when the transfer should be retried.
+        Raises:
+            DownloadError: On a failure retrying cannot fix (e.g. 404).
+        """
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # Nothing past our offset: the partial file is already complete
+                return True, None
+            if response.status_code in RETRY_STATUSES:
+                return False, response.headers.get("Retry-After")
+            if response.status_code not in (200, 206):
+                raise DownloadError(f"HTTP {response.status_code}")
+            # A server that ignores Range sends the whole file again
+            mode = "ab" if response.status_code == 206 else "wb"
+            with open(partial, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+            expected = response.headers.get("Content-Length")
+            if expected is not None and response.status_code == 200 and os.path.getsize(partial) != int(expected):
+                return False, None
+        return True, None
+
+    def download(self, url):
+        """
+        Fetches one URL into the object store.
+        Returns:
+            dict: Its manifest entry (url, sha256, path relative to the output directory, bytes).
+        Raises:
+            DownloadError: When the URL fails permanently or on every attempt.
+        """
+        partial = os.path.join(self.partial_dir, hashlib.sha1(url.encode()).hexdigest() + ".part")
+        for attempt in range(self.retries + 1):
+            try:
+                done, retry_after = self._fetch(url, partial)
+                error = "server kept failing"
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                done, retry_after, error = False, None, str(e)
+            if done:
+                break
+            if attempt == self.retries:
+                raise DownloadError(error)
+            time.sleep(self._delay(attempt, retry_after))
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(partial, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        if not size:
+            os.remove(partial)
+            raise DownloadError("empty response")
+        digest = digest.hexdigest()
+        path = self.object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial, path)
+        return {"url": url, "sha256": digest, "path": os.path.relpath(path, self.out_dir), "bytes": size}
+
+    def run(self, entries, limit=None):
+        """
+        Downloads every entry not already in the manifest.
+        Args:
+            entries (list): (split, row, kind, url) tuples from read_pairs.
+            limit (int): Fetch at most this many files (for trial runs).
+        Returns:
+            dict: Counts of downloaded, skipped and failed URLs.
+        """
+        done = load_manifest(self.manifest_path)
+        todo, seen, skipped = [], set(), 0
+        for split, row, kind, url in entries:
+            if url in seen:
+                continue
+            seen.add(url)
+            entry = done.get(url)
+            if entry and os.path.exists(os.path.join(self.out_dir, entry["path"])):
+                skipped += 1
+                continue
+            todo.append((split, row, kind, url))
+        if limit is not None:
+            todo = todo[:limit]
+
+        print(f"{len(todo)} files to download, {skipped} already done")
+        downloaded = failed = 0
+        started = time.time()
+        with open(self.manifest_path, "a") as manifest, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.download, item[3]): item for item in todo}
+            for future in as_completed(futures):
+                split, row, kind, url = futures[future]
+                try:
+                    entry = future.result()
+                except DownloadError as e:
+                    failed += 1
+                    print(f"Error downloading {url}: {e}")
+                    continue
+                entry.update(split=split, row=row, kind=kind)
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+                downloaded += 1
+                if downloaded % 100 == 0:
+                    rate = downloaded / max(time.time() - started, 1e-9)
+                    print(f"Downloaded {downloaded}/{len(todo)} ({rate:.1f} files/s)")
+
+        elapsed = time.time() - started
+        print(f"Downloaded {downloaded}, skipped {skipped}, failed {failed} in {elapsed:.1f} s")
+        return {"downloaded": downloaded, "skipped": skipped, "failed": failed, "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the image/mask pairs listed in the dataset CSVs.")
+    parser.add_argument("csv", nargs="*", default=DEFAULT_CSVS, help="URL lists (default: testing.csv and verification.csv)")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Output directory holding objects/ and manifest.jsonl")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent downloads")
+    parser.add_argument("--retries", type=int, default=4, help="Retries of a failed request")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds per request")
+    parser.add_argument("--limit", type=int, default=None, help="Download at most this many files")
+    args = parser.parse_args(argv)
+
+    entries = []
+    for path in args.csv:
+        entries.extend(read_pairs(path))
+    downloader = Downloader(args.out, workers=args.workers, retries=args.retries, timeout=args.timeout)
+    result = downloader.run(entries, limit=args.limit)
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# Packs a training set into fixed-shape uint8 shards that are memory-mapped at training time.
+#
+# flow_from_directory opens and decodes every PNG again on every epoch. Here each
+# image is decoded and resized once (in a process pool), and written into
+# .npy shards of --shard-size images of shape (height, width, 3), RGB. The
+# output directory holds:
+#
+#   index.json           image shape, shard files and counts, class names
+#   images-00000.npy     (count, height, width, 3) uint8
+#   masks-00000.npy      (count, height, width) uint8, for image/mask pairs
+#   labels.npy           (N,) int32 class index, for class-folder sources
+#   sources.txt          the source of every packed image, in order
+#
+# Two sources are supported:
+#   --images-dir DIR     one subdirectory per class, as read by flow_from_directory
+#   --download-dir DIR   image/mask pairs fetched by download_dataset.py, with --split
+#                        naming the CSV (testing or verification) to pack
+#
+# PackedDataset serves random-access and shuffled batches straight from the shards
+# through np.memmap, so only the pages a batch touches are read into memory.
+#
+# Usage:
+#   python model_training/pack_dataset.py --images-dir cv_data/images --out cv_data/packed
+#   python model_training/pack_dataset.py --download-dir model_training/data --split testing --out packed/testing
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from download_dataset import DEFAULT_CSVS, load_manifest, read_pairs
+
+IMAGE_SIZE = (224, 224)
+SHARD_SIZE = 2048
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+INDEX_FILE = "index.json"
+
+
+def class_folder_items(images_dir):
+    """
+    Lists the images of a class-folder tree.
+    Returns:
+        tuple: ([(image_path, None, label)], class_names), classes numbered in sorted order like flow_from_directory.
+    """
+    classes = sorted(d for d in os.listdir(images_dir) if os.path.isdir(os.path.join(images_dir, d)))
+    items = []
+    for label, name in enumerate(classes):
+        class_dir = os.path.join(images_dir, name)
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.join(class_dir, filename), None, label))
+    return items, classes
+
+
+def download_items(download_dir, split, csv_paths=DEFAULT_CSVS):
+    """
+    Pairs the rows of `split` with the files download_dataset.py stored for them.
+    Returns:
+        list: (image_path, mask_path, None) for every row whose image and mask were both downloaded.
+    """
+    files = {url: os.path.join(download_dir, entry["path"]) for url, entry in load_manifest(
+        os.path.join(download_dir, "manifest.jsonl")).items()}
+    rows = {}
+    for csv_path in csv_paths:
+        for entry_split, row, kind, url in read_pairs(csv_path):
+            if entry_split == split:
+                rows.setdefault(row, {})[kind] = files.get(url)
+    items = [
+        (pair["image"], pair["mask"], None)
+        for row, pair in sorted(rows.items())
+        if pair.get("image") and pair.get("mask")
+    ]
+    missing = len(rows) - len(items)
+    if missing:
+        print(f"Skipping {missing} rows of {split} that are not fully downloaded")
+    return items
+
+
+def _load(path, size, flags):
+    image = cv2.imread(path, flags)
+    if image is None:
+        return None
+    # INTER_AREA averages when shrinking; masks keep their exact values with INTER_NEAREST
+    interpolation = cv2.INTER_NEAREST if flags == cv2.IMREAD_GRAYSCALE else cv2.INTER_AREA
+    image = cv2.resize(image, size, interpolation=interpolation)
+    if flags == cv2.IMREAD_COLOR:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return image
+
+
+def decode_item(args):
+    """Decodes and resizes one (image_path, mask_path, label) item; (None, None) if it is unreadable"""
+    (image_path, mask_path, label), size = args
+    image = _load(image_path, size, cv2.IMREAD_COLOR)
+    mask = _load(mask_path, size, cv2.IMREAD_GRAYSCALE) if mask_path else None
+    if image is None or (mask_path and mask is None):
+        return None, None
+    return image, mask
+
+
+def pack(items, out_dir, image_size=IMAGE_SIZE, shard_size=SHARD_SIZE, classes=None, workers=None):
+    """
+    Decodes `items` once and writes them into shards under `out_dir`.
+    Args:
+        items (list): (image_path, mask_path or None, label or None) tuples.
+        image_size (tuple): (width, height) every image is resized to.
+        shard_size (int): Images per shard file.
+        classes (list): Class names, for items with labels.
+        workers (int): Decoding processes (default: all CPUs).
+    Returns:
+        dict: The index written to index.json.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    width, height = image_size
+    with_masks = any(mask for _, mask, _ in items)
+    shards, labels, sources = [], [], []
+    images = masks = None
+    skipped = 0
+    started = time.time()
+
+    def finish_shard():
+        if images is not None:
+            images.flush()
+            if masks is not None:
+                masks.flush()
+            shards[-1]["count"] = filled
+
+    def open_shard(count):
+        number = len(shards)
+        shard = {"images": f"images-{number:05d}.npy", "count": count}
+        shard_images = np.lib.format.open_memmap(
+            os.path.join(out_dir, shard["images"]), mode="w+", dtype=np.uint8, shape=(count, height, width, 3))
+        shard_masks = None
+        if with_masks:
+            shard["masks"] = f"masks-{number:05d}.npy"
+            shard_masks = np.lib.format.open_memmap(
+                os.path.join(out_dir, shard["masks"]), mode="w+", dtype=np.uint8, shape=(count, height, width))
+        shards.append(shard)
+        return shard_images, shard_masks
+
+    filled = 0
+    with Pool(workers) as pool:
+        decoded = pool.imap(decode_item, ((item, image_size) for item in items), chunksize=16)
+        for position, ((image_path, mask_path, label), (image, mask)) in enumerate(zip(items, decoded)):
+            if image is None:
+                skipped += 1
+                print(f"Error decoding {image_path}")
+                continue
+            if images is None or filled == len(images):
+                finish_shard()
+                images, masks = open_shard(min(shard_size, len(items) - position))
+                filled = 0
+            images[filled] = image
+            if masks is not None:
+                masks[filled] = mask
+            filled += 1
+            labels.append(-1 if label is None else label)
+            sources.append(image_path)
+    finish_shard()
+    allocated = 0 if images is None else len(images)
+    del images, masks
+
+    # Unreadable images leave the last shard short; its header must match what was written
+    if shards and shards[-1]["count"] < allocated:
+        count = shards[-1]["count"]
+        for key in ("images", "masks"):
+            if key in shards[-1]:
+                path = os.path.join(out_dir, shards[-1][key])
+                data = np.array(np.load(path, mmap_mode="r")[:count])
+                np.save(path, data)
+
+    index = {
+        "image_shape": [height, width, 3],
+        "dtype": "uint8",
+        "count": len(sources),
+        "shards": shards,
+        "classes": classes or [],
+        "labels": "labels.npy" if classes else None,
+    }
+    if classes:
+        np.save(os.path.join(out_dir, "labels.npy"), np.asarray(labels, dtype=np.int32))
+    with open(os.path.join(out_dir, "sources.txt"), "w") as f:
+        f.writelines(source + "\n" for source in sources)
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+
+    elapsed = time.time() - started
+    print(f"Packed {len(sources)} images into {len(shards)} shards in {elapsed:.1f} s ({skipped} unreadable)")
+    return index
+
+
+class PackedDataset:
+    """
+    A packed dataset, memory-mapped read-only. `indices` restricts it to a
+    subset of the packed images (see split).
+    """
+
+    def __init__(self, path, indices=None):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.classes = self.index["classes"]
+        self.image_shape = tuple(self.index["image_shape"])
+        self._images = [np.load(os.path.join(path, shard["images"]), mmap_mode="r") for shard in self.index["shards"]]
+        self._masks = None
+        if self.index["shards"] and "masks" in self.index["shards"][0]:
+            self._masks = [np.load(os.path.join(path, shard["masks"]), mmap_mode="r") for shard in self.index["shards"]]
+        self.labels = None
+        if self.index["labels"]:
+            self.labels = np.load(os.path.join(path, self.index["labels"]), mmap_mode="r")
+        # Global position -> (shard, offset) through the first position of every shard
+        counts = [shard["count"] for shard in self.index["shards"]]
+        self._starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.indices = np.arange(self._starts[-1]) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def has_masks(self):
+        return self._masks is not None
+
+    def _locate(self, positions):
+        shards = np.searchsorted(self._starts, positions, side="right") - 1
+        return shards, positions - self._starts[shards]
+
+    def __getitem__(self, i):
+        """(image, label or mask) of the i-th image, as arrays in memory"""
+        shard, offset = (int(value[0]) for value in self._locate(self.indices[[i]]))
+        image = np.array(self._images[shard][offset])
+        if self._masks is not None:
+            return image, np.array(self._masks[shard][offset])
+        return image, (None if self.labels is None else int(self.labels[self.indices[i]]))
+
+    def gather(self, batch_indices, out=None):
+        """
+        Reads a batch of images by dataset index.
+        Args:
+            batch_indices (array): Indices into this dataset.
+            out (array): Optional (len(batch_indices), *image_shape) uint8 buffer to fill.
+        Returns:
+            tuple: (images, targets), targets being the masks or the int32 labels (None without either).
+        """
+        positions = self.indices[np.asarray(batch_indices)]
+        if out is None:
+            out = np.empty((len(positions),) + self.image_shape, dtype=np.uint8)
+        targets = None
+        if self._masks is not None:
+            targets = np.empty((len(positions),) + self.image_shape[:2], dtype=np.uint8)
+        shards, offsets = self._locate(positions)
+        # Read each shard in file order so the page cache sees mostly forward reads
+        order = np.lexsort((offsets, shards))
+        for shard in np.unique(shards):
+            rows = order[shards[order] == shard]
+            out[rows] = self._images[shard][offsets[rows]]
+            if targets is not None:
+                targets[rows] = self._masks[shard][offsets[rows]]
+        if targets is None and self.labels is not None:
+            targets = np.asarray(self.labels[positions], dtype=np.int32)
+        return out, targets
+
+    def batches(self, batch_size=32, shuffle=True, seed=None, drop_last=False):
+        """
+        Yields (images, targets) batches over the dataset, reshuffled on every call.
+        Args:
+            seed (int): Makes the shuffle order reproducible.
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for start in range(0, stop, batch_size):
+            yield self.gather(order[start:start + batch_size])
+
+    def split(self, validation_fraction=0.2, seed=0):
+        """(training, validation) datasets over a random partition of this one, sharing its memory maps"""
+        order = np.random.default_rng(seed).permutation(len(self))
+        validation_count = int(round(len(order) * validation_fraction))
+        return (
+            self.subset(np.sort(order[validation_count:])),
+            self.subset(np.sort(order[:validation_count])),
+        )
+
+    def subset(self, dataset_indices):
+        subset = object.__new__(PackedDataset)
+        subset.__dict__.update(self.__dict__)
+        subset.indices = self.indices[np.asarray(dataset_indices, dtype=np.int64)]
+        return subset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack a training set into memory-mapped uint8 shards.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images-dir", help="Directory with one subdirectory of images per class")
+    source.add_argument("--download-dir", help="Output directory of download_dataset.py")
+    parser.add_argument("--split", default="testing", help="CSV to pack from --download-dir (testing or verification)")
+    parser.add_argument("--out", required=True, help="Directory to write the shards and index to")
+    parser.add_argument("--size", type=int, nargs=2, default=list(IMAGE_SIZE), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Images per shard")
+    parser.add_argument("--workers", type=int, default=None, help="Decoding processes (default: all CPUs)")
+    args = parser.parse_args(argv)
+
+    if args.images_dir:
+        items, classes = class_folder_items(args.images_dir)
+    else:
+        items, classes = download_items(args.download_dir, args.split), None
+    if not items:
+        print("Nothing to pack")
+        return 1
+    pack(items, args.out, tuple(args.size), args.shard_size, classes, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
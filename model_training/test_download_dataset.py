@@ -0,0 +1,174 @@
+# Tests for download_dataset.py against a local http.server running in a thread.
+#
+# Usage:
+#   python -m pytest model_training/test_download_dataset.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from download_dataset import DownloadError, Downloader, load_manifest, read_pairs
+
+FILES = {
+    "/a.jpg": os.urandom(200_000),
+    "/b.png": os.urandom(50_000),
+}
+FILES["/a-copy.jpg"] = FILES["/a.jpg"]
+FILES["/flaky.jpg"] = os.urandom(10_000)
+FLAKY_FAILURES = 2
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] += 1
+            hits = server.hits[self.path]
+        server.ranges.append((self.path, self.headers.get("Range")))
+
+        if self.path == "/flaky.jpg" and hits <= FLAKY_FAILURES:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        requested = self.headers.get("Range")
+        if requested:
+            start = int(requested.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.lock = threading.Lock()
+    httpd.hits = Counter()
+    httpd.ranges = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    return Downloader(str(tmp_path / "data"), workers=4, retries=3, timeout=5.0, backoff=0.01)
+
+
+def test_read_pairs(tmp_path):
+    path = tmp_path / "testing.csv"
+    path.write_text("http://x/1.jpg,http://x/1.png\nhttp://x/2.jpg,\n")
+    assert read_pairs(str(path)) == [
+        ("testing", 0, "image", "http://x/1.jpg"),
+        ("testing", 0, "mask", "http://x/1.png"),
+        ("testing", 1, "image", "http://x/2.jpg"),
+    ]
+
+
+def test_download_stores_by_checksum(server, downloader):
+    entry = downloader.download(server.url + "/a.jpg")
+
+    digest = hashlib.sha256(FILES["/a.jpg"]).hexdigest()
+    assert entry["sha256"] == digest
+    assert entry["bytes"] == len(FILES["/a.jpg"])
+    assert entry["path"] == os.path.join("objects", digest[:2], digest)
+    with open(os.path.join(downloader.out_dir, entry["path"]), "rb") as f:
+        assert f.read() == FILES["/a.jpg"]
+
+    # Identical content from another URL lands on the same object
+    assert downloader.download(server.url + "/a-copy.jpg")["path"] == entry["path"]
+
+
+def test_retries_transient_failures(server, downloader):
+    entry = downloader.download(server.url + "/flaky.jpg")
+
+    assert server.hits["/flaky.jpg"] == FLAKY_FAILURES + 1
+    assert entry["sha256"] == hashlib.sha256(FILES["/flaky.jpg"]).hexdigest()
+
+
+def test_gives_up_after_retries(server, tmp_path):
+    downloader = Downloader(str(tmp_path / "data"), retries=1, backoff=0.01)
+    with pytest.raises(DownloadError):
+        downloader.download(server.url + "/flaky.jpg")
+    assert server.hits["/flaky.jpg"] == 2
+
+
+def test_not_found_is_permanent(server, downloader):
+    with pytest.raises(DownloadError, match="404"):
+        downloader.download(server.url + "/missing.jpg")
+    assert server.hits["/missing.jpg"] == 1
+
+
+def test_resumes_partial_file(server, downloader):
+    url = server.url + "/a.jpg"
+    body = FILES["/a.jpg"]
+    partial = os.path.join(downloader.partial_dir, hashlib.sha1(url.encode()).hexdigest() + ".part")
+    with open(partial, "wb") as f:
+        f.write(body[:70_000])
+
+    entry = downloader.download(url)
+
+    assert server.ranges == [("/a.jpg", "bytes=70000-")]
+    assert entry["sha256"] == hashlib.sha256(body).hexdigest()
+    assert not os.path.exists(partial)
+
+
+def test_rerun_skips_manifest_entries(server, downloader):
+    entries = [
+        ("testing", 0, "image", server.url + "/a.jpg"),
+        ("testing", 0, "mask", server.url + "/b.png"),
+        ("testing", 1, "image", server.url + "/missing.jpg"),
+    ]
+
+    first = downloader.run(entries)
+    assert (first["downloaded"], first["skipped"], first["failed"]) == (2, 0, 1)
+    manifest = load_manifest(downloader.manifest_path)
+    assert set(manifest) == {server.url + "/a.jpg", server.url + "/b.png"}
+    assert manifest[server.url + "/b.png"]["kind"] == "mask"
+
+    hits = dict(server.hits)
+    second = downloader.run(entries)
+    assert (second["downloaded"], second["skipped"], second["failed"]) == (0, 2, 1)
+    assert server.hits["/a.jpg"] == hits["/a.jpg"]
+    assert server.hits["/b.png"] == hits["/b.png"]
+
+
+def test_rerun_fetches_entries_whose_object_is_gone(server, downloader):
+    entries = [("testing", 0, "image", server.url + "/b.png")]
+    downloader.run(entries)
+    entry = load_manifest(downloader.manifest_path)[server.url + "/b.png"]
+    os.remove(os.path.join(downloader.out_dir, entry["path"]))
+
+    result = downloader.run(entries)
+
+    assert result["downloaded"] == 1
+    assert server.hits["/b.png"] == 2
+
+
+def test_manifest_ignores_torn_last_line(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text(json.dumps({"url": "http://x/1.jpg", "path": "p"}) + "\n{\"url\": \"http://x/2")
+    assert list(load_manifest(str(path))) == ["http://x/1.jpg"]